@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+bench_autoplay.py
+Benchmarks of the end-to-end autoplay step loop, with stub environment,
+decoder and RL agents so that it runs offline without ROMs or model weights.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import contextlib
+import numpy as np
+
+from bench_planner import fname_domain, fname_problem
+
+
+episode_horizon = 200
+steps_per_subgoal = 10
+num_envs = 4
+
+
+class StubActionSpace(object):
+  """
+  Action space of the stub environment.
+  """
+
+  def __init__(self, n):
+    super(StubActionSpace, self).__init__()
+
+    self.n = n
+
+
+class StubEnv(object):
+  """
+  Environment producing Atari sized frames with a sprite moving every step, 
+  and the step counter encoded as the gray level of the top band.
+  """
+
+  def __init__(self, horizon=episode_horizon):
+    super(StubEnv, self).__init__()
+
+    self.horizon = horizon
+    self.action_space = StubActionSpace(18)
+    self.background = np.zeros((210, 160, 3), dtype=np.uint8)
+    self.background[180:190, :] = (72, 72, 200)
+    self.t = 0
+
+
+  def frame(self):
+    frame = self.background.copy()
+    frame[:20, :] = min(self.t, 255)
+    y = 20 + self.t % 150
+    frame[y:y+20, 40:48] = (200, 72, 72)
+    return frame
+
+
+  def reset(self):
+    self.t = 0
+    return self.frame()
+
+
+  def step(self, a):
+    self.t += 1
+    return (self.frame(), 0.0, self.t >= self.horizon, {})
+
+
+  def render(self):
+    pass
+
+
+  def close(self):
+    pass
+
+
+class StubDecoder(object):
+  """
+  Decoder walking along a plan, reaching its next state every
+  `steps_per_subgoal` steps, as read from the top band of the frames.
+  """
+
+  def __init__(self, plan, static_predicate_operators):
+    super(StubDecoder, self).__init__()
+
+    self.states = [
+      [','.join(p) for p in s if p[0] not in static_predicate_operators]
+      for op, s in plan]
+
+
+  def decode_state(self, s_dec):
+    return self.decode_states(s_dec)[0]
+
+
+  def decode_states(self, s_dec_batch):
+    decoded = []
+    for i in range(len(s_dec_batch)):
+      t = int(round(float(s_dec_batch[i, 0, 2, 40])))
+      decoded.append(self.states[min(t // steps_per_subgoal, len(self.states) - 1)])
+    return decoded
+
+
+class StubAgents(object):
+  """
+  RL agents pool taking random actions and ignoring the feedback.
+  """
+
+  def __init__(self, n, seed=0):
+    super(StubAgents, self).__init__()
+
+    self.n = n
+    self.rng = np.random.RandomState(seed)
+
+
+  def execute(self, agent_name, s_rl):
+    return self.rng.randint(self.n)
+
+
+  def feedback(self, agent_name, transition):
+    pass
+
+
+def make_agent(env, decode_cache_size):
+  """
+  Construct an AutoAgent with the stub environment, decoder and RL agents.
+
+  @param env The stub environment.
+  @param decode_cache_size The size of the decode cache.
+  @return The AutoAgent.
+  """
+
+  from launch_autoplay import AutoAgent
+  from utils.EventLog import EventLogger
+
+  # note: the events are discarded by a logger without sinks.
+  agent = AutoAgent(env, None, fname_domain, fname_problem,
+                    decode_cache_size=decode_cache_size,
+                    agents=StubAgents(env.action_space.n),
+                    logger=EventLogger([]))
+
+  # note: the stub decoder walks along the initial plan of the agent.
+  agent.decoder = StubDecoder(agent.planner.find_plan(), agent.static_predicate_operators)
+
+  return agent
+
+
+@contextlib.contextmanager
+def quiet():
+  with open(os.devnull, 'w') as devnull:
+    with contextlib.redirect_stdout(devnull):
+      yield
+
+
+def bench_episode():
+  """
+  Play one episode of `steps_per_subgoal` steps per plan step.
+  """
+
+  targets = []
+  for decode_cache_size in [0, 4096]:
+    agent = make_agent(StubEnv(), decode_cache_size)
+
+    def fn(agent=agent):
+      with quiet():
+        agent.autoplay(max_episodes=1, ss_errtol=steps_per_subgoal)
+
+    targets.append(('decode_cache=%d' % (decode_cache_size), fn))
+
+  return targets
+
+
+def bench_episode_vectorized():
+  """
+  Play `num_envs` episodes in lockstep in serial environments.
+  """
+
+  from utils.VecEnv import SerialVecEnv
+
+  venv = SerialVecEnv([StubEnv() for i in range(num_envs)])
+  agent = make_agent(venv.envs[0], 0)
+
+  def fn():
+    with quiet():
+      agent.autoplayVectorized(venv, max_episodes=num_envs, ss_errtol=steps_per_subgoal)
+
+  return fn
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+bench_planner.py
+Benchmarks of the PDDL planner on the room 1 problem and on synthetic
+multi-room problems.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import atexit
+import shutil
+import tempfile
+
+from PDDL import PDDLPlanner
+
+
+pddl_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDDL')
+fname_domain = os.path.join(pddl_dir, 'domain.pddl')
+fname_problem = os.path.join(pddl_dir, 'problem_room1.pddl')
+
+synthetic_room_counts = [2, 4, 8]
+strategies = ['bfs', 'astar', 'gbfs', 'table']
+
+# temporary directory of the generated problems and grounded task caches
+tmp_dir = tempfile.mkdtemp(prefix='bench_planner_')
+atexit.register(shutil.rmtree, tmp_dir, True)
+
+
+def synthetic_problem(n_rooms):
+  """
+  Generate a synthetic problem chaining copies of room 1, where the actor has
+  to grab the key of each room to open its exit door towards the next room.
+
+  @param n_rooms The number of rooms.
+  @return The problem definition in PDDL.
+  """
+
+  init = []
+  for k in range(1, n_rooms + 1):
+    room = 'room_%d' % (k)
+    init += [
+      '(doorPathExistsInRoom %s entrance_1 door_1 ladder_1)' % (room),
+      '(doorPathExistsInRoom %s ladder_1 door_1 entrance_1)' % (room),
+      '(doorPathExistsInRoom %s ladder_1 door_2 entrance_2)' % (room),
+      '(doorPathExistsInRoom %s entrance_2 door_2 ladder_1)' % (room),
+      '(pathExistsInRoom %s ladder_1 conveyor_1)' % (room),
+      '(pathExistsInRoom %s ladder_1 chain_1)' % (room),
+      '(pathExistsInRoom %s chain_1 conveyor_1)' % (room),
+      '(pathExistsInRoom %s chain_1 ladder_3)' % (room),
+      '(pathExistsInRoom %s ladder_2 ladder_3)' % (room),
+      '(pathExistsInRoom %s conveyor_1 ladder_1)' % (room),
+      '(pathExistsInRoom %s conveyor_1 chain_1)' % (room),
+      '(pathExistsInRoom %s ladder_3 chain_1)' % (room),
+      '(pathExistsInRoom %s ladder_3 ladder_2)' % (room),
+      '(keyReachable %s ladder_2 key_%d)' % (room, k),
+      '(keyExists %s key_%d)' % (room, k),
+      '(doorExists %s door_2)' % (room),
+      '(monsterExists %s skull_%d)' % (room, k)
+    ]
+    if k < n_rooms:
+      init += [
+        '(pathExistsAcrossRooms %s entrance_2 room_%d entrance_1)' % (room, k + 1),
+        '(pathExistsAcrossRooms room_%d entrance_1 %s entrance_2)' % (k + 1, room)
+      ]
+  init += ['(actorOnSpot room_1 ladder_1)']
+
+  rooms = ' '.join('room_%d' % (k) for k in range(1, n_rooms + 1))
+  keys = ' '.join('key_%d' % (k) for k in range(1, n_rooms + 1))
+  skulls = ' '.join('skull_%d' % (k) for k in range(1, n_rooms + 1))
+
+  return '\n'.join([
+    '(define (problem ProblemMontezumaRevengeSynthetic%d)' % (n_rooms),
+    '  (:domain MontezumaRevenge)',
+    '  (:objects',
+    '    %s - room' % (rooms),
+    '    entrance_1 entrance_2 ladder_1 ladder_2 ladder_3 conveyor_1 chain_1 - spot',
+    '    door_1 door_2 - door',
+    '    %s - key' % (keys),
+    '    %s - monster' % (skulls),
+    '  )',
+    '  (:init',
+    '\n'.join('    ' + p for p in init),
+    '  )',
+    '  (:goal (and (actorOnSpot room_%d entrance_2)))' % (n_rooms),
+    ')',
+    ''
+  ])
+
+
+def write_synthetic_problem(n_rooms):
+  """
+  Write a synthetic problem to the temporary directory.
+
+  @param n_rooms The number of rooms.
+  @return The file name of the problem.
+  """
+
+  fname = os.path.join(tmp_dir, 'problem_synthetic%d.pddl' % (n_rooms))
+  with open(fname, 'w') as f:
+    f.write(synthetic_problem(n_rooms))
+
+  return fname
+
+
+def reachable_states(planner):
+  """
+  Enumerate the states reachable from the initial state.
+
+  @param planner The planner.
+  @return A list of the reachable states as bitsets.
+  """
+
+  planner.build_goal_distance_table()
+  g = planner.encode_state(planner.predefined_goals)
+
+  return sorted(planner.goal_distance_tables[g].keys())
+
+
+def bench_init_ground():
+  return lambda: PDDLPlanner(fname_domain, fname_problem)
+
+
+def bench_init_cached():
+  cache_dir = os.path.join(tmp_dir, 'cache')
+  PDDLPlanner(fname_domain, fname_problem, cache_dir=cache_dir)
+
+  return lambda: PDDLPlanner(fname_domain, fname_problem, cache_dir=cache_dir)
+
+
+def bench_find_plan_all_states():
+  """
+  Plan from every reachable state of room 1 with the plan and heuristic 
+  caches disabled.
+  """
+
+  targets = []
+  for strategy in strategies:
+    planner = PDDLPlanner(fname_domain, fname_problem, plan_cache_size=0, 
+                          heuristic_cache_size=0)
+    states = reachable_states(planner)
+
+    def fn(planner=planner, states=states, strategy=strategy):
+      for s in states:
+        planner.find_plan(initial_state=s, strategy=strategy, encoded=True)
+
+    targets.append((strategy, fn))
+
+  return targets
+
+
+def bench_find_plan_all_states_cached():
+  """
+  Plan from every reachable state of room 1 with a warm plan cache.
+  """
+
+  planner = PDDLPlanner(fname_domain, fname_problem)
+  states = reachable_states(planner)
+  for s in states:
+    planner.find_plan(initial_state=s, encoded=True)
+
+  def fn():
+    for s in states:
+      planner.find_plan(initial_state=s, encoded=True)
+
+  return fn
+
+
+def bench_find_plan_all_states_heuristic_cached():
+  """
+  Plan from every reachable state of room 1 with the plan cache disabled and 
+  a warm heuristic cache.
+  """
+
+  targets = []
+  for strategy in ['astar', 'gbfs']:
+    planner = PDDLPlanner(fname_domain, fname_problem, plan_cache_size=0)
+    states = reachable_states(planner)
+
+    def fn(planner=planner, states=states, strategy=strategy):
+      for s in states:
+        planner.find_plan(initial_state=s, strategy=strategy, encoded=True)
+
+    fn()
+    targets.append((strategy, fn))
+
+  return targets
+
+
+def bench_synthetic_init():
+  targets = []
+  for n_rooms in synthetic_room_counts:
+    fname = write_synthetic_problem(n_rooms)
+    targets.append(('rooms=%d' % (n_rooms), lambda fname=fname: PDDLPlanner(fname_domain, fname)))
+
+  return targets
+
+
+def bench_synthetic_find_plan():
+  """
+  Plan from the initial state of the synthetic problems with the plan and
+  heuristic caches disabled.
+  """
+
+  targets = []
+  for n_rooms in synthetic_room_counts:
+    planner = PDDLPlanner(fname_domain, write_synthetic_problem(n_rooms), 
+                          plan_cache_size=0, heuristic_cache_size=0)
+    for strategy in ['bfs', 'gbfs']:
+      assert(planner.find_plan(strategy=strategy) is not None)
+      fn = lambda planner=planner, strategy=strategy: planner.find_plan(strategy=strategy, encoded=True)
+      targets.append(('rooms=%d,%s' % (n_rooms, strategy), fn))
+
+  return targets
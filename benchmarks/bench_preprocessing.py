@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+bench_preprocessing.py
+Benchmarks of the frame preprocessing shared by the decoder and the RL agent.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import numpy as np
+
+from utils import LogicRLUtils as Util
+from compare_interpolation import load_frames
+
+
+frame_dir = os.path.join(
+  os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+  'annotated_data', 'symbolic_states_room1')
+
+num_frames = 64
+batch_size = 8
+
+
+def synthetic_frames(n, seed=0):
+  """
+  Generate raw frames resembling Atari frames, with a static background and a
+  few moving sprites.
+
+  @param n The number of frames.
+  @param seed The random seed.
+  @return The raw frames as a list of `210x160x3` arrays of `uint8`.
+  """
+
+  rng = np.random.RandomState(seed)
+  background = np.zeros((210, 160, 3), dtype=np.uint8)
+  for i in range(24):
+    y, x = rng.randint(0, 200), rng.randint(0, 150)
+    background[y:y+rng.randint(2, 10), x:x+rng.randint(4, 40)] = rng.randint(0, 256, 3)
+
+  frames = []
+  for t in range(n):
+    frame = background.copy()
+    for k in range(3):
+      y, x = (37 * k + 3 * t) % 190, (53 * k + 2 * t) % 140
+      frame[y:y+20, x:x+8] = (200, 72, 72)
+    frames.append(frame)
+
+  return frames
+
+
+def recorded_frames():
+  """
+  Load the recorded frames of the annotated data if available, and generate
+  synthetic frames otherwise.
+
+  @return The raw frames as a list.
+  """
+
+  frames = load_frames(frame_dir, num_frames) if os.path.isdir(frame_dir) else []
+  if len(frames) == 0:
+    frames = synthetic_frames(num_frames)
+
+  return frames
+
+
+def bench_preprocess_frame():
+  frames = recorded_frames()
+  targets = []
+  for name in sorted(Util.frame_interpolations.keys()):
+    interpolation = Util.frame_interpolations[name]
+    fn = lambda interpolation=interpolation: [Util.PreprocessFrame(frame, interpolation) for frame in frames]
+    targets.append((name, fn))
+
+  return targets
+
+
+def bench_frame_to_decoder_state():
+  frames = recorded_frames()
+
+  return lambda: [Util.FrameToDecoderState(frame) for frame in frames]
+
+
+def bench_frames_to_decoder_states():
+  frames = recorded_frames()
+  batches = [frames[i:i+batch_size] for i in range(0, len(frames), batch_size)]
+
+  return lambda: [Util.FramesToDecoderStates(batch) for batch in batches]
+
+
+def bench_frames_to_rl_state():
+  frames = recorded_frames()
+  joint = Util.rl_state_joint
+  windows = [frames[i:i+joint] for i in range(len(frames) - joint + 1)]
+
+  return lambda: [Util.FramesToRLState(window) for window in windows]
+
+
+def bench_rl_frame_stack():
+  images = [Util.PreprocessFrame(frame) for frame in recorded_frames()]
+  stack = Util.RLFrameStack()
+  stack.resetImage(images[0])
+
+  def fn():
+    for image in images:
+      stack.appendImage(image)
+      stack.state()
+
+  return fn
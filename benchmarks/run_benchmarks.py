@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+run_benchmarks.py
+Run the benchmarks of the planner, the frame preprocessing and the autoplay
+loop, and emit the results as JSON to track regressions across commits.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import traceback
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_planner
+import bench_preprocessing
+import bench_autoplay
+
+
+benchmark_modules = [bench_planner, bench_preprocessing, bench_autoplay]
+
+
+def collect_benchmarks(name_filter=None):
+  """
+  Collect the benchmarks, which are the functions named `bench_*` of the
+  benchmark modules.
+
+  @param name_filter A substring the benchmark names shall contain, or `None`
+                     to collect all the benchmarks.
+  @return A list of `(name, function)` tuples.
+  """
+
+  benchmarks = []
+  for module in benchmark_modules:
+    prefix = module.__name__[len('bench_'):]
+    for attr in sorted(dir(module)):
+      if not attr.startswith('bench_'):
+        continue
+      name = '%s.%s' % (prefix, attr[len('bench_'):])
+      if name_filter is not None and name_filter not in name:
+        continue
+      benchmarks.append((name, getattr(module, attr)))
+
+  return benchmarks
+
+
+def time_function(fn, repeat=5, min_time=0.2):
+  """
+  Time a function. The number of calls per repeat is calibrated so that each
+  repeat takes at least `min_time` seconds.
+
+  @param fn The function to time, taking no arguments.
+  @param repeat The number of repeats.
+  @param min_time The minimum time of a repeat in seconds.
+  @return A dictionary of the timing statistics in seconds per call.
+  """
+
+  # calibrate the number of calls per repeat
+  number = 1
+  while True:
+    t_start = time.perf_counter()
+    for i in range(number):
+      fn()
+    t_elapsed = time.perf_counter() - t_start
+    if t_elapsed >= min_time or number >= 1e6:
+      break
+    number *= 10 if t_elapsed < min_time / 10 else 2
+
+  times = []
+  for r in range(repeat):
+    t_start = time.perf_counter()
+    for i in range(number):
+      fn()
+    times.append((time.perf_counter() - t_start) / number)
+
+  times.sort()
+  mean = sum(times) / len(times)
+
+  return {
+    'unit': 's',
+    'min': times[0],
+    'median': times[len(times) // 2],
+    'mean': mean,
+    'stdev': (sum((t - mean) ** 2 for t in times) / len(times)) ** 0.5,
+    'repeat': repeat,
+    'number': number
+  }
+
+
+def run_benchmarks(benchmarks, repeat=5, min_time=0.2, verbose=True):
+  """
+  Run the benchmarks.
+
+  Each benchmark function performs its setup and returns either a function to
+  time, or a list of `(suffix, function)` tuples for parameterized variants.
+  A benchmark whose setup fails, e.g. due to a missing optional dependency, is
+  recorded as skipped.
+
+  @param benchmarks The list of `(name, function)` tuples.
+  @param repeat The number of repeats.
+  @param min_time The minimum time of a repeat in seconds.
+  @param verbose The switch to print the results.
+  @return A dictionary mapping the benchmark names to their results.
+  """
+
+  results = dict()
+  for name, bench in benchmarks:
+    try:
+      targets = bench()
+    except Exception as e:
+      results[name] = {'skipped': '%s: %s' % (type(e).__name__, e)}
+      if verbose:
+        print('[ WARN ] %-48s skipped (%s)' % (name, results[name]['skipped']))
+      continue
+
+    if callable(targets):
+      targets = [(None, targets)]
+
+    for suffix, fn in targets:
+      name_full = name if suffix is None else '%s[%s]' % (name, suffix)
+      try:
+        results[name_full] = time_function(fn, repeat=repeat, min_time=min_time)
+      except Exception as e:
+        traceback.print_exc()
+        results[name_full] = {'failed': '%s: %s' % (type(e).__name__, e)}
+        continue
+      if verbose:
+        print('[ INFO ] %-48s %12.3f us' % (name_full, results[name_full]['median'] * 1e6))
+
+  return results
+
+
+def git_commit():
+  """
+  Look up the current git commit of the repository.
+
+  @return The commit hash, or `None` if unavailable.
+  """
+
+  try:
+    return subprocess.check_output(
+      ['git', 'rev-parse', 'HEAD'], cwd=root_dir, stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare_results(results, fname_baseline):
+  """
+  Print the ratios of the median times against a baseline.
+
+  @param results The benchmark results.
+  @param fname_baseline The JSON file of the baseline results.
+  """
+
+  with open(fname_baseline, 'r') as f:
+    baseline = json.load(f)['benchmarks']
+
+  print('')
+  print('comparison against %s:' % (fname_baseline))
+  for name in sorted(results.keys()):
+    if 'median' not in results[name] or 'median' not in baseline.get(name, {}):
+      continue
+    ratio = results[name]['median'] / baseline[name]['median']
+    print('  %-48s x%.3f' % (name, ratio))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run the benchmarks.')
+
+    parser.add_argument('--output', dest='output',
+                        type=str, default=None,
+                        help="JSON file to write the results to.")
+    parser.add_argument('--compare', dest='compare',
+                        type=str, default=None,
+                        help="JSON file of baseline results to compare against.")
+    parser.add_argument('--filter', dest='filter',
+                        type=str, default=None,
+                        help="Substring the benchmark names shall contain.")
+    parser.add_argument('--repeat', dest='repeat',
+                        type=int, default=5,
+                        help="Number of repeats of each benchmark.")
+    parser.add_argument('--min_time', dest='min_time',
+                        type=float, default=0.2,
+                        help="Minimum time of each repeat in seconds.")
+
+    return parser.parse_args()
+
+
+def main():
+  args = parse_arguments()
+
+  benchmarks = collect_benchmarks(args.filter)
+  results = run_benchmarks(benchmarks, repeat=args.repeat, min_time=args.min_time)
+
+  report = {
+    'commit': git_commit(),
+    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'benchmarks': results
+  }
+
+  if args.output is not None:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+    print('[ INFO ] results written to %s' % (args.output))
+
+  if args.compare is not None:
+    compare_results(results, args.compare)
+
+
+if __name__ == '__main__':
+  main()
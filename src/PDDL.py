@@ -13,38 +13,54 @@ __website__     = "http://www.davidqiu.com/"
 __copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
 
 
-import pddlpy
+import os
+import sys
+import hashlib
+import zipfile
+import heapq
+import bisect
+import numpy as np
 from collections import deque
+from utils.LRUCache import LRUCache
 
 import pdb, IPython
 
 
-def show_ground_operators(domprob, operator):
-  grounded_operator = list(domprob.ground_operator(operator))
+grounded_task_cache_version = 1
+
+# arrays of a grounded task cache file, see `PDDLPlanner._SaveGroundedTask`
+grounded_task_cache_keys = [
+  'predicates', 'initial_state', 'goals', 'operators', 'operator_names', 
+  'operator_args', 'operator_masks'
+]
+
+
+def show_ground_operators(planner, operator):
+  grounded_operator = planner.grounded_operators_dict[operator]
   for op in grounded_operator:
-    print(op.operator_name)
-    print(' - variable_list: %s' % (op.variable_list))
-    print(' - precondition_pos: %s' % (op.precondition_pos))
-    print(' - precondition_neg: %s' % (op.precondition_neg))
-    print(' - effect_pos: %s' % (op.effect_pos))
-    print(' - effect_neg: %s' % (op.effect_neg))
+    print(op.name)
+    print(' - args: %s' % (str(op.args)))
+    print(' - precondition_pos: %s' % (set(planner.decode_state(op.pre_pos))))
+    print(' - precondition_neg: %s' % (set(planner.decode_state(op.pre_neg))))
+    print(' - effect_pos: %s' % (set(planner.decode_state(op.eff_pos))))
+    print(' - effect_neg: %s' % (set(planner.decode_state(op.eff_neg))))
     print('')
 
 
-def show_domprob_summary(domprob):
-  lst_initstates = list(domprob.initialstate())
+def show_domprob_summary(planner):
+  lst_initstates = list(planner.predefined_initial_state)
   print('initial states: %d' % (len(lst_initstates)))
   for i in range(len(lst_initstates)):
     print('  - %s' % (str(lst_initstates[i])))
   print('')
 
-  lst_operators = list(domprob.operators())
+  lst_operators = list(planner.operators)
   print('operators: %d' % len(lst_operators))
   for i in range(len(lst_operators)):
     print('  - %s' % (str(lst_operators[i])))
   print('')
 
-  lst_goals = list(domprob.goals())
+  lst_goals = list(planner.predefined_goals)
   print('goals: %d' % (len(lst_goals)))
   for i in range(len(lst_goals)):
     print('  - %s' % (str(lst_goals[i])))
@@ -63,8 +79,8 @@ def show_plan(plan):
   print('plan:')
   for i_step_prev in range(len(plan) - 1):
     i_step = i_step_prev + 1
-    opstr, state = plan[i_step]
-    print(opstr)
+    op, state = plan[i_step]
+    print(op)
   print('')
   
   print('goal_state:')
@@ -79,39 +95,1011 @@ def show_plan(plan):
   print('')
 
 
+def parse_pddl_file(fname):
+  """
+  Parse a PDDL file into nested lists of tokens.
+
+  @param fname The PDDL file name.
+  @return The top-level expression as nested lists of string tokens.
+  """
+
+  with open(fname, 'r') as f:
+    text = f.read()
+
+  # strip comments and tokenize
+  tokens = []
+  for line in text.splitlines():
+    line = line.split(';', 1)[0]
+    tokens.extend(line.replace('(', ' ( ').replace(')', ' ) ').split())
+
+  # construct nested lists
+  stack = [[]]
+  for token in tokens:
+    if token == '(':
+      stack.append([])
+    elif token == ')':
+      if len(stack) < 2:
+        raise ValueError('unbalanced parentheses in PDDL file: %s' % (fname))
+      expr = stack.pop()
+      stack[-1].append(expr)
+    else:
+      stack[-1].append(token)
+
+  if len(stack) != 1 or len(stack[0]) != 1:
+    raise ValueError('malformed PDDL file: %s' % (fname))
+
+  return stack[0][0]
+
+
+def _parse_typed_list(tokens):
+  """
+  (internal)
+  Parse a typed list such as `?a ?b - type1 ?c - type2`.
+
+  @param tokens The list of string tokens.
+  @return A list of `(name, type)` tuples in order of declaration. Names 
+          without a declared type are of type `object`.
+  """
+
+  typed = []
+  pending = []
+  i = 0
+  while i < len(tokens):
+    if tokens[i] == '-':
+      if i + 1 >= len(tokens) or not isinstance(tokens[i + 1], str):
+        raise ValueError('unsupported type declaration: %s' % (tokens))
+      typed.extend((name, tokens[i + 1]) for name in pending)
+      pending = []
+      i += 2
+    else:
+      pending.append(tokens[i])
+      i += 1
+  typed.extend((name, 'object') for name in pending)
+
+  return typed
+
+
+def _parse_literals(expr):
+  """
+  (internal)
+  Parse a conjunction of literals.
+
+  @param expr The expression of a literal or a conjunction of literals.
+  @return A tuple `(pos, neg)` of lists of positive and negative atoms, each 
+          of which is a tuple of the predicate name followed by its arguments.
+  """
+
+  pos = []
+  neg = []
+
+  if len(expr) == 0:
+    return (pos, neg)
+
+  if expr[0] == 'and':
+    literals = expr[1:]
+  else:
+    literals = [expr]
+
+  for literal in literals:
+    if len(literal) == 0 or not isinstance(literal[0], str):
+      raise ValueError('unsupported literal: %s' % (literal))
+    if literal[0] == 'not':
+      atom = literal[1]
+      if len(literal) != 2 or any(not isinstance(t, str) for t in atom):
+        raise ValueError('unsupported literal: %s' % (literal))
+      neg.append(tuple(atom))
+    elif any(not isinstance(t, str) for t in literal) or \
+         literal[0] in ('or', 'imply', 'forall', 'exists', 'when'):
+      raise ValueError('unsupported literal: %s' % (literal))
+    else:
+      pos.append(tuple(literal))
+
+  return (pos, neg)
+
+
+class PDDLDomain(object):
+  """
+  PDDL domain definition, restricted to typed STRIPS with negative 
+  preconditions.
+  """
+
+  def __init__(self, fname):
+    """
+    Initialize a PDDL domain definition from a file.
+
+    @param fname The domain file name.
+    """
+
+    super(PDDLDomain, self).__init__()
+
+    expr = parse_pddl_file(fname)
+    if len(expr) < 2 or expr[0] != 'define':
+      raise ValueError('not a PDDL definition: %s' % (fname))
+
+    self.name = None
+    self.supertypes = dict() # type -> parent type
+    self.constants = [] # [ (name, type), ... ]
+    self.actions = [] # [ (name, parameters, pre_pos, pre_neg, eff_pos, eff_neg), ... ]
+
+    for section in expr[1:]:
+      if section[0] == 'domain':
+        self.name = section[1]
+      elif section[0] == ':types':
+        for name, parent in _parse_typed_list(section[1:]):
+          self.supertypes[name] = parent
+      elif section[0] == ':constants':
+        self.constants = _parse_typed_list(section[1:])
+      elif section[0] == ':action':
+        self.actions.append(PDDLDomain._ParseAction(section))
+
+  def _ParseAction(section):
+    """
+    (internal, static)
+    Parse an action definition.
+
+    @param section The action section expression.
+    @return A tuple `(name, parameters, pre_pos, pre_neg, eff_pos, eff_neg)`, 
+            where `parameters` is a list of `(variable, type)` tuples and the 
+            rest are lists of lifted atoms.
+    """
+
+    name = section[1]
+    fields = dict()
+    for i in range(2, len(section) - 1, 2):
+      fields[section[i]] = section[i + 1]
+
+    parameters = _parse_typed_list(fields.get(':parameters', []))
+    pre_pos, pre_neg = _parse_literals(fields.get(':precondition', []))
+    eff_pos, eff_neg = _parse_literals(fields.get(':effect', []))
+
+    return (name, parameters, pre_pos, pre_neg, eff_pos, eff_neg)
+
+  def is_subtype(self, t, t_super):
+    """
+    Check if a type is a subtype of another type.
+
+    @param t The type.
+    @param t_super The potential supertype.
+    @return A boolean indicating if `t` is `t_super` or one of its subtypes.
+    """
+
+    visited = set()
+    while t is not None and t not in visited:
+      if t == t_super or t_super == 'object':
+        return True
+      visited.add(t)
+      t = self.supertypes.get(t)
+
+    return False
+
+
+class PDDLProblem(object):
+  """
+  PDDL problem definition.
+  """
+
+  def __init__(self, fname):
+    """
+    Initialize a PDDL problem definition from a file.
+
+    @param fname The problem file name.
+    """
+
+    super(PDDLProblem, self).__init__()
+
+    expr = parse_pddl_file(fname)
+    if len(expr) < 2 or expr[0] != 'define':
+      raise ValueError('not a PDDL definition: %s' % (fname))
+
+    self.name = None
+    self.domain_name = None
+    self.objects = [] # [ (name, type), ... ]
+    self.initial_state = frozenset()
+    self.goals = frozenset()
+
+    for section in expr[1:]:
+      if section[0] == 'problem':
+        self.name = section[1]
+      elif section[0] == ':domain':
+        self.domain_name = section[1]
+      elif section[0] == ':objects':
+        self.objects = _parse_typed_list(section[1:])
+      elif section[0] == ':init':
+        self.initial_state = frozenset(tuple(a) for a in section[1:])
+      elif section[0] == ':goal':
+        pos, neg = _parse_literals(section[1])
+        if len(neg) > 0:
+          raise ValueError('negative goals are not supported: %s' % (neg))
+        self.goals = frozenset(pos)
+
+
+def _split_names(s):
+  """
+  (internal)
+  Split a comma-separated string of names.
+
+  @param s The comma-separated string.
+  @return A tuple of the names, which is empty for an empty string.
+  """
+
+  return tuple(s.split(',')) if len(s) > 0 else ()
+
+
+def _bind_atom(atom, binding):
+  """
+  (internal)
+  Substitute the bound variables of a lifted atom.
+
+  @param atom The lifted atom as a tuple.
+  @param binding The dictionary mapping variables to object names.
+  @return The atom with the bound variables substituted.
+  """
+
+  return tuple([atom[0]] + [binding.get(t, t) for t in atom[1:]])
+
+
+def ground_operators(domain, problem):
+  """
+  Ground the actions of a domain over the objects of a problem.
+
+  Static predicates, which no action changes, are fixed by the initial state, 
+  so parameters are bound in declaration order and a partial binding is 
+  pruned as soon as one of its fully bound static preconditions does not 
+  hold. Candidate objects of a parameter are drawn from the static facts 
+  whenever a positive static precondition constrains it, and from the typed 
+  objects otherwise. Actions requiring a predicate that is neither initially 
+  true nor added by any action are dropped.
+
+  @param domain The domain definition.
+  @param problem The problem definition.
+  @return A list of grounded operator tuples, each of which is defined as 
+          `(name, args, pre_pos, pre_neg, eff_pos, eff_neg)`, where `args` is 
+          a tuple of object names and the rest are sets of predicate tuples.
+  """
+
+  objects = list(domain.constants) + list(problem.objects)
+
+  # determine fluent and reachable predicates
+  fluents = set()
+  reachable = set(a[0] for a in problem.initial_state)
+  for action in domain.actions:
+    fluents.update(a[0] for a in action[4])
+    fluents.update(a[0] for a in action[5])
+    reachable.update(a[0] for a in action[4])
+
+  # index static facts by predicate name
+  static_facts = set()
+  static_facts_dict = dict()
+  for a in problem.initial_state:
+    if a[0] not in fluents:
+      static_facts.add(a)
+      static_facts_dict.setdefault(a[0], []).append(a)
+
+  grounded = []
+  for name, parameters, pre_pos, pre_neg, eff_pos, eff_neg in domain.actions:
+    if any(a[0] not in reachable for a in pre_pos):
+      continue
+
+    variables = [v for v, t in parameters]
+    candidates = []
+    for v, t in parameters:
+      candidates.append(set(o for o, ot in objects if domain.is_subtype(ot, t)))
+
+    # schedule each static precondition to be checked once its last parameter 
+    # is bound, and draw the candidates of a parameter from the first positive 
+    # static precondition mentioning it
+    feasible = True
+    checks = [[] for v in variables]
+    generators = [None for v in variables]
+    literals = [(a, True) for a in pre_pos] + [(a, False) for a in pre_neg]
+    for atom, positive in literals:
+      if atom[0] in fluents:
+        continue
+      positions = [variables.index(t) for t in atom[1:] if t in variables]
+      if len(positions) == 0:
+        feasible = feasible and ((atom in static_facts) == positive)
+        continue
+      checks[max(positions)].append((atom, positive))
+      if positive:
+        for i in positions:
+          if generators[i] is None:
+            generators[i] = atom
+
+    if not feasible:
+      continue
+
+    # bind parameters by depth-first search
+    stack = [(0, dict())]
+    while len(stack) > 0:
+      depth, binding = stack.pop()
+      if depth == len(variables):
+        grounded.append((
+          name, 
+          tuple(binding[v] for v in variables),
+          set(_bind_atom(a, binding) for a in pre_pos),
+          set(_bind_atom(a, binding) for a in pre_neg),
+          set(_bind_atom(a, binding) for a in eff_pos),
+          set(_bind_atom(a, binding) for a in eff_neg)))
+        continue
+
+      v = variables[depth]
+      objs = candidates[depth]
+      if generators[depth] is not None:
+        atom = _bind_atom(generators[depth], binding)
+        k_var = atom.index(v)
+        objs = objs.intersection(
+          fact[k_var] for fact in static_facts_dict.get(atom[0], []) 
+          if len(fact) == len(atom) and 
+             all(atom[k] in variables or fact[k] == atom[k] 
+                 for k in range(1, len(atom))))
+
+      for o in sorted(objs, reverse=True):
+        binding_next = dict(binding)
+        binding_next[v] = o
+        if all((_bind_atom(atom, binding_next) in static_facts) == positive 
+               for atom, positive in checks[depth]):
+          stack.append((depth + 1, binding_next))
+
+  return grounded
+
+
+class GroundedOperator(object):
+  """
+  Grounded operator compiled for planning.
+  """
+
+  __slots__ = ('name', 'args', 'key', 'pre_pos', 'pre_neg', 'eff_pos', 
+               'eff_neg')
+
+  def __init__(self, name, args, pre_pos, pre_neg, eff_pos, eff_neg):
+    """
+    Initialize a grounded operator.
+
+    @param name The operator name.
+    @param args The grounded arguments as a tuple of object names.
+    @param pre_pos The positive preconditions as a bitset.
+    @param pre_neg The negative preconditions as a bitset.
+    @param eff_pos The positive effects as a bitset.
+    @param eff_neg The negative effects as a bitset.
+    """
+
+    super(GroundedOperator, self).__init__()
+
+    self.name = name
+    self.args = tuple(args)
+    self.key = sys.intern(str((self.name,) + self.args))
+    self.pre_pos = pre_pos
+    self.pre_neg = pre_neg
+    self.eff_pos = eff_pos
+    self.eff_neg = eff_neg
+
+  def __str__(self):
+    return self.key
+
+  def __repr__(self):
+    return 'GroundedOperator%s' % (self.key)
+
+
 class PDDLPlanner(object):
   """
   PDDL Planner.
   """
 
-  def __init__(self, fname_domain, fname_problem):
+  def __init__(self, fname_domain, fname_problem, cache_dir=None, 
+               plan_cache_size=4096, heuristic_cache_size=65536):
     """
     Initialize a PDDL planner.
 
-    @param domprob The domain problem definition.
+    @param fname_domain The domain file name.
+    @param fname_problem The problem file name.
+    @param cache_dir The directory of the grounded task cache, which is keyed 
+                     by the contents of the domain and problem files and the 
+                     planner version. `None` disables the cache. (default: 
+                     None)
+    @param plan_cache_size The maximum number of plans cached by starting 
+                           state and goals. `0` disables the plan cache. 
+                           (default: 4096)
+    @param heuristic_cache_size The maximum number of heuristic values cached 
+                                by heuristic, state and goals for the 
+                                informed search strategies. `0` disables the 
+                                heuristic cache. (default: 65536)
     """
 
     super(PDDLPlanner, self).__init__()
     
     self.fname_domain = fname_domain
     self.fname_problem = fname_problem
+    self.cache_dir = cache_dir
+
+    # load the grounded task from cache if valid, or ground it otherwise
+    fname_cache = None
+    loaded = False
+    if self.cache_dir is not None:
+      fname_cache = self._GroundedTaskCacheFile()
+      loaded = self._LoadGroundedTask(fname_cache)
+
+    if not loaded:
+      self._GroundTask()
+      if fname_cache is not None:
+        self._SaveGroundedTask(fname_cache)
+
+    # index the compiled operators by their positive preconditions
+    self.successor_generator = PDDLPlanner._ConstructSuccessorGenerator(
+      self.compiled_operators)
+
+    # index the delete relaxation of the compiled operators for heuristics
+    self.relaxed_operators = PDDLPlanner._ConstructRelaxedOperators(
+      self.compiled_operators)
+
+    # initialize the goal distance tables
+    # note: a goal distance table maps the goals as a bitset to a dictionary, 
+    #       which maps each explored state to a tuple `(cost, k)` of its 
+    #       cost-to-go and the index of the best next operator in 
+    #       `self.compiled_operators` (`None` at the goals, and `(None, None)` 
+    #       for dead ends).
+    self.goal_distance_tables = dict()
+
+    # initialize the plan cache
+    # note: a cache entry maps `(s, g)` to `(plan, decoded_plan, i)`, where 
+    #       `plan` is the encoded plan found from an earlier search whose 
+    #       `i`-th state is `s` and `decoded_plan` is its decoded copy, so one 
+    #       search caches the plan suffixes of all the states it visits.
+    self.plan_cache = None
+    if plan_cache_size > 0:
+      self.plan_cache = LRUCache(plan_cache_size)
+
+    # initialize the heuristic cache
+    # note: a cache entry maps `(heuristic, s, g)` to a tuple `(h,)`, where `h` 
+    #       is `None` for dead ends. A single search evaluates each state 
+    #       once, but the searches from nearby states, e.g. when replanning, 
+    #       evaluate mostly the same states.
+    self.heuristic_cache = None
+    if heuristic_cache_size > 0:
+      self.heuristic_cache = LRUCache(heuristic_cache_size)
+
+    # the outcome of the latest `advance` call
+    self.last_advance = None
+
+
+  def _GroundTask(self):
+    """
+    (internal)
+    Parse the domain and problem files and ground the planning task.
+    """
 
-    # initialize domain problem definitions
-    domprob = pddlpy.DomainProblem(self.fname_domain, self.fname_problem)
-
-    self.predefined_initial_state = domprob.initialstate()
-    self.predefined_goals = domprob.goals()
-    self.operators = domprob.operators()
-
-    # generate grounded operators dictionary
-    # note: a new domain problem object needs to be initialized from PDDL files 
-    #       everytime a new grounded operator is going to be generated, because 
-    #       of the `ground_operator` bug in the `pddlpy` library.
+    # initialize domain problem definitions, parsing each file once
+    domain = PDDLDomain(self.fname_domain)
+    problem = PDDLProblem(self.fname_problem)
+
+    self.predefined_initial_state = problem.initial_state
+    self.predefined_goals = problem.goals
+    self.operators = [action[0] for action in domain.actions]
+
+    # intern ground predicates as bit indices
+    # note: a symbolic state is encoded as an integer bitset, in which the bit 
+    #       at index `i` is set if and only if `self.predicates[i]` holds.
+    self.predicates = [] # bit index -> predicate tuple
+    self.predicate_index = dict() # predicate tuple -> bit index
+    for p in sorted(self.predefined_initial_state):
+      self._InternPredicate(p)
+    for p in sorted(self.predefined_goals):
+      self._InternPredicate(p)
+
+    # ground operators and compile them into precondition and effect bitmasks
     self.grounded_operators_dict = dict()
     for operator in self.operators:
-      domprob = pddlpy.DomainProblem(self.fname_domain, self.fname_problem)
-      grounded_operator = list(domprob.ground_operator(operator))
-      self.grounded_operators_dict[operator] = grounded_operator
+      self.grounded_operators_dict[operator] = []
+
+    self.compiled_operators = []
+    for name, args, pre_pos, pre_neg, eff_pos, eff_neg in \
+        ground_operators(domain, problem):
+      op = GroundedOperator(
+        name, args,
+        self.encode_state(pre_pos),
+        self.encode_state(pre_neg),
+        self.encode_state(eff_pos),
+        self.encode_state(eff_neg))
+      self.grounded_operators_dict[name].append(op)
+      self.compiled_operators.append(op)
+
+
+  def _GroundedTaskCacheFile(self):
+    """
+    (internal)
+    Determine the grounded task cache file name.
+
+    @return The cache file name, which is keyed by a content hash of the 
+            domain and problem files and the planner version.
+    """
+
+    h = hashlib.sha256()
+    h.update(('%s:%d\n' % (__version__, grounded_task_cache_version)).encode())
+    for fname in [self.fname_domain, self.fname_problem]:
+      with open(fname, 'rb') as f:
+        content = f.read()
+      h.update(b'%d\n' % (len(content)))
+      h.update(content)
+
+    return os.path.join(self.cache_dir, 'grounded_%s.npz' % (h.hexdigest()[:32]))
+
+
+  def _SaveGroundedTask(self, fname):
+    """
+    (internal)
+    Save the grounded task to a cache file.
+
+    The predicates and operators are stored as strings, and the operator 
+    bitmasks as a `(#operators, 4, #bytes)` little-endian byte array in the 
+    order of `pre_pos`, `pre_neg`, `eff_pos` and `eff_neg`.
+
+    @param fname The cache file name.
+    """
+
+    n_bytes = max(1, (len(self.predicates) + 7) // 8)
+    masks = np.zeros((len(self.compiled_operators), 4, n_bytes), dtype=np.uint8)
+    for k, op in enumerate(self.compiled_operators):
+      for j, bits in enumerate([op.pre_pos, op.pre_neg, op.eff_pos, op.eff_neg]):
+        masks[k, j] = np.frombuffer(bits.to_bytes(n_bytes, 'little'), np.uint8)
+
+    arrays = {
+      'predicates': np.array(
+        [','.join(p) for p in self.predicates], dtype=np.str_),
+      'initial_state': np.array(
+        sorted(self.predicate_index[p] for p in self.predefined_initial_state), 
+        dtype=np.int64),
+      'goals': np.array(
+        sorted(self.predicate_index[p] for p in self.predefined_goals), 
+        dtype=np.int64),
+      'operators': np.array(self.operators, dtype=np.str_),
+      'operator_names': np.array(
+        [op.name for op in self.compiled_operators], dtype=np.str_),
+      'operator_args': np.array(
+        [','.join(op.args) for op in self.compiled_operators], dtype=np.str_),
+      'operator_masks': masks
+    }
+
+    # write to a temporary file first, so that concurrent planners never load 
+    # a partially written cache
+    if not os.path.isdir(self.cache_dir):
+      os.makedirs(self.cache_dir, exist_ok=True)
+    fname_tmp = '%s.%d.tmp' % (fname, os.getpid())
+    with open(fname_tmp, 'wb') as f:
+      np.savez(f, **arrays)
+    os.replace(fname_tmp, fname)
+
+
+  def _LoadGroundedTask(self, fname):
+    """
+    (internal)
+    Load the grounded task from a cache file.
+
+    @param fname The cache file name.
+    @return A boolean indicating if the grounded task is loaded.
+    """
+
+    if not os.path.isfile(fname):
+      return False
+
+    # note: a cache file truncated or written by another version is reported 
+    #       as not loaded, so that the task is grounded and cached again.
+    try:
+      with np.load(fname, allow_pickle=False) as data:
+        arrays = dict((key, data[key]) for key in data.files)
+      if any(key not in arrays for key in grounded_task_cache_keys):
+        return False
+
+      self.predicates = [_split_names(str(s)) for s in arrays['predicates']]
+      self.predicate_index = dict((p, i) for i, p in enumerate(self.predicates))
+      self.predefined_initial_state = frozenset(
+        self.predicates[i] for i in arrays['initial_state'])
+      self.predefined_goals = frozenset(
+        self.predicates[i] for i in arrays['goals'])
+      self.operators = [str(s) for s in arrays['operators']]
+
+      self.grounded_operators_dict = dict()
+      for operator in self.operators:
+        self.grounded_operators_dict[operator] = []
+
+      self.compiled_operators = []
+      masks = arrays['operator_masks']
+      for k in range(len(arrays['operator_names'])):
+        name = str(arrays['operator_names'][k])
+        op = GroundedOperator(
+          name, _split_names(str(arrays['operator_args'][k])),
+          *[int.from_bytes(masks[k, j].tobytes(), 'little') for j in range(4)])
+        self.grounded_operators_dict[name].append(op)
+        self.compiled_operators.append(op)
+    except (OSError, ValueError, KeyError, IndexError, zipfile.BadZipFile):
+      return False
+
+    return True
+
+
+  def _InternPredicate(self, p):
+    """
+    (internal)
+    Intern a predicate and assign a bit index to it if not yet assigned.
+
+    @param p The predicate tuple.
+    @return The bit index of the predicate.
+    """
+
+    i = self.predicate_index.get(p)
+    if i is None:
+      i = len(self.predicates)
+      self.predicates.append(p)
+      self.predicate_index[p] = i
+
+    return i
+
+
+  def encode_state(self, s):
+    """
+    Encode a symbolic state as a bitset.
+
+    @param s The symbolic state as a set of predicate tuples.
+    @return The symbolic state encoded as an integer bitset.
+    """
+
+    bits = 0
+    for p in s:
+      bits |= 1 << self._InternPredicate(tuple(p))
+
+    return bits
+
+
+  def decode_state(self, bits):
+    """
+    Decode a symbolic state from a bitset.
+
+    @param bits The symbolic state encoded as an integer bitset.
+    @return The symbolic state as a frozen set of predicate tuples.
+    """
+
+    s = []
+    while bits:
+      low = bits & -bits
+      s.append(self.predicates[low.bit_length() - 1])
+      bits ^= low
+
+    return frozenset(s)
+
+
+  def _AsBitset(self, s):
+    """
+    (internal)
+    Encode a symbolic state as a bitset unless it is already encoded.
+
+    @param s The symbolic state as a set of predicate tuples or a bitset.
+    @return The symbolic state encoded as an integer bitset.
+    """
+
+    if isinstance(s, int):
+      return s
+
+    return self.encode_state(s)
+
+
+  def decode_plan(self, plan):
+    """
+    Decode the symbolic states of an encoded plan.
+
+    @param plan The plan with symbolic states as bitsets, as returned by 
+                `find_plan` with `encoded` enabled.
+    @return The plan with symbolic states as frozen sets of predicate tuples, 
+            or `None` if the plan is `None`.
+    """
+
+    if plan is None:
+      return None
+
+    return [(op, self.decode_state(bits)) for op, bits in plan]
+
+
+  def _BitIndices(bits):
+    """
+    (internal, static)
+    List the indices of the set bits in a bitset.
+
+    @param bits The bitset.
+    @return A list of the indices of the set bits in ascending order.
+    """
+
+    indices = []
+    while bits:
+      low = bits & -bits
+      indices.append(low.bit_length() - 1)
+      bits ^= low
+
+    return indices
+
+
+  def _ConstructSuccessorGenerator(cops):
+    """
+    (internal, static)
+    Construct a successor generator, which is a match tree indexing the 
+    compiled operators by their positive preconditions.
+
+    Each node of the tree is a list `[i, ops, node_true, node_any]`, where 
+    `ops` are the operators whose positive preconditions are all tested on the 
+    path to the node, `node_true` is the subtree of the operators requiring 
+    the predicate indexed by `i` and `node_any` is the subtree of the 
+    operators not requiring it. Predicates are tested in ascending index 
+    order, and the subtrees are `None` if empty.
+
+    @param cops The compiled operators.
+    @return The root node of the successor generator.
+    """
+
+    pres = [PDDLPlanner._BitIndices(cop.pre_pos) for cop in cops]
+
+    # construct the match tree iteratively, since its depth is bounded by the 
+    # number of predicates rather than the recursion limit
+    root = [None, [], None, None]
+    stack = [(root, list(range(len(cops))), 0)] # (node, operators, depth)
+    while len(stack) > 0:
+      node, ks, depth = stack.pop()
+
+      # collect the operators with all positive preconditions tested, and find 
+      # the next predicate to test among the rest
+      rest = []
+      i_next = None
+      for k in ks:
+        pre = pres[k]
+        j = bisect.bisect_left(pre, depth)
+        if j == len(pre):
+          node[1].append(cops[k])
+        else:
+          rest.append(k)
+          if i_next is None or pre[j] < i_next:
+            i_next = pre[j]
+
+      if len(rest) == 0:
+        continue
+
+      ks_true = []
+      ks_any = []
+      for k in rest:
+        pre = pres[k]
+        j = bisect.bisect_left(pre, i_next)
+        if j < len(pre) and pre[j] == i_next:
+          ks_true.append(k)
+        else:
+          ks_any.append(k)
+
+      node[0] = i_next
+      if len(ks_true) > 0:
+        node[2] = [None, [], None, None]
+        stack.append((node[2], ks_true, i_next + 1))
+      if len(ks_any) > 0:
+        node[3] = [None, [], None, None]
+        stack.append((node[3], ks_any, i_next + 1))
+
+    return root
+
+
+  def _ApplicableOperators(succgen, s):
+    """
+    (internal, static)
+    Generate the candidate operators whose positive preconditions are 
+    satisfied in a state, by traversing a successor generator.
+
+    @param succgen The successor generator.
+    @param s The state as a bitset.
+    @return A list of the candidate compiled operators. Their negative 
+            preconditions remain to be checked.
+    """
+
+    candidates = []
+    stack = [succgen]
+    while len(stack) > 0:
+      i, ops, node_true, node_any = stack.pop()
+      candidates.extend(ops)
+      if node_any is not None:
+        stack.append(node_any)
+      if node_true is not None and (s >> i) & 1:
+        stack.append(node_true)
+
+    return candidates
+
+
+  def _ConstructRelaxedOperators(cops):
+    """
+    (internal, static)
+    Construct the delete relaxation of the compiled operators.
+    
+    Negative preconditions are compiled away into negated facts, so a relaxed 
+    fact is either a predicate index `i` or its negation `~i`, which is 
+    achieved by the operators deleting the predicate.
+
+    @param cops The compiled operators.
+    @return A tuple `(pres, adds, pre_of, negs)`, where `pres[k]` and 
+            `adds[k]` are the lists of relaxed precondition and effect facts 
+            of the `k`-th operator, `pre_of` maps a relaxed fact to the indices 
+            of the operators requiring it, and `negs` is the list of predicate 
+            indices occurring in negative preconditions.
+    """
+
+    negs = set()
+    for cop in cops:
+      negs.update(PDDLPlanner._BitIndices(cop.pre_neg))
+
+    pres = []
+    adds = []
+    pre_of = dict()
+    for k, cop in enumerate(cops):
+      pre = PDDLPlanner._BitIndices(cop.pre_pos)
+      pre.extend(~i for i in PDDLPlanner._BitIndices(cop.pre_neg))
+      pres.append(pre)
+
+      add = PDDLPlanner._BitIndices(cop.eff_pos)
+      add.extend(~i for i in PDDLPlanner._BitIndices(cop.eff_neg) if i in negs)
+      adds.append(add)
+
+      for i in pre:
+        pre_of.setdefault(i, []).append(k)
+
+    return (pres, adds, pre_of, sorted(negs))
+
+
+  def _ExploreRelaxed(rops, s, g, additive):
+    """
+    (internal, static)
+    Compute the relaxed costs of facts from a state by a generalized Dijkstra 
+    exploration, ignoring delete effects.
+
+    @param rops The relaxed operators.
+    @param s The starting state as a bitset.
+    @param g The goals as a bitset.
+    @param additive The switch to sum the precondition costs of an operator 
+                    (h_add), otherwise their maximum is taken (h_max).
+    @return A tuple `(cost, supporter)`, where `cost` maps a reached relaxed 
+            fact to its relaxed cost and `supporter` maps it to the index of 
+            its cheapest achieving operator. `None` will be returned if the 
+            goals are unreachable in the relaxed problem.
+    """
+
+    pres, adds, pre_of, negs = rops
+
+    unsat = [len(pre) for pre in pres]
+    opcost = [0] * len(pres)
+    best = dict() # relaxed fact -> best cost found so far
+    supporter = dict() # relaxed fact -> operator index
+    cost = dict() # relaxed fact -> settled cost
+
+    # settle the facts of the state at no cost without going through the
+    # heap, in the ascending order the heap would pop them
+    # note: the negated facts `~i` are negative, so they come first.
+    settled = [~i for i in reversed(negs) if not (s >> i) & 1]
+    settled.extend(PDDLPlanner._BitIndices(s))
+    for i in settled:
+      best[i] = 0
+      cost[i] = 0
+
+    heap = []
+    for k in range(len(pres)):
+      if unsat[k] == 0:
+        for i in adds[k]:
+          if i not in best:
+            best[i] = 1
+            supporter[i] = k
+            heap.append((1, i))
+
+    # trigger the operators whose preconditions all hold in the state, which
+    # achieve their effects at the cost of one
+    for i in settled:
+      for k in pre_of.get(i, ()):
+        unsat[k] -= 1
+        if unsat[k] == 0:
+          for i_next in adds[k]:
+            if i_next not in best:
+              best[i_next] = 1
+              supporter[i_next] = k
+              heap.append((1, i_next))
+    heapq.heapify(heap)
+
+    goals_left = set(PDDLPlanner._BitIndices(g))
+    goals_left.difference_update(settled)
+
+    while len(heap) > 0 and len(goals_left) > 0:
+      c, i = heapq.heappop(heap)
+      if i in cost:
+        continue
+      cost[i] = c
+      goals_left.discard(i)
+
+      # trigger the operators requiring the settled predicate
+      for k in pre_of.get(i, ()):
+        unsat[k] -= 1
+        if additive:
+          opcost[k] += c
+        elif c > opcost[k]:
+          opcost[k] = c
+        if unsat[k] == 0:
+          c_next = opcost[k] + 1
+          for i_next in adds[k]:
+            if i_next not in cost and c_next < best.get(i_next, float('inf')):
+              best[i_next] = c_next
+              supporter[i_next] = k
+              heapq.heappush(heap, (c_next, i_next))
+
+    if len(goals_left) > 0:
+      return None
+
+    return (cost, supporter)
+
+
+  def _HeuristicAdd(rops, s, g):
+    """
+    (internal, static)
+    Additive heuristic h_add.
+
+    @param rops The relaxed operators.
+    @param s The state as a bitset.
+    @param g The goals as a bitset.
+    @return The heuristic value, or `None` if the state is a dead end.
+    """
+
+    explored = PDDLPlanner._ExploreRelaxed(rops, s, g, True)
+    if explored is None:
+      return None
+
+    cost = explored[0]
+    return sum(cost[i] for i in PDDLPlanner._BitIndices(g))
+
+
+  def _HeuristicMax(rops, s, g):
+    """
+    (internal, static)
+    Maximum heuristic h_max, which is admissible.
+
+    @param rops The relaxed operators.
+    @param s The state as a bitset.
+    @param g The goals as a bitset.
+    @return The heuristic value, or `None` if the state is a dead end.
+    """
+
+    explored = PDDLPlanner._ExploreRelaxed(rops, s, g, False)
+    if explored is None:
+      return None
+
+    cost = explored[0]
+    return max([cost[i] for i in PDDLPlanner._BitIndices(g)] + [0])
+
+
+  def _HeuristicFF(rops, s, g):
+    """
+    (internal, static)
+    FF heuristic h_FF, the length of a relaxed plan extracted from the best 
+    supporters found by the h_add exploration.
+
+    @param rops The relaxed operators.
+    @param s The state as a bitset.
+    @param g The goals as a bitset.
+    @return The heuristic value, or `None` if the state is a dead end.
+    """
+
+    explored = PDDLPlanner._ExploreRelaxed(rops, s, g, True)
+    if explored is None:
+      return None
+
+    pres = rops[0]
+    cost, supporter = explored
+
+    relaxed_plan = set()
+    stack = PDDLPlanner._BitIndices(g & ~s)
+    reached = set(stack)
+    while len(stack) > 0:
+      k = supporter[stack.pop()]
+      if k in relaxed_plan:
+        continue
+      relaxed_plan.add(k)
+      for i in pres[k]:
+        if cost[i] > 0 and i not in reached:
+          reached.add(i)
+          stack.append(i)
+
+    return len(relaxed_plan)
 
 
   def _ConstructPlanFromVisits(visited, s, sg):
@@ -120,22 +1108,19 @@ class PDDLPlanner(object):
     Construct a plan from visits.
 
     @param visited The visited trajectory.
-    @param s The starting state as a set of predicate tuples.
-    @param sg The goal state as a set of predicate tuples.
+    @param s The starting state as a bitset.
+    @param sg The goal state as a bitset.
     @return A list of tuples, each of which contains the symbolic action to 
             take and the post-effect (the state to become after the action is 
             taken). The list is defined as the following:
             ```
             [ (a, s_next), ... ]
             ```
-            where `a` the symbolic action as a string to take and `s_next` is 
-            the symbolic state as a set of predicate tuples to become after the 
+            where `a` the symbolic action as a grounded operator to take and 
+            `s_next` is the symbolic state as a bitset to become after the 
             action is taken.
     """
 
-    s = frozenset(s)
-    sg = frozenset(sg)
-    
     assert(sg in visited)
 
     plan = []
@@ -144,8 +1129,8 @@ class PDDLPlanner(object):
     s_parent = sg
     while s_parent is not None:
       s_cur = s_parent
-      s_parent, opstr = visited[s_cur]
-      plan.append((opstr, s_cur))
+      s_parent, op = visited[s_cur]
+      plan.append((op, s_cur))
 
     # convert the plan to a ordered list
     plan.reverse()
@@ -157,32 +1142,14 @@ class PDDLPlanner(object):
     return plan
 
 
-  def _ConstructOperatorStr(op):
-    """
-    (internal, static)
-    Construct grounded operator string with variables.
-
-    @param op The operator to be converted to a string.
-    @return A string of the grounded operator string with variables.
-    """
-
-    oplst = [op.operator_name]
-    for var_name in op.variable_list:
-      oplst.append(op.variable_list[var_name])
-
-    opstr = str(tuple(oplst))
-
-    return opstr
-
-
-  def _Plan(gops, s, g, verbose=False):
+  def _Plan(succgen, s, g, verbose=False):
     """
     (internal, static)
     Find a plan from the stating state to the goal state.
 
-    @param gopdict The grounded operators dictionary.
-    @param s The starting state as a set of predicate tuples.
-    @param g The goals as a set of predicate tuples.
+    @param succgen The successor generator of the compiled operators.
+    @param s The starting state as a bitset.
+    @param g The goals as a bitset.
     @param verbose The switch to turn on verbose logging. (default: False)
     @return A list of tuples, each of which contains the symbolic action to 
             take and the post-effect (the state to become after the action is 
@@ -190,128 +1157,570 @@ class PDDLPlanner(object):
             ```
             [ (a, s_next), ... ]
             ```
-            where `a` the symbolic action as a string to take and `s_next` is 
-            the symbolic state as a set of predicate tuples to become after the 
+            where `a` the symbolic action as a grounded operator to take and 
+            `s_next` is the symbolic state as a bitset to become after the 
             action is taken.
     """
 
     visited = dict() # state -> (parent_state, operator)
     q = deque()
 
-    # initialize the search queue
-    q.append((None, None, s)) # (parent_state, operator, state)
-
     # check if goals already satisfied
-    if len(s.intersection(g)) == len(g):
+    if s & g == g:
       return [(None, s)]
 
+    # initialize the search queue
+    visited[s] = (None, None)
+    q.append(s)
+
     # search for plan with breadth-first search
     while len(q) > 0:
-      v = q.popleft()
-      s_cur = v[2]
-      if frozenset(s_cur) not in visited:
-        visited[frozenset(s_cur)] = (frozenset(v[0]) if v[0] is not None else None, v[1])
+      s_cur = q.popleft()
       if verbose:
         print('')
-        print('proc: %s' % (v[1]))
+        print('proc: %s' % (visited[s_cur][1]))
+
+      # search each operator candidate
+      for op in PDDLPlanner._ApplicableOperators(succgen, s_cur):
+        # check negative preconditions
+        if s_cur & op.pre_neg:
+          continue
+
+        # remove negative effect and append positive effect
+        s_next = (s_cur & ~op.eff_neg) | op.eff_pos
+
+        # check if already visited
+        if s_next in visited:
+          continue
+
+        visited[s_next] = (s_cur, op)
 
-      # search each grounded operator
-      for gop_name in gops:
-        # retrieve grounded operator
-        gop = gops[gop_name]
+        # check if goal reached, and construct plan if so
+        if s_next & g == g:
+          return PDDLPlanner._ConstructPlanFromVisits(visited, s, s_next)
 
-        # search each grounded operator instance
-        for op in gop:
-          opstr = PDDLPlanner._ConstructOperatorStr(op)
+        # append to search queue
+        q.append(s_next)
+        if verbose:
+          print('  + %s' % (op))
+
+    return None
 
-          # validate operator name
-          assert(gop_name == op.operator_name)
 
-          # check operator candidate
-          if (len(op.precondition_pos.intersection(s_cur)) == len(op.precondition_pos) and
-              len(op.precondition_neg.intersection(s_cur)) == 0):
-            s_next = s_cur.copy()
+  def _PlanInformed(succgen, rops, s, g, heuristic, weight_g=1, weight_h=1, 
+                    verbose=False):
+    """
+    (internal, static)
+    Find a plan from the stating state to the goal state with best-first 
+    search, ordering the open list by `weight_g * g(s) + weight_h * h(s)`.
+
+    @param succgen The successor generator of the compiled operators.
+    @param rops The relaxed operators.
+    @param s The starting state as a bitset.
+    @param g The goals as a bitset.
+    @param heuristic The heuristic function as `heuristic(rops, s, g)`.
+    @param weight_g The weight of the path cost. (default: 1)
+    @param weight_h The weight of the heuristic value. (default: 1)
+    @param verbose The switch to turn on verbose logging. (default: False)
+    @return A plan as returned by `_Plan`, or `None` if no plan is found.
+    """
+
+    # check if goals already satisfied
+    if s & g == g:
+      return [(None, s)]
+
+    h = heuristic(rops, s, g)
+    if h is None:
+      return None
+
+    visited = dict() # state -> (parent_state, operator)
+    cost = dict() # state -> best path cost found so far
+    closed = set()
+    heap = [(weight_h * h, h, 0, 0, s)] # (priority, h, tie, path cost, state)
+    tie = 1
+
+    visited[s] = (None, None)
+    cost[s] = 0
+
+    # search for plan with best-first search
+    while len(heap) > 0:
+      v = heapq.heappop(heap)
+      c_cur, s_cur = v[-2], v[-1]
+      if s_cur in closed or c_cur > cost[s_cur]:
+        continue
+      closed.add(s_cur)
+      if verbose:
+        print('')
+        print('proc: %s (g: %d, h: %d)' % (visited[s_cur][1], c_cur, v[1]))
 
-            # remove negative effect
-            s_next.difference_update(op.effect_neg)
+      # check if goal reached, and construct plan if so
+      if s_cur & g == g:
+        return PDDLPlanner._ConstructPlanFromVisits(visited, s, s_cur)
 
-            # append positive effect
-            s_next = list(s_next)
-            s_next.extend(list(op.effect_pos))
-            s_next = set(s_next)
+      # search each operator candidate
+      for op in PDDLPlanner._ApplicableOperators(succgen, s_cur):
+        # check negative preconditions
+        if s_cur & op.pre_neg:
+          continue
 
-            # check if goal reached, and construct plan if so
-            if len(s_next.intersection(g)) == len(g):
-              sg = s_next
-              visited[frozenset(sg)] = (frozenset(s_cur), opstr)
-              return PDDLPlanner._ConstructPlanFromVisits(visited, s, sg)
+        # remove negative effect and append positive effect
+        s_next = (s_cur & ~op.eff_neg) | op.eff_pos
+        c_next = c_cur + 1
 
-            # check if already visited, and append to search queue if not
-            if frozenset(s_next) not in visited:
-              q.append((s_cur, opstr, s_next))
-              if verbose:
-                print('  + %s' % (opstr))
+        # check if already reached with a lower or equal cost
+        if c_next >= cost.get(s_next, c_next + 1):
+          continue
+
+        h_next = heuristic(rops, s_next, g)
+        if h_next is None:
+          continue
+
+        visited[s_next] = (s_cur, op)
+        cost[s_next] = c_next
+        closed.discard(s_next)
+
+        heapq.heappush(heap, (weight_g * c_next + weight_h * h_next, h_next, 
+                              tie, c_next, s_next))
+        tie += 1
+        if verbose:
+          print('  + %s' % (op))
 
     return None
 
 
-  def find_plan(self, initial_state=None, goals=None):
+  def _PlanToAnyState(succgen, s, targets, max_expansions):
+    """
+    (internal, static)
+    Find a shortest path from the starting state to any of the target states 
+    with bounded breadth-first search.
+
+    @param succgen The successor generator of the compiled operators.
+    @param s The starting state as a bitset.
+    @param targets The set of target states as bitsets.
+    @param max_expansions The maximum number of states to expand.
+    @return A plan with symbolic states as bitsets ending at a target state, 
+            or `None` if no target is reached within the expansion limit.
     """
-    Find a plan from the stating state to the goal state.
 
-    @param initial_state The starting state as a set of predicate tuples. 
-                         (optinal, default: as defined in `domprob`)
-    @param goals The goals as a set of predicate tuples. (optinal, default: as 
-                 defined in `domprob`)
+    if s in targets:
+      return [(None, s)]
+
+    visited = dict() # state -> (parent_state, operator)
+    q = deque()
+
+    visited[s] = (None, None)
+    q.append(s)
+
+    expansions = 0
+    while len(q) > 0 and expansions < max_expansions:
+      s_cur = q.popleft()
+      expansions += 1
+
+      for op in PDDLPlanner._ApplicableOperators(succgen, s_cur):
+        if s_cur & op.pre_neg:
+          continue
+
+        s_next = (s_cur & ~op.eff_neg) | op.eff_pos
+        if s_next in visited:
+          continue
+
+        visited[s_next] = (s_cur, op)
+        if s_next in targets:
+          return PDDLPlanner._ConstructPlanFromVisits(visited, s, s_next)
+
+        q.append(s_next)
+
+    return None
+
+
+  def advance(self, plan, observed_state, goals=None, strategy='bfs', 
+              heuristic='h_ff', weight=5, max_repair_expansions=1000, 
+              replan=True):
+    """
+    Advance a plan to an observed state. If the observed state is on the plan, 
+    the remaining suffix of the plan is reused without searching. Otherwise, 
+    the plan is repaired by a bounded search for the shortest detour from the 
+    observed state back to any state on the plan, and replanned from scratch 
+    only if the repair fails.
+
+    @param plan The current plan as returned by `find_plan`. `None` or an 
+                empty plan is replanned from scratch.
+    @param observed_state The observed symbolic state as a set of predicate 
+                          tuples, or as a bitset if the plan is encoded.
+    @param goals The goals as a set of predicate tuples, which are used when 
+                 replanning from scratch. (optinal, default: as defined in the 
+                 problem)
+    @param strategy The search strategy used when replanning from scratch. 
+                    (default: `bfs`)
+    @param heuristic The heuristic used when replanning from scratch. 
+                     (default: `h_ff`)
+    @param weight The heuristic weight used when replanning from scratch. 
+                  (default: 5)
+    @param max_repair_expansions The maximum number of states to expand in the 
+                                 repair search. (default: 1000)
+    @param replan The switch to replan from scratch if the repair fails. 
+                  (default: True)
+    @return A plan starting from the observed state, as returned by 
+            `find_plan`, and encoded if the observed state is a bitset. How 
+            the plan is advanced is reported in `self.last_advance` as 
+            `reuse`, `repair` or `replan`. If the repair fails and `replan` 
+            is disabled, `None` is returned and `self.last_advance` is 
+            `fail`.
+    """
+
+    encoded = isinstance(observed_state, int)
+
+    if plan is None or len(plan) == 0:
+      self.last_advance = 'replan'
+      return self.find_plan(initial_state=observed_state, goals=goals, 
+                            strategy=strategy, heuristic=heuristic, 
+                            weight=weight, encoded=encoded)
+
+    # reuse the plan suffix from the latest matching state on the plan
+    if not encoded:
+      observed_state = frozenset(observed_state)
+    for k in range(len(plan) - 1, -1, -1):
+      if plan[k][1] == observed_state:
+        self.last_advance = 'reuse'
+        if k == 0:
+          return plan
+        return [(None, plan[k][1])] + plan[k+1:]
+
+    # repair the plan with a detour back to the nearest state on the plan
+    s = self._AsBitset(observed_state)
+    targets = dict() # state -> index in the plan
+    for k in range(len(plan)):
+      targets[self._AsBitset(plan[k][1])] = k
+
+    detour = PDDLPlanner._PlanToAnyState(
+      self.successor_generator, s, targets, max_repair_expansions)
+    if detour is not None:
+      self.last_advance = 'repair'
+      k = targets[detour[-1][1]]
+      if not encoded:
+        detour = self.decode_plan(detour)
+      return detour[:-1] + [(detour[-1][0], plan[k][1])] + plan[k+1:]
+
+    if not replan:
+      self.last_advance = 'fail'
+      return None
+
+    self.last_advance = 'replan'
+    return self.find_plan(initial_state=observed_state, goals=goals, 
+                          strategy=strategy, heuristic=heuristic, 
+                          weight=weight, encoded=encoded)
+
+
+  def find_plan(self, initial_state=None, goals=None, strategy='bfs', 
+                heuristic='h_ff', weight=5, encoded=False):
+    """
+    Find a plan from the stating state to the goal state. A cached plan 
+    suffix is returned if the starting state and goals have been planned for 
+    or passed through before, regardless of the search strategy.
+
+    @param initial_state The starting state as a set of predicate tuples or a 
+                         bitset. (optinal, default: as defined in the problem)
+    @param goals The goals as a set of predicate tuples or a bitset. (optinal, 
+                 default: as defined in the problem)
+    @param strategy The search strategy, which can be `bfs` (breadth-first 
+                    search), `astar` (A*), `wastar` (weighted A*), `gbfs` 
+                    (greedy best-first search) or `table` (lookups in a goal 
+                    distance table, see `build_goal_distance_table`). 
+                    (default: `bfs`)
+    @param heuristic The heuristic for informed search strategies, which can 
+                     be `h_add`, `h_max` or `h_ff`. (default: `h_ff`)
+    @param weight The heuristic weight for weighted A*. (default: 5)
+    @param encoded The switch to return the symbolic states in the plan as 
+                   bitsets (see `encode_state`) instead of sets of predicate 
+                   tuples. (default: False)
     @return A list of tuples, each of which contains the symbolic action to 
             take and the post-effect (the state to become after the action is 
             taken). The list is defined as the following:
             ```
             [ (a, s_next), ... ]
             ```
-            where `a` the symbolic action as a string to take and `s_next` is 
-            the symbolic state as a set of predicate tuples to become after the 
-            action is taken.
+            where `a` the symbolic action as a grounded operator to take and 
+            `s_next` is the symbolic state as a frozen set of predicate tuples 
+            to become after the action is taken. The string key of a grounded 
+            operator is available as `a.key`.
     """
 
-    if initial_state is not None:
-      s = initial_state
-    else:
-      s = set()
-      initial_state = list(self.predefined_initial_state)
-      for a in initial_state:
-        s.add(tuple(a.predicate))
+    if initial_state is None:
+      initial_state = self.predefined_initial_state
 
-    if goals is not None:
-      g = goals
-    else:
-      g = set()
-      goals = list(self.predefined_goals)
-      for a in goals:
-        g.add(tuple(a.predicate))
+    if goals is None:
+      goals = self.predefined_goals
+
+    s = self._AsBitset(initial_state)
+    g = self._AsBitset(goals)
 
-    s = set(s)
-    g = set(g)
+    # look up the plan cache
+    key = (s, g)
+    if self.plan_cache is not None:
+      entry = self.plan_cache.get(key)
+      if entry is not None:
+        plan, decoded_plan, i = entry
+        if plan is None:
+          return None
+        if encoded:
+          return [(None, plan[i][1])] + plan[i+1:]
+        return [(None, decoded_plan[i][1])] + decoded_plan[i+1:]
 
     # find plan
-    plan = PDDLPlanner._Plan(self.grounded_operators_dict, s, g)
+    plan = self._FindEncodedPlan(s, g, strategy, heuristic, weight)
+
+    if plan is None:
+      if self.plan_cache is not None:
+        self.plan_cache.put(key, (None, None, 0))
+      return None
+
+    # decode symbolic states in the plan
+    decoded_plan = self.decode_plan(plan)
+
+    # cache the suffix from every state along the plan
+    if self.plan_cache is not None:
+      for i in range(len(plan)):
+        self.plan_cache.put((plan[i][1], g), (plan, decoded_plan, i))
+
+    # note: copies are returned, so that mutating a returned plan does not 
+    #       corrupt the cached entries.
+    if encoded:
+      return list(plan)
+    return list(decoded_plan)
+
+
+  def _ExtendGoalDistanceTable(cops, succgen, table, roots, g):
+    """
+    (internal, static)
+    Extend a goal distance table with all the states reachable from the root 
+    states, by exploring only the states outside of the table, and then 
+    searching backward along their reversed transitions from the goal states 
+    among them and from their transitions into the table.
+
+    The states in the table are closed under the transitions, since all the 
+    states reachable from them have been explored, so their costs-to-go never 
+    change and only the new states are searched.
+
+    @param cops The compiled operators.
+    @param succgen The successor generator of the compiled operators.
+    @param table The goal distance table to extend in place, which is empty 
+                 to construct a new one.
+    @param roots The root states as bitsets.
+    @param g The goals as a bitset.
+    @return The number of states added to the table.
+    """
+
+    index = dict((id(op), k) for k, op in enumerate(cops))
+
+    # explore the new reachable states with breadth-first search
+    parents = dict() # new state -> [ (parent_state, operator_index), ... ]
+    heap = [] # (cost, state, operator_index)
+    q = deque()
+    for s in roots:
+      if s not in table and s not in parents:
+        parents[s] = []
+        q.append(s)
+
+    while len(q) > 0:
+      s_cur = q.popleft()
+      for op in PDDLPlanner._ApplicableOperators(succgen, s_cur):
+        if s_cur & op.pre_neg:
+          continue
+        s_next = (s_cur & ~op.eff_neg) | op.eff_pos
+
+        # reach the goals through a state in the table
+        if s_next in table:
+          cost = table[s_next][0]
+          if cost is not None:
+            heap.append((cost + 1, s_cur, index[id(op)]))
+          continue
+
+        if s_next not in parents:
+          parents[s_next] = []
+          q.append(s_next)
+        parents[s_next].append((s_cur, index[id(op)]))
+
+    # search backward from the new goal states
+    # note: the search starts at different costs, so the states are settled 
+    #       in the order of their costs with a heap.
+    for s in parents:
+      if s & g == g:
+        heap.append((0, s, None))
+    heapq.heapify(heap)
+
+    while len(heap) > 0:
+      cost, s_cur, k = heapq.heappop(heap)
+      if s_cur in table:
+        continue
+      table[s_cur] = (cost, k)
+      for s_prev, k_prev in parents[s_cur]:
+        if s_prev not in table:
+          heapq.heappush(heap, (cost + 1, s_prev, k_prev))
+
+    # mark dead ends
+    for s in parents:
+      if s not in table:
+        table[s] = (None, None)
+
+    return len(parents)
+
+
+  def build_goal_distance_table(self, goals=None, initial_states=None):
+    """
+    Solve the planning task for all the states reachable from the initial 
+    states at once, so that later `find_plan` calls with the `table` strategy 
+    only look up the table. The table built before for the same goals is 
+    extended with the states not explored yet.
+
+    @param goals The goals as a set of predicate tuples. (optinal, default: as 
+                 defined in the problem)
+    @param initial_states The initial states as a list of sets of predicate 
+                          tuples to explore from. (optinal, default: the 
+                          initial state defined in the problem)
+    @return The number of states in the table.
+    """
+
+    if goals is None:
+      goals = self.predefined_goals
+
+    if initial_states is None:
+      initial_states = [self.predefined_initial_state]
+
+    g = self.encode_state(goals)
+    roots = [self.encode_state(s) for s in initial_states]
+
+    table = self.goal_distance_tables.setdefault(g, dict())
+    PDDLPlanner._ExtendGoalDistanceTable(
+      self.compiled_operators, self.successor_generator, table, roots, g)
+
+    return len(table)
+
+
+  def _PlanByGoalDistanceTable(self, s, g):
+    """
+    (internal)
+    Reconstruct a plan by looking up the goal distance table.
+
+    @param s The starting state as a bitset.
+    @param g The goals as a bitset.
+    @return A plan with symbolic states as bitsets, `None` if the starting 
+            state is a dead end, or `False` if the starting state is not in 
+            the table.
+    """
+
+    table = self.goal_distance_tables.get(g)
+    if table is None or s not in table:
+      return False
+
+    cost, k = table[s]
+    if cost is None:
+      return None
+
+    plan = [(None, s)]
+    while k is not None:
+      op = self.compiled_operators[k]
+      s = (s & ~op.eff_neg) | op.eff_pos
+      plan.append((op, s))
+      k = table[s][1]
 
     return plan
 
 
+  def _MemoizedHeuristic(self, name, heuristic):
+    """
+    (internal)
+    Wrap a heuristic function to look up and store its values in the 
+    heuristic cache.
+
+    @param name The name of the heuristic.
+    @param heuristic The heuristic function as `heuristic(rops, s, g)`.
+    @return The memoized heuristic function with the same signature.
+    """
+
+    cache = self.heuristic_cache
+
+    def memoized(rops, s, g):
+      key = (name, s, g)
+      entry = cache.get(key)
+      if entry is None:
+        entry = (heuristic(rops, s, g),)
+        cache.put(key, entry)
+      return entry[0]
+
+    return memoized
+
+
+  def _FindEncodedPlan(self, s, g, strategy, heuristic, weight):
+    """
+    (internal)
+    Find a plan from the stating state to the goal state with a search 
+    strategy.
+
+    @param s The starting state as a bitset.
+    @param g The goals as a bitset.
+    @param strategy The search strategy.
+    @param heuristic The heuristic for informed search strategies.
+    @param weight The heuristic weight for weighted A*.
+    @return A plan with symbolic states as bitsets, or `None` if no plan is 
+            found.
+    """
+
+    if strategy == 'bfs':
+      return PDDLPlanner._Plan(self.successor_generator, s, g)
+
+    if strategy == 'table':
+      # build the goal distance table on first use, and extend it when a 
+      # state outside of the explored state space is queried
+      plan = self._PlanByGoalDistanceTable(s, g)
+      if plan is False:
+        roots = [s]
+        if g not in self.goal_distance_tables:
+          roots.append(self.encode_state(self.predefined_initial_state))
+        table = self.goal_distance_tables.setdefault(g, dict())
+        PDDLPlanner._ExtendGoalDistanceTable(
+          self.compiled_operators, self.successor_generator, table, roots, g)
+        plan = self._PlanByGoalDistanceTable(s, g)
+      return plan
+
+    if strategy == 'astar':
+      weight_g, weight_h = 1, 1
+    elif strategy == 'wastar':
+      weight_g, weight_h = 1, weight
+    elif strategy == 'gbfs':
+      weight_g, weight_h = 0, 1
+    else:
+      raise ValueError('unknown search strategy: %s' % (strategy))
+
+    if heuristic == 'h_add':
+      h = PDDLPlanner._HeuristicAdd
+    elif heuristic == 'h_max':
+      h = PDDLPlanner._HeuristicMax
+    elif heuristic == 'h_ff':
+      h = PDDLPlanner._HeuristicFF
+    else:
+      raise ValueError('unknown heuristic: %s' % (heuristic))
+
+    if self.heuristic_cache is not None:
+      h = self._MemoizedHeuristic(heuristic, h)
+
+    return PDDLPlanner._PlanInformed(
+      self.successor_generator, self.relaxed_operators, s, g, h, 
+      weight_g, weight_h)
+
+
 def main():
   fname_domain = '../PDDL/domain.pddl'
   fname_problem = '../PDDL/problem_room1.pddl'
+  cache_dir = '../PDDL/.cache'
 
   print('load planning domain and problem:')
   print('  - domain file: %s' % (fname_domain))
   print('  - problem file: %s' % (fname_problem))
-  domprob = pddlpy.DomainProblem(fname_domain, fname_problem)
+  planner = PDDLPlanner(fname_domain, fname_problem, cache_dir=cache_dir)
   print('')
 
-  show_domprob_summary(domprob)
+  show_domprob_summary(planner)
 
-  planner = PDDLPlanner(fname_domain, fname_problem)
   plan = planner.find_plan()
   show_plan(plan)
 
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""
+compare_interpolation.py
+Compare the frame interpolations against the cubic interpolation the decoder
+was trained with, in terms of preprocessing time, pixel error and decoded
+symbolic states.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import cv2
+
+from utils import LogicRLUtils as Util
+
+
+def load_frames(frame_dir, max_frames=None):
+  """
+  Load the annotated raw frames.
+
+  @param frame_dir The directory containing the annotated raw frames.
+  @param max_frames The maximum number of frames to load, or `None` to load all
+                    of them.
+  @return The raw frames as a list of BGR images.
+  """
+
+  fnames = []
+  for ext in ['png', 'jpg', 'jpeg', 'bmp']:
+    fnames += glob.glob(os.path.join(frame_dir, '*.' + ext))
+  fnames = sorted(fnames)
+  if max_frames is not None:
+    fnames = fnames[:max_frames]
+
+  frames = []
+  for fname in fnames:
+    frame = cv2.imread(fname, cv2.IMREAD_COLOR)
+    if frame is not None:
+      frames.append(frame)
+
+  return frames
+
+
+def time_preprocessing(frames, interpolation, repeats=5):
+  """
+  Measure the time of preprocessing the frames with an interpolation.
+
+  @param frames The raw frames.
+  @param interpolation The OpenCV interpolation.
+  @param repeats The number of times to repeat the measurement.
+  @return A tuple `(images, t_frame)` of the preprocessed images and the best
+          preprocessing time per frame in seconds.
+  """
+
+  t_best = float('inf')
+  for r in range(repeats):
+    t_start = time.time()
+    images = [Util.PreprocessFrame(frame, interpolation) for frame in frames]
+    t_best = min(t_best, time.time() - t_start)
+
+  return images, t_best / max(len(frames), 1)
+
+
+def decode_images(decoder, images, batch_size=64):
+  """
+  Decode the preprocessed images into sets of predicate strings.
+
+  @param decoder The symbolic state decoder.
+  @param images The preprocessed images.
+  @param batch_size The number of images decoded in one batch.
+  @return The decoded predicate strings of each image as a list of sets.
+  """
+
+  decoded = []
+  with Util.InferenceMode():
+    for i in range(0, len(images), batch_size):
+      s_dec_batch = Util.ImagesToDecoderStates(images[i:i+batch_size])
+      if hasattr(decoder, 'decode_states'):
+        decoded += [set(strs) for strs in decoder.decode_states(s_dec_batch)]
+      else:
+        decoded += [set(decoder.decode_state(s_dec_batch[j:j+1])) for j in range(s_dec_batch.shape[0])]
+
+  return decoded
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Compare the frame interpolations.')
+
+    parser.add_argument('--frame_dir', dest='frame_dir',
+                        type=str, default='../annotated_data/symbolic_states_room1',
+                        help="Directory of the annotated raw frames.")
+    parser.add_argument('--max_frames', dest='max_frames',
+                        type=int, default=None,
+                        help="Maximum number of frames to compare.")
+
+    parser_group = parser.add_mutually_exclusive_group(required=False)
+    parser_group.add_argument('--decode', dest='decode',
+                              action='store_true',
+                              help="Whether to compare the decoded symbolic states.")
+    parser_group.add_argument('--no-decode', dest='decode',
+                              action='store_false',
+                              help="Whether to compare the decoded symbolic states.")
+    parser.set_defaults(decode=True)
+
+    return parser.parse_args()
+
+
+def main():
+  args = parse_arguments()
+
+  frames = load_frames(args.frame_dir, args.max_frames)
+  if len(frames) == 0:
+    print('[ ERROR ] no frames found in %s' % (args.frame_dir))
+    return
+  print('[ INFO ] frames: %d' % (len(frames)))
+
+  # initialize symbolic state decoder
+  decoder = None
+  if args.decode:
+    from decoder.CNN_state_parser_pytorch import CNNModel as DecoderCNNModel
+
+    decoder_classes               = [14]
+    decoder_label_dir             = '../annotated_data/symbolic_states_room1'
+    decoder_frame_dir             = '../annotated_data/symbolic_states_room1'
+    decoder_predicates_file       = '../annotated_data/predicates.txt'
+    decoder_weights_dir           = '../model_weights'
+    decoder_pretrained_model_file = decoder_weights_dir + '/parser_epoch_17_loss_7.19790995944436e-05_valacc_0.9992972883597884.t7'
+
+    decoder = DecoderCNNModel(
+      decoder_classes,
+      pretrained_model_pth=decoder_pretrained_model_file,
+      text_dir=decoder_label_dir,
+      img_dir=decoder_frame_dir,
+      label_file=decoder_predicates_file,
+      weights_dir=decoder_weights_dir)
+
+  # the cubic interpolation is the reference the decoder was trained with
+  images_ref, t_ref = time_preprocessing(frames, Util.frame_interpolations['cubic'])
+  decoded_ref = None
+  if decoder is not None:
+    decoded_ref = decode_images(decoder, images_ref)
+
+  for name in sorted(Util.frame_interpolations.keys()):
+    images, t_frame = time_preprocessing(frames, Util.frame_interpolations[name])
+    errs = [np.mean(np.abs(image.astype(np.int16) - image_ref.astype(np.int16)))
+            for image, image_ref in zip(images, images_ref)]
+
+    msg = '[ INFO ] %-8s time: %7.1f us/frame (x%.2f)  pixel MAE: %6.3f' % (
+      name, t_frame * 1e6, t_ref / t_frame, np.mean(errs))
+
+    if decoded_ref is not None:
+      decoded = decode_images(decoder, images)
+      n_agree = sum(1 for strs, strs_ref in zip(decoded, decoded_ref) if strs == strs_ref)
+      msg += '  state agreement: %.4f' % (float(n_agree) / len(frames))
+
+    print(msg)
+
+
+if __name__ == '__main__':
+  main()
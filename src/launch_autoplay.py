@@ -13,14 +13,20 @@ __copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
 
 
 import sys
+import time
 import argparse
+import functools
 import numpy as np
 import gym
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PDDL import PDDLPlanner, show_plan
 from utils import LogicRLUtils as Util
-from decoder.CNN_state_parser_pytorch import CNNModel as DecoderCNNModel
-from RLAgents.RLAgents import RLAgents
+from utils.VecEnv import SerialVecEnv, SharedMemoryVecEnv, RepeatAction
+from utils.DecodeCache import DecodeCache
+from utils.RAMStateDecoder import RAMStateDecoder, LoadCalibration
+from utils.Instrumentation import Instrumentation, NullInstrumentation
+from utils.EventLog import EventLogger, StdoutSink, JSONLinesSink
 
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
@@ -28,23 +34,25 @@ import matplotlib.image as mpimg
 import pdb, IPython
 
 
-def print_symbolic_state_transition(s1, s2, prefix=''):
+def log_symbolic_state_transition(logger, planner, ss1, ss2, msg_prefix='', **fields):
   """
-  Print the difference between two symbolic states.
-
-  @param s1 The original symbolic state.
-  @param s2 The updated symbolic state.
-  @param prefix The prefix added to the front of each line.
+  Log the difference between two symbolic states, decoding it only if the 
+  event is logged.
+
+  @param logger The event logger.
+  @param planner The planner the symbolic states are encoded with.
+  @param ss1 The original symbolic state encoded as a bitset.
+  @param ss2 The updated symbolic state encoded as a bitset.
+  @param msg_prefix The prefix added to the front of the message.
+  @param fields Additional fields of the event, such as the environment.
   """
 
-  predicates_neg = s1.difference(s2)
-  predicates_pos = s2.difference(s1)
-
-  for p in predicates_neg:
-    print(prefix + '- ' + str(p))
+  if not logger.enabled_for('info', 'transition'):
+    return
 
-  for p in predicates_pos:
-    print(prefix + '+ ' + str(p))
+  logger.info('transition', msg_prefix + 'symbolic state transition: - %(removed)s + %(added)s', 
+              removed=sorted(planner.decode_state(ss1 & ~ss2)), 
+              added=sorted(planner.decode_state(ss2 & ~ss1)), **fields)
 
 
 class AutoAgent(object):
@@ -52,12 +60,18 @@ class AutoAgent(object):
   AutoAgent class.
   """
 
-  def __init__(self, env, decoder, fname_domain, fname_problem):
+  def __init__(self, env, decoder, fname_domain, fname_problem, 
+               plan_strategy='bfs', plan_heuristic='h_ff', plan_cache_dir=None, 
+               frame_interpolation=Util.frame_interpolation, decode_cache_size=4096, 
+               agents=None, instrumentation=None, logger=None):
     super(AutoAgent, self).__init__()
     
     self.env = env
     self.fname_domain = fname_domain
     self.fname_problem = fname_problem
+    self.plan_strategy = plan_strategy
+    self.plan_heuristic = plan_heuristic
+    self.frame_interpolation = frame_interpolation
 
     self.agent_running_cost   = -1
     self.agent_error_state_cost = -3
@@ -67,7 +81,10 @@ class AutoAgent(object):
     self.rl_state_shape = (84, 84, self.rl_state_joint)
 
     # initialize a symbolic planner
-    self.planner = PDDLPlanner(fname_domain, fname_problem)
+    self.planner = PDDLPlanner(fname_domain, fname_problem, 
+                               cache_dir=plan_cache_dir)
+    if self.plan_strategy == 'table':
+      self.planner.build_goal_distance_table()
     self.static_predicate_operators = [
       'keyReachable',
       'swordReachable',
@@ -80,24 +97,50 @@ class AutoAgent(object):
     # construct predefined initial state and static predicates
     self.static_predicates = set()
     self.predefined_initial_state = set()
-    for a in self.planner.predefined_initial_state:
+    for p in self.planner.predefined_initial_state:
       # construct initial state
-      self.predefined_initial_state.add(tuple(a.predicate))
+      self.predefined_initial_state.add(p)
 
       # construct static predicates
-      if a.predicate[0] in self.static_predicate_operators:
-        self.static_predicates.add(tuple(a.predicate))
+      if p[0] in self.static_predicate_operators:
+        self.static_predicates.add(p)
 
     # construct predefined goals
-    self.predefined_goals = set()
-    for a in self.planner.predefined_goals:
-      self.predefined_goals.add(tuple(a.predicate))
+    self.predefined_goals = set(self.planner.predefined_goals)
+
+    # intern the predicates as planner bitsets
+    # note: the decoded symbolic states are encoded as integer bitsets 
+    #       sharing the predicate indices of the planner, and each predicate 
+    #       string is parsed only the first time it is decoded.
+    self.predicate_bits = dict() # predicate string -> bitset
+    self.static_bits = self.planner.encode_state(self.static_predicates)
+    self.goal_bits = self.planner.encode_state(self.predefined_goals)
 
     # initialize a symbolic state decoder
     self.decoder = decoder
-
-    # initialize a RLAgents pool
-    self.agents = RLAgents(self.rl_state_shape, self.env.action_space.n)
+    self.decode_ram = getattr(decoder, 'decodes_ram', False)
+    self.decoder_encodes = hasattr(decoder, 'bind_predicate_bits')
+    if self.decoder_encodes:
+      decoder.bind_predicate_bits(self.predicateBits)
+    self.decode_cache = DecodeCache(decode_cache_size) if decode_cache_size > 0 else None
+
+    # initialize a RLAgents pool unless provided
+    if agents is None:
+      from RLAgents.RLAgents import RLAgents
+      agents = RLAgents(self.rl_state_shape, self.env.action_space.n)
+    self.agents = agents
+
+    # collect timings and counters if instrumented
+    # note: the null instrumentation keeps the disabled spans and counters to 
+    #       a method call doing nothing.
+    if instrumentation is None:
+      instrumentation = NullInstrumentation()
+    self.instrumentation = instrumentation
+
+    # log events through a buffered writer, printing them by default
+    if logger is None:
+      logger = EventLogger([StdoutSink()])
+    self.logger = logger
     
 
   def decodeSymbolicState(self, s_dec):
@@ -105,21 +148,204 @@ class AutoAgent(object):
     Decode symbolic state from a lower level state.
 
     @param s_dec The lower-level decoder state.
-    @return The corresponding symbolic state as a set of predicates.
+    @return The corresponding symbolic state encoded as a bitset.
+    """
+
+    with self.instrumentation.span('decoder'), Util.InferenceMode():
+      decoded_predicate_strs = self.decoder.decode_state(s_dec)
+
+    return self.symbolicStateFromPredicateStrs(decoded_predicate_strs)
+
+
+  def decodeSymbolicStates(self, s_dec_batch):
+    """
+    Decode symbolic states from a batch of lower level states.
+
+    The decoder runs a single forward pass over the whole batch if it provides 
+    a batched `decode_states` method, and decodes the states one by one with 
+    `decode_state` otherwise.
+
+    @param s_dec_batch The lower-level decoder states as an `Nx1xHxW` tensor.
+    @return A list of the `N` corresponding symbolic states encoded as 
+            bitsets.
+    """
+
+    with self.instrumentation.span('decoder'), Util.InferenceMode():
+      if hasattr(self.decoder, 'decode_states'):
+        batch_predicate_strs = self.decoder.decode_states(s_dec_batch)
+      else:
+        batch_predicate_strs = [self.decoder.decode_state(s_dec_batch[i:i+1]) 
+                                for i in range(len(s_dec_batch))]
+
+    return [self.symbolicStateFromPredicateStrs(decoded_predicate_strs) 
+            for decoded_predicate_strs in batch_predicate_strs]
+
+
+  def decodeSymbolicStateFromImage(self, image, stream=0):
+    """
+    Decode symbolic state from a preprocessed image, skipping the decoder if 
+    the image is unchanged or cached.
+
+    @param image The preprocessed image.
+    @param stream The identifier of the stream (e.g. environment) the image 
+                  comes from, against whose previous image changes are 
+                  detected.
+    @return The corresponding symbolic state encoded as a bitset.
+    """
+
+    if self.decode_cache is None:
+      return self.decodeSymbolicState(Util.ImageToDecoderState(image))
+
+    ss, key = self.decode_cache.lookup(image, stream)
+    if ss is None:
+      ss = self.decodeSymbolicState(Util.ImageToDecoderState(image))
+      self.decode_cache.store(image, key, ss, stream)
+
+    return ss
+
+
+  def decodeSymbolicStatesFromImages(self, images, streams):
+    """
+    Decode symbolic states from a list of preprocessed images, running the 
+    decoder in a single batch over the images that are neither unchanged nor 
+    cached.
+
+    @param images The preprocessed images.
+    @param streams The identifiers of the streams the images come from.
+    @return A list of the corresponding symbolic states encoded as bitsets.
+    """
+
+    if self.decode_cache is None:
+      return self.decodeSymbolicStates(Util.ImagesToDecoderStates(images))
+
+    sss = [None] * len(images)
+    misses = []
+    for i, (image, stream) in enumerate(zip(images, streams)):
+      sss[i], key = self.decode_cache.lookup(image, stream)
+      if sss[i] is None:
+        misses.append((i, key))
+
+    if len(misses) > 0:
+      sss_decoded = self.decodeSymbolicStates(
+        Util.ImagesToDecoderStates([images[i] for i, key in misses]))
+      for (i, key), ss in zip(misses, sss_decoded):
+        sss[i] = ss
+        self.decode_cache.store(images[i], key, ss, streams[i])
+
+    return sss
+
+
+  def decodeSymbolicStateFromRAM(self, ram):
+    """
+    Decode symbolic state from the Atari RAM, with a decoder that decodes RAM.
+
+    @param ram The RAM of the environment.
+    @return The corresponding symbolic state encoded as a bitset.
+    """
+
+    if self.decoder_encodes:
+      return self.static_bits | self.decoder.encode_state(ram)
+
+    return self.symbolicStateFromPredicateStrs(self.decoder.decode_state(ram))
+
+
+  def decodeSymbolicStatesFromRAMs(self, rams):
+    """
+    Decode symbolic states from a list of Atari RAMs, with a decoder that 
+    decodes RAM.
+
+    @param rams The RAMs of the environments.
+    @return A list of the corresponding symbolic states encoded as bitsets.
+    """
+
+    if self.decoder_encodes:
+      return [self.static_bits | bits for bits in self.decoder.encode_states(np.stack(rams))]
+
+    return [self.symbolicStateFromPredicateStrs(decoded_predicate_strs) 
+            for decoded_predicate_strs in self.decoder.decode_states(np.stack(rams))]
+
+
+  def readRAM(self, env):
     """
+    Read the Atari RAM of an environment if the decoder decodes RAM.
 
-    decoded_predicate_strs = set(self.decoder.decode_state(s_dec))
-    symbolic_state = set()
+    @param env The environment.
+    @return The RAM of the environment, or `None` if the decoder decodes 
+            frames.
+    """
+
+    if not self.decode_ram:
+      return None
+
+    return env.unwrapped.ale.getRAM()
+
+
+  def decodeObservation(self, image, ram=None):
+    """
+    Decode symbolic state from an observation, reading the RAM if the decoder 
+    decodes RAM and the preprocessed image otherwise.
+
+    @param image The preprocessed image.
+    @param ram The RAM of the environment, see `readRAM`.
+    @return The corresponding symbolic state encoded as a bitset.
+    """
+
+    if self.decode_ram:
+      return self.decodeSymbolicStateFromRAM(ram)
+
+    return self.decodeSymbolicStateFromImage(image)
+
+
+  def showDecodeCacheStats(self):
+    """
+    Log the decode cache counters.
+    """
+
+    if self.decode_cache is None:
+      return
+
+    self.logger.info('decode_cache', 
+      'decode cache: hit rate %(hit_rate).3f (unchanged: %(unchanged)d, hits: %(hits)d, misses: %(misses)d, size: %(size)d / %(capacity)d)', 
+      **self.decode_cache.stats())
+
+
+  def symbolicStateFromPredicateStrs(self, decoded_predicate_strs):
+    """
+    Construct a symbolic state from decoded predicate strings.
+
+    @param decoded_predicate_strs The predicate strings from the decoder, each 
+                                  of which is comma-separated.
+    @return The corresponding symbolic state encoded as a bitset, including 
+            the static predicates.
+    """
+
+    symbolic_state = self.static_bits
 
     for predstr in decoded_predicate_strs:
-      predicate = tuple(predstr.split(','))
-      symbolic_state.add(predicate)
-    
-    symbolic_state = symbolic_state.union(self.static_predicates)
+      bits = self.predicate_bits.get(predstr)
+      if bits is None:
+        bits = self.predicateBits(predstr)
+      symbolic_state |= bits
 
     return symbolic_state
 
 
+  def predicateBits(self, predstr):
+    """
+    Intern a predicate string as a planner bitset.
+
+    @param predstr The comma-separated predicate string.
+    @return The bitset with the bit of the predicate set.
+    """
+
+    bits = self.predicate_bits.get(predstr)
+    if bits is None:
+      bits = self.planner.encode_state([tuple(predstr.split(','))])
+      self.predicate_bits[predstr] = bits
+
+    return bits
+
+
   def predictActionByAgent(self, agent_name, s_rl):
     """
     Predict an action to take by an agent at a specific state.
@@ -129,7 +355,8 @@ class AutoAgent(object):
     @return The lower-level action predicted by the agent to take.
     """
 
-    a = self.agents.execute(agent_name, s_rl)
+    with self.instrumentation.span('agent_execute'):
+      a = self.agents.execute(agent_name, s_rl)
 
     return a
 
@@ -146,7 +373,8 @@ class AutoAgent(object):
     @param done A boolean indicating if an episode ends.
     """
 
-    self.agents.feedback(agent_name, (s_rl, a, s_rl_next, r_rl, done))
+    with self.instrumentation.span('agent_feedback'):
+      self.agents.feedback(agent_name, (s_rl, a, s_rl_next, r_rl, done))
 
 
   def findSymbolicPlan(self, ss):
@@ -157,168 +385,546 @@ class AutoAgent(object):
     @return A plan found. `None` will be returned if no plan is found.
     """
 
-    plan = self.planner.find_plan(initial_state=ss, goals=None) # using default goals
+    with self.instrumentation.span('plan'):
+      plan = self.planner.find_plan(initial_state=ss, goals=None, # using default goals
+                                    strategy=self.plan_strategy, 
+                                    heuristic=self.plan_heuristic, 
+                                    encoded=True)
+
+    self.instrumentation.count('plans')
+    self.observePlan(plan)
 
     return plan
 
 
-  def autoplay(self, max_episodes=int(1e6), ss_errtol=0, learn=True, pause_plan=False, render=False, verbose=False):
+  def advanceSymbolicPlan(self, plan, ss, replan=True):
+    """
+    Advance a symbolic plan to an observed symbolic state, reusing the plan 
+    suffix if the state is on the plan and repairing the plan otherwise.
+
+    @param plan The current symbolic plan.
+    @param ss The observed symbolic state.
+    @param replan The switch to replan from scratch if the plan cannot be 
+                  repaired.
+    @return A plan found. `None` will be returned if no plan is found, or if 
+            the plan cannot be repaired and `replan` is disabled.
+    """
+
+    with self.instrumentation.span('plan_advance'):
+      plan = self.planner.advance(plan, ss, goals=None, # using default goals
+                                  strategy=self.plan_strategy, 
+                                  heuristic=self.plan_heuristic, 
+                                  replan=replan)
+
+    # count the advances leaving the plan, which are repaired or replanned
+    self.instrumentation.count('plan_advances')
+    if self.planner.last_advance == 'repair':
+      self.instrumentation.count('plan_repairs')
+    elif self.planner.last_advance == 'replan':
+      self.instrumentation.count('replans')
+    elif self.planner.last_advance == 'fail':
+      self.instrumentation.count('plan_repair_failures')
+      return None
+    self.observePlan(plan)
+
+    return plan
+
+
+  def observePlan(self, plan):
+    """
+    Record the length of a symbolic plan, or a planning failure if no plan is 
+    found.
+
+    @param plan The symbolic plan.
+    """
+
+    if plan is None:
+      self.instrumentation.count('plan_failures')
+    else:
+      self.instrumentation.observe('plan_length', len(plan) - 1)
+
+
+  def evaluateSymbolicTransition(self, plan, ss_next, ss_errcnt, ss_errtol, 
+                                 verbose=False):
+    """
+    Evaluate a symbolic state transition against the plan step being executed, 
+    and advance the plan to the symbolic state reached. A symbolic state off 
+    the plan is first repaired, and counted as a symbolic state error only if 
+    the repair fails.
+
+    @param plan The current symbolic plan.
+    @param ss_next The symbolic state reached.
+    @param ss_errcnt The symbolic state error counter.
+    @param ss_errtol The symbolic state decoding error tolerance.
+    @param verbose The switch to enable verbose log.
+    @return A tuple `(r_rl, ss_errcnt, outcome, plan)` of the reward for the 
+            RL agent, the updated symbolic state error counter, the outcome, 
+            which is `remain` if the symbolic state remains, `step` if the plan 
+            step is executed, `repair` if the plan is repaired to a symbolic 
+            state off the plan, `error` if a tolerated symbolic state error is 
+            detected, or `fail` if the subtask fails, and the advanced plan.
+    """
+
+    # extract states and operator from plan
+    ss_cur = plan[0][1]
+    op_next = plan[1][0]
+    ss_next_expected = plan[1][1]
+
+    if ss_next == ss_cur:
+      # assign subtask reward
+      r_rl = self.agent_running_cost
+
+      # reset symbolic state error counter
+      if ss_errcnt > 0:
+        self.instrumentation.count('ss_errcnt_resets')
+      ss_errcnt = 0
+
+      # print verbose message
+      if verbose:
+        self.logger.debug('ss_remain', 'symbolic state remains (r_rl: %(r_rl)f, op: %(op)s)', 
+                          r_rl=r_rl, op=op_next)
+
+      return (r_rl, ss_errcnt, 'remain', plan)
+
+    if ss_next == ss_next_expected:
+      # assign subtask reward
+      r_rl = self.agent_subgoal_reward
+
+      # reset symbolic state error counter
+      if ss_errcnt > 0:
+        self.instrumentation.count('ss_errcnt_resets')
+      ss_errcnt = 0
+
+      # print verbose message
+      if verbose:
+        self.logger.debug('ss_step', 'symbolic plan step executed (r_rl: %(r_rl)f, op: %(op)s)', 
+                          r_rl=r_rl, op=op_next)
+
+      # advance the plan due to symbolic state change
+      plan = self.advanceSymbolicPlan(plan, ss_next)
+
+      return (r_rl, ss_errcnt, 'step', plan)
+
+    # note: the plan is not replanned from scratch from a symbolic state off 
+    #       the plan, which may be a decoding error.
+    plan_repaired = self.advanceSymbolicPlan(plan, ss_next, replan=False)
+    if plan_repaired is not None:
+      # assign subtask reward
+      r_rl = self.agent_error_state_cost
+
+      # reset symbolic state error counter
+      if ss_errcnt > 0:
+        self.instrumentation.count('ss_errcnt_resets')
+      ss_errcnt = 0
+
+      # print verbose message
+      if verbose:
+        self.logger.debug('ss_repair', 'symbolic plan repaired (r_rl: %(r_rl)f, op: %(op)s)', 
+                          r_rl=r_rl, op=op_next)
+
+      return (r_rl, ss_errcnt, 'repair', plan_repaired)
+
+    if ss_errcnt < ss_errtol:
+      # assign subtask reward
+      r_rl = self.agent_error_state_cost
+
+      # accumulate symbolic state error
+      ss_errcnt += 1
+      self.instrumentation.count('decoder_errors')
+
+      # print verbose message
+      if verbose:
+        self.logger.debug('ss_error', 'symbolic state error detected (errcnt: %(errcnt)d/%(errtol)d, r_rl: %(r_rl)f, op: %(op)s)', 
+                          errcnt=ss_errcnt, errtol=ss_errtol, r_rl=r_rl, op=op_next)
+
+      return (r_rl, ss_errcnt, 'error', plan)
+
+    # assign subtask reward
+    r_rl = self.agent_failure_cost
+    self.instrumentation.count('subtask_failures')
+
+    # print verbose message
+    if verbose:
+      self.logger.debug('subtask_failed', 'subtask failed (r_rl: %(r_rl)f, op: %(op)s)', 
+                        r_rl=r_rl, op=op_next)
+
+    return (r_rl, ss_errcnt, 'fail', plan)
+
+
+  def autoplay(self, max_episodes=int(1e6), ss_errtol=0, learn=True, pause_plan=False, render=False, frame_skip=1, decode_lag=0, verbose=False):
     """
     Play autonomously and learn online.
 
+    With a positive `decode_lag`, the symbolic states are decoded on a worker 
+    thread while the emulator keeps producing the following frames, with at 
+    most `decode_lag` decoded transitions in flight. The plan, and hence the 
+    subtask agent picking the actions, then lags the emulator by up to 
+    `decode_lag` steps. The rewards are still determined on consecutive 
+    decoded states and fed back in order, only delayed. Transitions still in 
+    flight when the plan completes or fails are discarded.
+
     @param max_episodes The maximum number of episodes to run the AutoAgent.
     @param ss_errtol The symbolic state decoding error tolerance.
     @param learn The switch to enable online learning.
     @param pause_plan The switch to pause while showing the initial plan.
     @param render The switch to enable rendering.
+    @param frame_skip The number of frames to repeat each action for, so that 
+                      decoding, plan checks and agent inference happen once 
+                      every `frame_skip` frames on the max-pooled last two 
+                      frames. (default: 1)
+    @param decode_lag The maximum number of steps the symbolic state decoding 
+                      may lag behind the emulator. `0` decodes synchronously. 
+                      (default: 0)
     @param verbose The switch to enable verbose log.
     @return A boolean indicating if the agent solve the game within the maximum 
             number of episodes.
     """
 
     env = self.env
+    instrumentation = self.instrumentation
 
-    q_rl_frames = deque(maxlen=self.rl_state_joint)
+    rl_frame_stack = Util.RLFrameStack(self.rl_state_joint)
     q_rl_rewards = deque(maxlen=self.rl_state_joint)
 
-    g = self.predefined_goals # already converted to predicate sets
+    # transitions whose symbolic states are being decoded
+    # note: each entry is a tuple `(ss_next, agent_name, s_rl, a, s_rl_next, 
+    #       done)`, where `ss_next` is a future if decoded asynchronously.
+    in_flight = deque()
+    executor = ThreadPoolExecutor(max_workers=1) if decode_lag > 0 else None
+
+    g = self.goal_bits # already encoded as a bitset
+
+    try:
+      # loop through the episodes
+      for episode in range(max_episodes):
+        self.logger.info('episode', 'episode: %(episode)d / %(max_episodes)d', 
+                         episode=episode, max_episodes=max_episodes)
+
+        # reset the environment
+        frame = env.reset()
+        t_start = time.time()
+        n_steps = 0
+
+        # initialize states
+        image = Util.PreprocessFrame(frame, self.frame_interpolation)
+        ss = self.decodeObservation(image, self.readRAM(env))
+        rl_frame_stack.resetImage(image)
+        for i in range(self.rl_state_joint):
+          q_rl_rewards.append(0)
+        s_rl = rl_frame_stack.state()
 
-    # loop through the episodes
-    for episode in range(max_episodes):
-      if verbose:
-        print('')
-      print('[ INFO ] episode: %d / %d' % (episode, max_episodes))
-
-      # reset the environment
-      frame = env.reset()
-
-      # initialize states
-      s_dec = Util.FrameToDecoderState(frame)
-      ss = self.decodeSymbolicState(s_dec)
-      for i in range(self.rl_state_joint):
-        q_rl_frames.append(frame)
-        q_rl_rewards.append(0)
-      s_rl = Util.FramesToRLState(list(q_rl_frames))
-
-      # render if requested
-      if render:
-        env.render()
-
-      # find initial symbolic plan
-      plan = self.findSymbolicPlan(ss)
-      if episode == 0:
-        print('initial plan:')
-        show_plan(plan)
-        if pause_plan:
+        # render if requested
+        if render:
+          env.render()
+
+        # find initial symbolic plan
+        plan = self.findSymbolicPlan(ss)
+        if episode == 0:
+          self.logger.flush()
+          print('initial plan:')
+          show_plan(self.planner.decode_plan(plan))
+          if pause_plan:
+            print('')
+            input('press ENTER to start autoplay..')
           print('')
-          input('press ENTER to start autoplay..')
-        print('')
 
-      done = False
-      ss_errcnt = 0
-      while not done:
+        done = False
+        ss_errcnt = 0
+        while not done:
+          # check if a feasible plan exists
+          if plan is None or len(plan) == 0:
+            done = True
+            if verbose:
+              self.logger.debug('plan_infeasible', 'failed to find feasible plan')
+            continue
+
+          # check if the goal already satisfied
+          if len(plan) == 1:
+            assert(plan[0][1] & g == g)
+            done = True
+            continue
+            if verbose:
+              self.logger.debug('goal_satisfied', 'subgoal satisfied')
+
+          # predict the lower-level action to take
+          agent_name = plan[1][0].key
+          a = self.predictActionByAgent(agent_name, s_rl)
+
+          # execute the lower-level action
+          with instrumentation.span('env_step'):
+            frame_next, r_env, done, info = RepeatAction(env, a, frame_skip)
+          n_steps += 1
+          instrumentation.count('steps')
+          instrumentation.count('frames', frame_skip)
+
+          # convert states
+          with instrumentation.span('preprocess'):
+            image_next = Util.PreprocessFrame(frame_next, self.frame_interpolation)
+            ram_next = self.readRAM(env)
+          if executor is None:
+            with instrumentation.span('decode'):
+              ss_next = self.decodeObservation(image_next, ram_next)
+          else:
+            ss_next = executor.submit(self.decodeObservation, image_next, ram_next)
+          rl_frame_stack.appendImage(image_next)
+          s_rl_next = rl_frame_stack.state()
+          in_flight.append((ss_next, agent_name, s_rl, a, s_rl_next, done))
+          s_rl = s_rl_next
+
+          # render if requested
+          if render:
+            with instrumentation.span('render'):
+              env.render()
+
+          # evaluate the transitions due, or all of them at the end of episode
+          while len(in_flight) > decode_lag or (done and len(in_flight) > 0):
+            if plan is None or len(plan) < 2:
+              break
+
+            ss_next, agent_name_k, s_rl_k, a_k, s_rl_next_k, done_k = in_flight.popleft()
+            if executor is not None:
+              with instrumentation.span('decode_wait'):
+                ss_next = ss_next.result()
+
+            # print state transition
+            if ss_next != ss:
+              log_symbolic_state_transition(self.logger, self.planner, ss, ss_next)
+
+            # determine reward for RL agent and advance the plan
+            r_rl, ss_errcnt, outcome, plan = self.evaluateSymbolicTransition(
+              plan, ss_next, ss_errcnt, ss_errtol, verbose=verbose)
+
+            if outcome == 'fail':
+              done_k = True
+              done = True
+
+            # update subtask reward queue
+            q_rl_rewards.append(r_rl)
+
+            # feedback to agent
+            r_rl_mean = np.mean(q_rl_rewards)
+            self.feedbackToAgent(agent_name_k, s_rl_k, a_k, s_rl_next_k, r_rl_mean, done_k)
+
+            # update states
+            ss = ss_next
+
+            if done_k:
+              break
+
+          # dump the instrumentation periodically
+          instrumentation.maybe_dump()
+
+        # discard the transitions still in flight
+        for entry in in_flight:
+          if executor is not None:
+            entry[0].result()
+        in_flight.clear()
+
+        # report throughput
+        t_elapsed = max(time.time() - t_start, 1e-9)
+        self.logger.info('throughput', 
+          'steps: %(steps)d (%(steps_per_s).1f steps/s, %(frames_per_s).1f frames/s with frame skip %(frame_skip)d)', 
+          steps=n_steps, steps_per_s=n_steps / t_elapsed, 
+          frames_per_s=n_steps * frame_skip / t_elapsed, frame_skip=frame_skip)
+        instrumentation.count('episodes')
+
+        if verbose:
+          self.showDecodeCacheStats()
+
+    finally:
+      if executor is not None:
+        executor.shutdown(wait=True)
+      instrumentation.dump()
+
+    return False
+
+
+  def autoplayVectorized(self, venv, max_episodes=int(1e6), ss_errtol=0, learn=True, frame_skip=1, verbose=False):
+    """
+    Play autonomously and learn online in multiple environments in lockstep, 
+    sharing the planner, the decoder and the RL agents. Decoder calls are 
+    batched across the environments at every step, and each environment 
+    keeps its own symbolic plan, error counter and frame stack.
+
+    @param venv The vectorized environment, such as a `SerialVecEnv` or a 
+                `SharedMemoryVecEnv`.
+    @param max_episodes The maximum number of episodes to run the AutoAgent, 
+                        counted across all environments.
+    @param ss_errtol The symbolic state decoding error tolerance.
+    @param learn The switch to enable online learning.
+    @param frame_skip The number of frames to repeat each action for, see 
+                      `autoplay`. (default: 1)
+    @param verbose The switch to enable verbose log.
+    @return A boolean indicating if the agent solve the game within the maximum 
+            number of episodes.
+    """
+
+    instrumentation = self.instrumentation
+    slots = [AutoplaySlot(self.rl_state_joint) for i in range(venv.num_envs)]
+
+    t_start = time.time()
+    n_steps = 0
+
+    episode = 0
+    while True:
+      # reset the environments whose episodes ended
+      reset_ids = []
+      for i, slot in enumerate(slots):
+        if slot.needs_reset:
+          slot.needs_reset = False
+          slot.active = episode < max_episodes
+          if slot.active:
+            slot.episode = episode
+            reset_ids.append(i)
+            episode += 1
+
+      if len(reset_ids) > 0:
+        images = [Util.PreprocessFrame(venv.reset(i), self.frame_interpolation) for i in reset_ids]
+        if self.decode_ram:
+          sss = self.decodeSymbolicStatesFromRAMs([venv.get_ram(i) for i in reset_ids])
+        else:
+          sss = self.decodeSymbolicStatesFromImages(images, reset_ids)
+        for i, image, ss in zip(reset_ids, images, sss):
+          slots[i].reset(image, ss, self.findSymbolicPlan(ss))
+          self.logger.info('episode', 'episode: %(episode)d / %(max_episodes)d (env: %(env)d)', 
+                           episode=slots[i].episode, max_episodes=max_episodes, env=i)
+
+      # predict the lower-level actions to take
+      actions = [None] * venv.num_envs
+      for i, slot in enumerate(slots):
+        if not slot.active:
+          continue
+
         # check if a feasible plan exists
-        if plan is None or len(plan) == 0:
-          done = True
+        if slot.plan is None or len(slot.plan) == 0:
+          slot.needs_reset = True
+          instrumentation.count('episodes')
           if verbose:
-            print('[ INFO ] failed to find feasible plan')
+            self.logger.debug('plan_infeasible', 'failed to find feasible plan (env: %(env)d)', env=i)
           continue
 
         # check if the goal already satisfied
-        if len(plan) == 1:
-          assert(len(plan[0][1].intersection(g)) == len(g))
-          done = True
-          continue
+        if len(slot.plan) == 1:
+          slot.needs_reset = True
+          instrumentation.count('episodes')
           if verbose:
-            print('[ INFO ] subgoal satisfied')
-          
-        # extract states and operator from plan
-        ss_cur = plan[0][1]
-        op_next = plan[1][0]
-        ss_next_expected = plan[1][1]
-
-        # predict the lower-level action to take
-        agent_name = op_next
-        a = self.predictActionByAgent(agent_name, s_rl)
-
-        # execute the lower-level action
-        frame_next, r_env, done, info = env.step(a)
-
-        # convert states
-        s_dec_next = Util.FrameToDecoderState(frame)
-        ss_next = self.decodeSymbolicState(s_dec_next)
-        q_rl_frames.append(frame)
-        s_rl_next = Util.FramesToRLState(list(q_rl_frames))
+            self.logger.debug('goal_satisfied', 'subgoal satisfied (env: %(env)d)', env=i)
+          continue
 
-        # print state transition
-        if len(ss.difference(ss_next)) > 0 or len(ss_next.difference(ss)) > 0:
-          print_symbolic_state_transition(ss, ss_next)
+        actions[i] = self.predictActionByAgent(slot.plan[1][0].key, slot.s_rl)
 
-        # determine reward for RL agent
-        r_rl = 0
-        if ss_next == ss_cur:
-          # assign subtask reward
-          r_rl = self.agent_running_cost
+      stepped_ids = [i for i in range(venv.num_envs) if actions[i] is not None]
+      if len(stepped_ids) == 0:
+        if any(slot.needs_reset for slot in slots):
+          continue
+        break
+
+      # execute the lower-level actions
+      with instrumentation.span('env_step'):
+        frames_next, r_envs, dones, infos = venv.step(actions, frame_skip)
+      n_steps += len(stepped_ids)
+      instrumentation.count('steps', len(stepped_ids))
+      instrumentation.count('frames', len(stepped_ids) * frame_skip)
+
+      # convert states
+      with instrumentation.span('preprocess'):
+        images_next = [Util.PreprocessFrame(frames_next[i], self.frame_interpolation) for i in stepped_ids]
+      with instrumentation.span('decode'):
+        if self.decode_ram:
+          sss_next = self.decodeSymbolicStatesFromRAMs([venv.get_ram(i) for i in stepped_ids])
+        else:
+          sss_next = self.decodeSymbolicStatesFromImages(images_next, stepped_ids)
 
-          # reset symbolic state error counter
-          ss_errcnt = 0
+      for i, image_next, ss_next in zip(stepped_ids, images_next, sss_next):
+        slot = slots[i]
 
-          # print verbose message
-          if verbose:
-            print('[ INFO ] symbolic state remains (r_rl: %f, op: %s)' % (r_rl, op_next))
+        # extract the agent of the plan step being executed
+        agent_name = slot.plan[1][0].key
 
-        elif ss_next == ss_next_expected:
-          # assign subtask reward
-          r_rl = self.agent_subgoal_reward
+        slot.rl_frame_stack.appendImage(image_next)
+        s_rl_next = slot.rl_frame_stack.state()
 
-          # reset symbolic state error counter
-          ss_errcnt = 0
+        # print state transition
+        if ss_next != slot.ss:
+          log_symbolic_state_transition(
+            self.logger, self.planner, slot.ss, ss_next, msg_prefix='(env: %(env)d) ', env=i)
 
-          # print verbose message
-          if verbose:
-            print('[ INFO ] symbolic plan step executed (r_rl: %f, op: %s)' % (r_rl, op_next))
+        # determine reward for RL agent and advance the plan
+        r_rl, slot.ss_errcnt, outcome, slot.plan = self.evaluateSymbolicTransition(
+          slot.plan, ss_next, slot.ss_errcnt, ss_errtol, verbose=verbose)
 
-          # replan due to symbolic state change
-          plan = self.findSymbolicPlan(ss_next)
+        done = dones[i]
+        if outcome == 'fail':
+          done = True
 
-        elif ss_errcnt < ss_errtol:
-          # assign subtask reward
-          r_rl = self.agent_error_state_cost
+        # feedback to agent
+        slot.q_rl_rewards.append(r_rl)
+        r_rl_mean = np.mean(slot.q_rl_rewards)
+        self.feedbackToAgent(agent_name, slot.s_rl, actions[i], s_rl_next, r_rl_mean, done)
 
-          # accumulate symbolic state error
-          ss_errcnt += 1
+        # update states
+        slot.ss = ss_next
+        slot.s_rl = s_rl_next
+        slot.needs_reset = done
+        if done:
+          instrumentation.count('episodes')
+
+      # dump the instrumentation periodically
+      instrumentation.maybe_dump()
+
+    # report throughput
+    t_elapsed = max(time.time() - t_start, 1e-9)
+    self.logger.info('throughput', 
+      'steps: %(steps)d (%(steps_per_s).1f steps/s, %(frames_per_s).1f frames/s with frame skip %(frame_skip)d)', 
+      steps=n_steps, steps_per_s=n_steps / t_elapsed, 
+      frames_per_s=n_steps * frame_skip / t_elapsed, frame_skip=frame_skip)
+    instrumentation.dump()
+
+    if verbose:
+      self.showDecodeCacheStats()
 
-          # print verbose message
-          if verbose:
-            print('[ INFO ] symbolic state error detected (errcnt: %d/%d, r_rl: %f, op: %s)' % (ss_errcnt, ss_errtol, r_rl, op_next))
+    return False
 
-        else:
-          # assign subtask reward
-          r_rl = self.agent_failure_cost
-          done = True
 
-          # print verbose message
-          if verbose:
-            print('[ INFO ] subtask failed (r_rl: %f, op: %s)' % (r_rl, op_next))
+class AutoplaySlot(object):
+  """
+  Per-environment state of the vectorized autoplay.
+  """
 
-        # update subtask reward queue
-        q_rl_rewards.append(r_rl)
+  def __init__(self, rl_state_joint):
+    super(AutoplaySlot, self).__init__()
 
-        # render if requested
-        if render:
-          env.render()
+    self.rl_state_joint = rl_state_joint
+    self.rl_frame_stack = Util.RLFrameStack(rl_state_joint)
+    self.q_rl_rewards = deque(maxlen=rl_state_joint)
 
-        # feedback to agent
-        r_rl_mean = np.mean(q_rl_rewards)
-        self.feedbackToAgent(agent_name, s_rl, a, s_rl_next, r_rl_mean, done)
+    self.active = False
+    self.needs_reset = True
+    self.episode = None
 
-        # update states
-        frame = frame_next
-        s_dec = s_dec_next
-        ss = ss_next
-        s_rl = s_rl_next
+    self.ss = None
+    self.s_rl = None
+    self.plan = None
+    self.ss_errcnt = 0
 
-    return False
+
+  def reset(self, image, ss, plan):
+    """
+    Reset the state at the beginning of an episode.
+
+    @param image The initial preprocessed image.
+    @param ss The initial symbolic state.
+    @param plan The initial symbolic plan.
+    """
+
+    self.rl_frame_stack.resetImage(image)
+    for i in range(self.rl_state_joint):
+      self.q_rl_rewards.append(0)
+
+    self.ss = ss
+    self.s_rl = self.rl_frame_stack.state()
+    self.plan = plan
+    self.ss_errcnt = 0
 
 
 def parse_arguments():
@@ -347,6 +953,74 @@ def parse_arguments():
                               help="Whether to pause while showing the initial plan.")
     parser.set_defaults(plan=False)
 
+    parser.add_argument('--num_envs', dest='num_envs',
+                        type=int, default=1,
+                        help="Number of environments to play in lockstep.")
+
+    parser_group = parser.add_mutually_exclusive_group(required=False)
+    parser_group.add_argument('--env_workers', dest='env_workers',
+                              action='store_true',
+                              help="Whether to step environments in worker processes.")
+    parser_group.add_argument('--no-env_workers', dest='env_workers',
+                              action='store_false',
+                              help="Whether to step environments in worker processes.")
+    parser.set_defaults(env_workers=False)
+
+    parser.add_argument('--plan_strategy', dest='plan_strategy',
+                        type=str, default='bfs',
+                        choices=['bfs', 'astar', 'wastar', 'gbfs', 'table'],
+                        help="Search strategy of the symbolic planner.")
+    parser.add_argument('--plan_heuristic', dest='plan_heuristic',
+                        type=str, default='h_ff',
+                        choices=['h_add', 'h_max', 'h_ff'],
+                        help="Heuristic of the informed search strategies.")
+    parser.add_argument('--frame_interpolation', dest='frame_interpolation',
+                        type=str, default='cubic',
+                        choices=sorted(Util.frame_interpolations.keys()),
+                        help="Interpolation used to downscale the raw frames.")
+    parser.add_argument('--frame_skip', dest='frame_skip',
+                        type=int, default=1,
+                        help="Number of frames to repeat each action for.")
+    parser.add_argument('--decode_lag', dest='decode_lag',
+                        type=int, default=0,
+                        help="Maximum number of steps the decoding may lag behind the emulator (0 to decode synchronously).")
+    parser.add_argument('--decoder', dest='decoder',
+                        type=str, default='cnn',
+                        choices=['cnn', 'ram'],
+                        help="Symbolic state decoder reading the frames (cnn) or the Atari RAM (ram, calibrated with launch_ram_calibration.py).")
+    parser.add_argument('--decode_cache_size', dest='decode_cache_size',
+                        type=int, default=4096,
+                        help="Number of decoded frames to cache (0 to disable).")
+    parser.add_argument('--instrument', dest='instrument',
+                        type=str, default=None,
+                        help="File to dump the per-stage timings and counters to (disabled if not given).")
+    parser.add_argument('--instrument_format', dest='instrument_format',
+                        type=str, default='jsonl',
+                        choices=['jsonl', 'prometheus'],
+                        help="Format of the instrumentation dumps.")
+    parser.add_argument('--instrument_interval', dest='instrument_interval',
+                        type=float, default=10.0,
+                        help="Interval between the instrumentation dumps in seconds.")
+    parser.add_argument('--log_level', dest='log_level',
+                        type=str, default='info',
+                        choices=['debug', 'info', 'warn', 'error'],
+                        help="Minimum level of the events to log (debug logs every step).")
+    parser.add_argument('--log_file', dest='log_file',
+                        type=str, default=None,
+                        help="File to append the events to as JSON lines.")
+    parser.add_argument('--log_sample', dest='log_sample',
+                        type=int, default=1,
+                        help="Log only every N-th of the per-step events.")
+
+    parser_group = parser.add_mutually_exclusive_group(required=False)
+    parser_group.add_argument('--log_stdout', dest='log_stdout',
+                              action='store_true',
+                              help="Whether to print the events to stdout.")
+    parser_group.add_argument('--no-log_stdout', dest='log_stdout',
+                              action='store_false',
+                              help="Whether to print the events to stdout.")
+    parser.set_defaults(log_stdout=True)
+
     return parser.parse_args()
 
 
@@ -355,32 +1029,76 @@ def main():
 
   fname_domain = '../PDDL/domain.pddl'
   fname_problem = '../PDDL/problem_room1.pddl'
+  plan_cache_dir = '../PDDL/.cache'
   
-  # initialize environment
-  env = gym.make('MontezumaRevenge-v0')
+  # initialize environments
+  if args.env_workers:
+    venv = SharedMemoryVecEnv(
+      [functools.partial(gym.make, 'MontezumaRevenge-v0') for i in range(args.num_envs)])
+    env = venv
+  else:
+    venv = SerialVecEnv([gym.make('MontezumaRevenge-v0') for i in range(args.num_envs)])
+    env = venv.envs[0]
 
   # initialize symbolic state decoder
-  decoder_classes               = [14]
-  decoder_label_dir             = '../annotated_data/symbolic_states_room1' 
-  decoder_frame_dir             = '../annotated_data/symbolic_states_room1' 
-  decoder_predicates_file       = '../annotated_data/predicates.txt'
-  decoder_weights_dir           = '../model_weights'
-  decoder_pretrained_model_file = decoder_weights_dir + '/parser_epoch_17_loss_7.19790995944436e-05_valacc_0.9992972883597884.t7'
-
-  decoder = DecoderCNNModel(
-    decoder_classes,
-    pretrained_model_pth=decoder_pretrained_model_file,
-    text_dir=decoder_label_dir,
-    img_dir=decoder_frame_dir,
-    label_file=decoder_predicates_file,
-    weights_dir=decoder_weights_dir)
+  if args.decoder == 'ram':
+    decoder_ram_calibration_file = '../annotated_data/ram_calibration_room1.json'
+    decoder = RAMStateDecoder(*LoadCalibration(decoder_ram_calibration_file))
+  else:
+    from decoder.CNN_state_parser_pytorch import CNNModel as DecoderCNNModel
+
+    decoder_classes               = [14]
+    decoder_label_dir             = '../annotated_data/symbolic_states_room1' 
+    decoder_frame_dir             = '../annotated_data/symbolic_states_room1' 
+    decoder_predicates_file       = '../annotated_data/predicates.txt'
+    decoder_weights_dir           = '../model_weights'
+    decoder_pretrained_model_file = decoder_weights_dir + '/parser_epoch_17_loss_7.19790995944436e-05_valacc_0.9992972883597884.t7'
+
+    decoder = DecoderCNNModel(
+      decoder_classes,
+      pretrained_model_pth=decoder_pretrained_model_file,
+      text_dir=decoder_label_dir,
+      img_dir=decoder_frame_dir,
+      label_file=decoder_predicates_file,
+      weights_dir=decoder_weights_dir)
+
+  # initialize instrumentation if requested
+  instrumentation = None
+  if args.instrument is not None:
+    instrumentation = Instrumentation(
+      args.instrument, fmt=args.instrument_format, interval=args.instrument_interval, 
+      labels={'decoder': args.decoder, 'plan_strategy': args.plan_strategy})
+
+  # initialize event logger
+  sinks = []
+  if args.log_stdout:
+    sinks.append(StdoutSink())
+  if args.log_file is not None:
+    sinks.append(JSONLinesSink(args.log_file))
+  logger = EventLogger(sinks, level=args.log_level, 
+                       sample=dict((event, args.log_sample) for event in ['ss_remain', 'ss_error']))
+  verbose = logger.enabled_for('debug')
 
   # initialize agent
-  agent = AutoAgent(env, decoder, fname_domain, fname_problem)
+  agent = AutoAgent(env, decoder, fname_domain, fname_problem, 
+                    plan_strategy=args.plan_strategy, 
+                    plan_heuristic=args.plan_heuristic, 
+                    plan_cache_dir=plan_cache_dir, 
+                    frame_interpolation=Util.frame_interpolations[args.frame_interpolation], 
+                    decode_cache_size=args.decode_cache_size, 
+                    instrumentation=instrumentation, 
+                    logger=logger)
 
   # autoplay
-  success = agent.autoplay(ss_errtol=10, pause_plan=args.plan, render=args.render, verbose=True)
-  print('success: %s' % (success))
+  if args.num_envs > 1 or args.env_workers:
+    success = agent.autoplayVectorized(venv, ss_errtol=10, frame_skip=args.frame_skip, verbose=verbose)
+  else:
+    success = agent.autoplay(ss_errtol=10, pause_plan=args.plan, render=args.render, 
+                             frame_skip=args.frame_skip, decode_lag=args.decode_lag, 
+                             verbose=verbose)
+  venv.close()
+  logger.info('success', 'success: %(success)s', success=success)
+  logger.close()
 
 
 if __name__ == '__main__':
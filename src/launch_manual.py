@@ -15,11 +15,16 @@ __copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
 import numpy as np
 import gym
 import time
+import atexit
+import argparse
 
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
 
+from utils.EpisodeRecorder import EpisodeRecorder
+from utils.ReplayEngine import CloneState
+
 import pdb
 
 
@@ -216,6 +221,21 @@ def handle_key_release_event(key, mod):
   update_human_agent_action()
 
 
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record_dir', dest='record_dir',
+                        type=str, default=None,
+                        help="Directory to record the played episodes to (not recorded if not given).")
+    parser.add_argument('--record_chunk_size', dest='record_chunk_size',
+                        type=int, default=256,
+                        help="Number of steps per compressed chunk of the recorded episodes.")
+    parser.add_argument('--record_snapshot_interval', dest='record_snapshot_interval',
+                        type=int, default=64,
+                        help="Number of steps between the recorded emulator state snapshots.")
+
+    return parser.parse_args()
+
+
 def main():
   """
   Program entry.
@@ -224,14 +244,28 @@ def main():
   global human_sets_pause
   global key_printscreen_triggered
 
+  args = parse_arguments()
+
   # Initialize visualization tool
   matplotlib.interactive(True)
 
   # Initialize the environment
-  env = gym.make('MontezumaRevenge-v0')
-  env.reset()
+  env_id = 'MontezumaRevenge-v0'
+  env = gym.make(env_id)
+  s = env.reset()
   env.render()
 
+  # initialize episode recorder if requested
+  recorder = None
+  if args.record_dir is not None:
+    recorder = EpisodeRecorder(args.record_dir, chunk_size=args.record_chunk_size, 
+                               snapshot_interval=args.record_snapshot_interval)
+    episode = recorder.begin_episode({'launcher': 'manual', 'env_id': env_id})
+    print('recording episode %d to %s' % (episode, args.record_dir))
+
+    # note: the episode is completed at exit, e.g. when interrupted.
+    atexit.register(recorder.close)
+
   # Register the event handlers
   env.unwrapped.viewer.window.on_key_press = handle_key_press_event
   env.unwrapped.viewer.window.on_key_release = handle_key_release_event
@@ -243,8 +277,14 @@ def main():
       env.render()
       time.sleep(0.1)
 
+    # snapshot the emulator state for deterministic replays if due
+    snapshot = None
+    if recorder is not None and recorder.snapshot_due():
+      snapshot = CloneState(env)
+
     # environment roll forward
-    s_next, r, done, info = env.step(human_agent_action)
+    a = human_agent_action
+    s_next, r, done, info = env.step(a)
 
     if last_lives is None:
       print('lives = %s' % (info['ale.lives']))
@@ -257,6 +297,10 @@ def main():
     
     if r != 0:
       print('reward = %s' % (r))
+
+    # record the step
+    if recorder is not None:
+      recorder.record(s, a, r, info['ale.lives'], snapshot=snapshot)
     
     env.render()
     time.sleep(0.05)
@@ -273,6 +317,9 @@ def main():
       print('Game Over.')
       exit()
 
+    # update state
+    s = s_next
+
 
 if __name__ == '__main__':
   main()
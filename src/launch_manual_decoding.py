@@ -16,8 +16,12 @@ __copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
 import numpy as np
 import gym
 import time
+import atexit
+import argparse
 
 from utils import LogicRLUtils as Util
+from utils.EpisodeRecorder import EpisodeRecorder
+from utils.ReplayEngine import CloneState
 from decoder.CNN_state_parser_pytorch import CNNModel as DecoderCNNModel
 
 import matplotlib
@@ -257,6 +261,21 @@ def print_symbolic_state_transition(s1, s2, prefix=''):
     print(prefix + '+ ' + str(p))
 
 
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record_dir', dest='record_dir',
+                        type=str, default=None,
+                        help="Directory to record the played episodes to (not recorded if not given).")
+    parser.add_argument('--record_chunk_size', dest='record_chunk_size',
+                        type=int, default=256,
+                        help="Number of steps per compressed chunk of the recorded episodes.")
+    parser.add_argument('--record_snapshot_interval', dest='record_snapshot_interval',
+                        type=int, default=64,
+                        help="Number of steps between the recorded emulator state snapshots.")
+
+    return parser.parse_args()
+
+
 def main():
   """
   Program entry.
@@ -265,6 +284,8 @@ def main():
   global human_sets_pause
   global key_printscreen_triggered
 
+  args = parse_arguments()
+
   # initialize visualization tool
   matplotlib.interactive(True)
 
@@ -285,10 +306,23 @@ def main():
     weights_dir=decoder_weights_dir)
 
   # initialize the environment
-  env = gym.make('MontezumaRevenge-v0')
+  env_id = 'MontezumaRevenge-v0'
+  env = gym.make(env_id)
   s = env.reset()
   s_dec = Util.FrameToDecoderState(s)
   ss = decodeSymbolicState(decoder, s_dec)
+
+  # initialize episode recorder if requested
+  recorder = None
+  if args.record_dir is not None:
+    recorder = EpisodeRecorder(args.record_dir, chunk_size=args.record_chunk_size, 
+                               snapshot_interval=args.record_snapshot_interval)
+    episode = recorder.begin_episode({'launcher': 'manual_decoding', 'env_id': env_id})
+    print('recording episode %d to %s' % (episode, args.record_dir))
+
+    # note: the episode is completed at exit, e.g. when interrupted.
+    atexit.register(recorder.close)
+
   env.render()
 
   # print initial predicates
@@ -308,8 +342,14 @@ def main():
       env.render()
       time.sleep(0.1)
 
+    # snapshot the emulator state for deterministic replays if due
+    snapshot = None
+    if recorder is not None and recorder.snapshot_due():
+      snapshot = CloneState(env)
+
     # environment roll forward
-    s_next, r, done, info = env.step(human_agent_action)
+    a = human_agent_action
+    s_next, r, done, info = env.step(a)
 
     if last_lives is None:
       print('env_lives = %s' % (info['ale.lives']))
@@ -329,6 +369,10 @@ def main():
     if len(ss.difference(ss_next)) > 0 or len(ss_next.difference(ss)) > 0:
       print_symbolic_state_transition(ss, ss_next)
       print('')
+
+    # record the step
+    if recorder is not None:
+      recorder.record(s, a, r, info['ale.lives'], ss, snapshot)
     
     env.render()
     time.sleep(0.05)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+"""
+launch_ram_calibration.py
+Calibrate the RAM state decoder against symbolic states annotated by hand on
+recorded episodes, pairing each annotated step with its RAM, recovered by
+replaying the episodes from their emulator state snapshots.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import argparse
+import numpy as np
+from utils.EpisodeRecorder import EpisodeReader, EncodeSymbolicState, DecodeSymbolicState
+from utils import RAMStateDecoder as RAM
+
+
+def load_annotations(fname):
+  """
+  Load the symbolic states annotated on recorded episodes.
+
+  @param fname The annotation file, with one annotated step per line as 
+               `episode step predicate ...`, where the predicates are 
+               comma-separated strings. Empty lines and lines starting with 
+               `#` are ignored.
+  @return A dictionary mapping each episode to a dictionary mapping its 
+          annotated steps to sets of comma-separated predicate strings.
+  """
+
+  annotations = dict()
+  with open(fname, 'r') as f:
+    for line in f:
+      fields = line.split()
+      if len(fields) == 0 or fields[0].startswith('#'):
+        continue
+      annotations.setdefault(int(fields[0]), dict())[int(fields[1])] = set(fields[2:])
+
+  return annotations
+
+
+def collect_samples(record_dir, annotations, env_id=None):
+  """
+  Replay recorded episodes and collect the RAM of their annotated steps.
+
+  @param record_dir The recording directory.
+  @param annotations The annotated symbolic states, see `load_annotations`.
+  @param env_id The environment to replay in. (default: as recorded)
+  @return A tuple `(rams, labels)` of the RAM states as an `Nx128` array of
+          `uint8` and the annotated symbolic states as sets of 
+          comma-separated predicate strings.
+  """
+
+  import gym
+  from utils.ReplayEngine import ReplayEngine
+
+  reader = EpisodeReader(record_dir)
+  episodes = sorted(annotations.keys())
+  if env_id is None:
+    env_id = reader.meta(episodes[0])['info'].get('env_id', 'MontezumaRevenge-v0')
+
+  env = gym.make(env_id)
+  env.reset()
+  engine = ReplayEngine(env, record_dir)
+
+  rams = []
+  labels = []
+  for episode in episodes:
+    steps = annotations[episode]
+    n_samples = len(rams)
+    n_diverged = 0
+    for start, stop in engine.segments(episode):
+      # note: only the segments holding annotated steps are replayed.
+      if not any(start <= t < stop for t in steps):
+        continue
+      stop = max(t for t in steps if t < stop) + 1
+      for t, frame, matches in engine.replay(episode, start, stop, verify=True):
+        if t not in steps:
+          continue
+        if not matches:
+          n_diverged += 1
+          continue
+        rams.append(np.array(env.unwrapped.ale.getRAM(), dtype=np.uint8))
+        labels.append(steps[t])
+    print('[ INFO ] episode %d: %d samples (%d diverged steps skipped)' % (
+      episode, len(rams) - n_samples, n_diverged))
+
+  return (np.array(rams, dtype=np.uint8).reshape(-1, 128), labels)
+
+
+def save_samples(fname, rams, labels):
+  """
+  Save the samples collected by `collect_samples`.
+
+  @param fname The samples file.
+  @param rams The RAM states.
+  @param labels The symbolic states.
+  """
+
+  np.savez_compressed(fname, rams=rams, labels=np.array(
+    [EncodeSymbolicState(set(tuple(predstr.split(',')) for predstr in label)) for label in labels],
+    dtype=np.str_))
+
+
+def load_samples(fname):
+  """
+  Load the samples saved by `save_samples`.
+
+  @param fname The samples file.
+  @return A tuple `(rams, labels)` as returned by `collect_samples`.
+  """
+
+  with np.load(fname) as samples:
+    rams = samples['rams']
+    labels = [set(','.join(p) for p in DecodeSymbolicState(str(s))) for s in samples['labels']]
+
+  return (rams, labels)
+
+
+def show_agreement(name, agreement):
+  print('%s: %.4f of %d states decoded exactly' % (
+    name, agreement['agreement'], agreement['samples']))
+  for predstr, accuracy in sorted(agreement['predicates'].items()):
+    print('  - %-40s %.4f' % (predstr, accuracy))
+  print('')
+
+
+def calibrate(rams, labels, quantile=0.0):
+  """
+  Fit the spots and the flags of the RAM state decoder.
+
+  @param rams The RAM states.
+  @param labels The annotated symbolic states.
+  @param quantile The fraction of the actor positions to trim on each side of 
+                  the spot bounds.
+  @return A tuple `(spots, flags)` to construct the decoder with.
+  """
+
+  spots = RAM.CalibrateSpots(rams, labels, quantile=quantile)
+  flags, flag_agreements = RAM.CalibrateFlags(rams, labels)
+
+  return (spots, flags)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record_dir', dest='record_dir',
+                        type=str, default=None,
+                        help="Directory of the recorded episodes to collect the samples from (load the samples if not given).")
+    parser.add_argument('--annotations', dest='annotations',
+                        type=str, default=None,
+                        help="File of the symbolic states annotated on the recorded episodes, one step per line as `episode step predicate ...`.")
+    parser.add_argument('--env_id', dest='env_id',
+                        type=str, default=None,
+                        help="Environment to replay in (as recorded if not given).")
+    parser.add_argument('--samples', dest='samples',
+                        type=str, required=True,
+                        help="File of the samples, written if collected and read otherwise.")
+    parser.add_argument('--output', dest='output',
+                        type=str, default=None,
+                        help="File to write the calibration to (not written if not given).")
+    parser.add_argument('--quantile', dest='quantile',
+                        type=float, default=0.0,
+                        help="Fraction of the actor positions to trim on each side of the spot bounds.")
+
+    return parser.parse_args()
+
+
+def main():
+  args = parse_arguments()
+
+  # collect or load the samples
+  if args.record_dir is not None:
+    if args.annotations is None:
+      print('[ ERROR ] the annotations are required to collect the samples')
+      return
+    annotations = load_annotations(args.annotations)
+    rams, labels = collect_samples(args.record_dir, annotations, args.env_id)
+    save_samples(args.samples, rams, labels)
+    print('[ INFO ] samples written to %s' % (args.samples))
+  else:
+    rams, labels = load_samples(args.samples)
+  print('[ INFO ] samples: %d' % (len(rams)))
+  if len(rams) < 2:
+    print('[ ERROR ] not enough samples to calibrate against')
+    return
+  print('')
+
+  # note: the agreement is first measured on every other sample, with the 
+  #       decoder fitted on the remaining ones, since the decoder fitted on 
+  #       all the samples agrees with them by construction.
+  spots, flags = calibrate(rams[0::2], labels[0::2], args.quantile)
+  show_agreement('calibrated decoder (held-out samples)', RAM.DecoderAgreement(
+    RAM.RAMStateDecoder(spots, flags), rams[1::2], labels[1::2]))
+
+  spots, flags = calibrate(rams, labels, args.quantile)
+  decoder = RAM.RAMStateDecoder(spots, flags)
+  show_agreement('calibrated decoder (all samples)', RAM.DecoderAgreement(decoder, rams, labels))
+  for predstr in RAM.default_flag_predicates:
+    if predstr not in decoder.flag_predicates:
+      print('[ WARN ] %s never changes in the samples, so it is not decoded' % (predstr))
+
+  if args.output is not None:
+    RAM.SaveCalibration(args.output, spots, flags)
+    print('[ INFO ] calibration written to %s' % (args.output))
+
+
+if __name__ == '__main__':
+  main()
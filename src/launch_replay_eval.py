@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+"""
+launch_replay_eval.py
+Evaluate the symbolic state decoder and the symbolic planner over recorded
+episodes, replaying the episodes deterministically from their emulator state
+snapshots in parallel worker processes.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import json
+import time
+import argparse
+import multiprocessing as mp
+import gym
+from PDDL import PDDLPlanner
+from utils import LogicRLUtils as Util
+from utils.EpisodeRecorder import EpisodeReader, DecodeSymbolicState
+from utils.RAMStateDecoder import RAMStateDecoder, LoadCalibration
+from utils.ReplayEngine import ReplayEngine
+
+
+static_predicate_operators = [
+  'keyReachable',
+  'swordReachable',
+  'rewardReachable',
+  'pathExistsInRoom',
+  'doorPathExistsInRoom',
+  'pathExistsAcrossRooms'
+]
+
+# state of each worker process, see `init_worker`
+worker = dict()
+
+
+def make_decoder(decoder_type):
+  """
+  Construct a symbolic state decoder.
+
+  @param decoder_type The type of the decoder, which can be `cnn` or `ram`.
+  @return The decoder.
+  """
+
+  if decoder_type == 'ram':
+    decoder_ram_calibration_file = '../annotated_data/ram_calibration_room1.json'
+    return RAMStateDecoder(*LoadCalibration(decoder_ram_calibration_file))
+
+  from decoder.CNN_state_parser_pytorch import CNNModel as DecoderCNNModel
+
+  decoder_classes               = [14]
+  decoder_label_dir             = '../annotated_data/symbolic_states_room1'
+  decoder_frame_dir             = '../annotated_data/symbolic_states_room1'
+  decoder_predicates_file       = '../annotated_data/predicates.txt'
+  decoder_weights_dir           = '../model_weights'
+  decoder_pretrained_model_file = decoder_weights_dir + '/parser_epoch_17_loss_7.19790995944436e-05_valacc_0.9992972883597884.t7'
+
+  return DecoderCNNModel(
+    decoder_classes,
+    pretrained_model_pth=decoder_pretrained_model_file,
+    text_dir=decoder_label_dir,
+    img_dir=decoder_frame_dir,
+    label_file=decoder_predicates_file,
+    weights_dir=decoder_weights_dir)
+
+
+def init_worker(env_id, record_dir, decoder_type, fname_domain, fname_problem,
+                plan_cache_dir, plan_strategy, plan_stride, verify):
+  """
+  Initialize the environment, the decoder and the planner of a worker process.
+  """
+
+  env = gym.make(env_id)
+  env.reset()
+
+  planner = PDDLPlanner(fname_domain, fname_problem, cache_dir=plan_cache_dir)
+  static_predicates = set(p for p in planner.predefined_initial_state
+                          if p[0] in static_predicate_operators)
+
+  worker.update({
+    'engine': ReplayEngine(env, record_dir),
+    'symbolic_states': dict(), # episode -> recorded symbolic states
+    'decoder_type': decoder_type,
+    'decoder': make_decoder(decoder_type),
+    'planner': planner,
+    'static_predicates': static_predicates,
+    'plan_strategy': plan_strategy,
+    'plan_stride': plan_stride,
+    'verify': verify
+  })
+
+
+def recorded_symbolic_states(episode):
+  """
+  Read the symbolic states recorded in an episode, caching them in the worker 
+  process for the other segments of the episode.
+
+  @param episode The index of the episode.
+  @return The encoded symbolic states as an array.
+  """
+
+  if episode not in worker['symbolic_states']:
+    worker['symbolic_states'][episode] = worker['engine'].reader.column(episode, 'symbolic_states')
+
+  return worker['symbolic_states'][episode]
+
+
+def evaluate_segment(segment):
+  """
+  Replay a segment of an episode, decoding the symbolic state at every step
+  and planning from it every `plan_stride` steps.
+
+  @param segment A tuple `(episode, start, stop)` of the episode and the step
+                 range of the segment.
+  @return A dictionary of the counters of the segment.
+  """
+
+  episode, start, stop = segment
+  engine = worker['engine']
+  decoder = worker['decoder']
+  planner = worker['planner']
+
+  recorded_states = recorded_symbolic_states(episode)
+
+  stats = dict((key, 0) for key in [
+    'steps', 'frames_verified', 'frames_diverged', 'states_compared',
+    'states_agreed', 'plans', 'plans_found', 'plan_length'])
+  stats['plan_time'] = 0.0
+
+  for t, frame, matches in engine.replay(episode, start, stop, verify=worker['verify']):
+    stats['steps'] += 1
+    if matches is not None:
+      stats['frames_verified'] += 1
+      stats['frames_diverged'] += int(not matches)
+
+    # decode the symbolic state
+    if worker['decoder_type'] == 'ram':
+      decoded_predicate_strs = decoder.decode_state(engine.env.unwrapped.ale.getRAM())
+    else:
+      with Util.InferenceMode():
+        decoded_predicate_strs = decoder.decode_state(Util.FrameToDecoderState(frame))
+    ss = set(tuple(predstr.split(',')) for predstr in decoded_predicate_strs)
+
+    # compare against the symbolic state decoded while recording
+    ss_recorded = DecodeSymbolicState(str(recorded_states[t]))
+    if len(ss_recorded) > 0:
+      stats['states_compared'] += 1
+      stats['states_agreed'] += int(ss == ss_recorded)
+
+    # plan from the decoded symbolic state
+    if (t - start) % worker['plan_stride'] == 0:
+      t_start = time.perf_counter()
+      plan = planner.find_plan(initial_state=ss | worker['static_predicates'],
+                               strategy=worker['plan_strategy'])
+      stats['plan_time'] += time.perf_counter() - t_start
+      stats['plans'] += 1
+      if plan is not None:
+        stats['plans_found'] += 1
+        stats['plan_length'] += len(plan) - 1
+
+  return stats
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record_dir', dest='record_dir',
+                        type=str, required=True,
+                        help="Directory of the recorded episodes.")
+    parser.add_argument('--episodes', dest='episodes',
+                        type=int, nargs='*', default=None,
+                        help="Episodes to evaluate (all if not given).")
+    parser.add_argument('--env_id', dest='env_id',
+                        type=str, default=None,
+                        help="Environment to replay in (as recorded if not given).")
+    parser.add_argument('--workers', dest='workers',
+                        type=int, default=mp.cpu_count(),
+                        help="Number of worker processes.")
+    parser.add_argument('--decoder', dest='decoder',
+                        type=str, default='cnn',
+                        choices=['cnn', 'ram'],
+                        help="Symbolic state decoder reading the frames (cnn) or the Atari RAM (ram, calibrated with launch_ram_calibration.py).")
+    parser.add_argument('--plan_strategy', dest='plan_strategy',
+                        type=str, default='bfs',
+                        choices=['bfs', 'astar', 'wastar', 'gbfs', 'table'],
+                        help="Search strategy of the symbolic planner.")
+    parser.add_argument('--plan_stride', dest='plan_stride',
+                        type=int, default=16,
+                        help="Number of steps between the plans.")
+    parser.add_argument('--output', dest='output',
+                        type=str, default=None,
+                        help="JSON file to write the results to.")
+
+    parser_group = parser.add_mutually_exclusive_group(required=False)
+    parser_group.add_argument('--verify', dest='verify',
+                              action='store_true',
+                              help="Whether to compare the replayed frames against the recorded frames.")
+    parser_group.add_argument('--no-verify', dest='verify',
+                              action='store_false',
+                              help="Whether to compare the replayed frames against the recorded frames.")
+    parser.set_defaults(verify=True)
+
+    return parser.parse_args()
+
+
+def main():
+  args = parse_arguments()
+
+  fname_domain = '../PDDL/domain.pddl'
+  fname_problem = '../PDDL/problem_room1.pddl'
+  plan_cache_dir = '../PDDL/.cache'
+
+  # split the episodes into independently replayable segments
+  reader = EpisodeReader(args.record_dir)
+  episodes = args.episodes if args.episodes is not None else reader.episodes()
+  if len(episodes) == 0:
+    print('[ ERROR ] no recorded episodes in %s' % (args.record_dir))
+    return
+
+  env_id = args.env_id
+  if env_id is None:
+    env_id = reader.meta(episodes[0])['info'].get('env_id', 'MontezumaRevenge-v0')
+
+  segments = []
+  engine = ReplayEngine(None, args.record_dir)
+  for episode in episodes:
+    segments += [(episode, start, stop) for start, stop in engine.segments(episode)]
+  print('[ INFO ] episodes: %d, segments: %d, env: %s' % (len(episodes), len(segments), env_id))
+  if len(segments) == 0:
+    print('[ ERROR ] no emulator state snapshots recorded in the episodes')
+    return
+
+  # note: the planner ground task is cached before forking the workers, so
+  #       that they load it instead of grounding it concurrently.
+  PDDLPlanner(fname_domain, fname_problem, cache_dir=plan_cache_dir)
+
+  # note: the decoder is constructed once before forking the workers, since a
+  #       pool whose initializer fails keeps respawning its workers forever.
+  try:
+    make_decoder(args.decoder)
+  except Exception as e:
+    print('[ ERROR ] failed to load the %s decoder: %s' % (args.decoder, e))
+    return
+
+  # evaluate the segments in parallel
+  t_start = time.time()
+  initargs = (env_id, args.record_dir, args.decoder, fname_domain, fname_problem,
+              plan_cache_dir, args.plan_strategy, args.plan_stride, args.verify)
+  with mp.Pool(args.workers, initializer=init_worker, initargs=initargs) as pool:
+    results = pool.map(evaluate_segment, segments, chunksize=1)
+  t_elapsed = max(time.time() - t_start, 1e-9)
+
+  # aggregate the results
+  total = dict((key, sum(stats[key] for stats in results)) for key in results[0])
+  print('[ INFO ] steps: %d (%.1f steps/s with %d workers)' % (
+    total['steps'], total['steps'] / t_elapsed, args.workers))
+  if total['frames_verified'] > 0:
+    print('[ INFO ] frames diverged from the recording: %d / %d' % (
+      total['frames_diverged'], total['frames_verified']))
+  if total['states_compared'] > 0:
+    print('[ INFO ] decoded states agreeing with the recording: %d / %d (%.3f)' % (
+      total['states_agreed'], total['states_compared'],
+      total['states_agreed'] / float(total['states_compared'])))
+  if total['plans'] > 0:
+    print('[ INFO ] plans found: %d / %d (mean length: %.2f, mean time: %.3f ms)' % (
+      total['plans_found'], total['plans'],
+      total['plan_length'] / float(max(total['plans_found'], 1)),
+      total['plan_time'] / total['plans'] * 1e3))
+
+  if args.output is not None:
+    with open(args.output, 'w') as f:
+      json.dump({'env_id': env_id, 'episodes': episodes, 'segments': len(segments),
+                 'elapsed': t_elapsed, 'total': total}, f, indent=2, sort_keys=True)
+    print('[ INFO ] results written to %s' % (args.output))
+
+
+if __name__ == '__main__':
+  main()
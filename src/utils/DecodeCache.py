@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""
+DecodeCache.py
+A bounded cache of decoded symbolic states keyed by the hash of the
+preprocessed frames, with change detection against the previous frame of
+each stream.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import hashlib
+import numpy as np
+
+from utils.LRUCache import LRUCache
+
+
+class DecodeCache(object):
+  """
+  Cache of decoded symbolic states keyed by preprocessed frames.
+
+  A lookup first compares the image against the previous image of the same
+  stream (e.g. environment), which catches the common case of consecutive
+  identical frames without hashing. Otherwise the image is hashed and looked
+  up in a bounded LRU cache.
+  """
+
+  def __init__(self, capacity=4096):
+    """
+    Initialize a decode cache.
+
+    @param capacity The maximum number of distinct frames to keep.
+    """
+
+    super(DecodeCache, self).__init__()
+
+    self.cache = LRUCache(capacity)
+    self.previous = {} # stream -> (image, key, decoded state)
+
+    self.unchanged = 0
+
+
+  def __len__(self):
+    return len(self.cache)
+
+
+  def _Key(image):
+    """
+    (internal, static)
+    Compute the cache key of a preprocessed image.
+
+    @param image The preprocessed image.
+    @return The digest of the image content.
+    """
+
+    return hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16).digest()
+
+
+  def lookup(self, image, stream=0):
+    """
+    Look up the decoded symbolic state of a preprocessed image.
+
+    @param image The preprocessed image. The cache keeps a reference to it as
+                 the previous image of the stream, so it shall not be modified
+                 afterwards.
+    @param stream The identifier of the stream the image comes from.
+    @return A tuple `(ss, key)`, where `ss` is the cached decoded state, or
+            `None` on a miss, and `key` is the cache key to `store` the
+            decoded state with.
+    """
+
+    prev = self.previous.get(stream)
+    if prev is not None and np.array_equal(prev[0], image):
+      self.unchanged += 1
+      return prev[2], prev[1]
+
+    key = DecodeCache._Key(image)
+    ss = self.cache.get(key)
+    if ss is not None:
+      self.previous[stream] = (image, key, ss)
+
+    return ss, key
+
+
+  def store(self, image, key, ss, stream=0):
+    """
+    Store the decoded symbolic state of a preprocessed image.
+
+    @param image The preprocessed image.
+    @param key The cache key returned by `lookup`.
+    @param ss The decoded symbolic state, which shall be immutable (e.g. a
+              bitset).
+    @param stream The identifier of the stream the image comes from.
+    """
+
+    self.cache.put(key, ss)
+    self.previous[stream] = (image, key, ss)
+
+
+  def clear(self):
+    """
+    Remove all entries and previous images. The counters are kept.
+    """
+
+    self.cache.clear()
+    self.previous.clear()
+
+
+  def stats(self):
+    """
+    Summarize the cache counters.
+
+    @return A dictionary of the LRU cache counters, the number of unchanged
+            frames and the overall hit rate, where unchanged frames count as
+            hits.
+    """
+
+    stats = self.cache.stats()
+    stats['unchanged'] = self.unchanged
+
+    lookups = stats['hits'] + stats['misses'] + self.unchanged
+    stats['hit_rate'] = float(stats['hits'] + self.unchanged) / lookups if lookups > 0 else 0.0
+
+    return stats
@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+
+"""
+EpisodeRecorder.py
+Recording of played episodes into chunked, compressed NumPy archives on disk,
+written by a background thread, and random access to the recorded steps.
+
+A recording directory holds one directory per episode:
+
+```
+<record_dir>/episode_000000/meta.json
+<record_dir>/episode_000000/chunk_000000.npz
+<record_dir>/episode_000000/chunk_000001.npz
+...
+```
+
+Each chunk holds up to `chunk_size` consecutive steps. The first frame of a
+chunk is stored as is and each following frame as its XOR with the previous
+frame, which is mostly zeros for Atari frames and compresses well, so a step
+is restored from its chunk alone. Emulator state snapshots, if provided, are
+stored in the chunk of their step and indexed in the meta data, so that the
+emulator can be restored near any step and replayed deterministically.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import re
+import json
+import bisect
+import queue
+import threading
+import numpy as np
+
+from utils.LRUCache import LRUCache
+
+
+episode_dir_format = 'episode_%06d'
+chunk_file_format = 'chunk_%06d.npz'
+meta_file = 'meta.json'
+
+
+def EncodeSymbolicState(symbolic_state):
+  """
+  Encode a symbolic state as a string of sorted comma separated predicates
+  separated by semicolons.
+
+  @param symbolic_state The symbolic state as a set of predicate tuples, or
+                        `None` if not decoded.
+  @return The encoded symbolic state, which is empty if not decoded.
+  """
+
+  if symbolic_state is None:
+    return ''
+
+  return ';'.join(sorted(','.join(p) for p in symbolic_state))
+
+
+def DecodeSymbolicState(s):
+  """
+  Decode a symbolic state encoded by `EncodeSymbolicState`.
+
+  @param s The encoded symbolic state.
+  @return The symbolic state as a set of predicate tuples.
+  """
+
+  if len(s) == 0:
+    return set()
+
+  return set(tuple(p.split(',')) for p in s.split(';'))
+
+
+def DeltaEncodeFrames(frames):
+  """
+  Delta encode consecutive frames, keeping the first frame and replacing each
+  following frame by its XOR with the previous frame.
+
+  @param frames The frames as an `NxHxWxC` array of `uint8`.
+  @return The delta encoded frames of the same shape.
+  """
+
+  deltas = np.empty_like(frames)
+  deltas[0] = frames[0]
+  np.bitwise_xor(frames[1:], frames[:-1], out=deltas[1:])
+
+  return deltas
+
+
+def DeltaDecodeFrames(deltas):
+  """
+  Restore the frames delta encoded by `DeltaEncodeFrames`.
+
+  @param deltas The delta encoded frames.
+  @return The frames.
+  """
+
+  return np.bitwise_xor.accumulate(deltas, axis=0)
+
+
+class EpisodeRecorder(object):
+  """
+  Recorder streaming the steps of played episodes to disk. The steps are
+  buffered into chunks in the playing thread, and a background writer thread
+  encodes, compresses and writes the complete chunks, so that recording does
+  not stall the play loop.
+  """
+
+  def __init__(self, record_dir, chunk_size=256, snapshot_interval=64, 
+               max_pending_chunks=16):
+    """
+    Initialize an episode recorder. The episodes are numbered after the
+    episodes already in the recording directory.
+
+    @param record_dir The recording directory, created if not existing.
+    @param chunk_size The number of steps per chunk. (default: 256)
+    @param snapshot_interval The number of steps between the emulator state 
+                             snapshots, see `snapshot_due`. (default: 64)
+    @param max_pending_chunks The maximum number of chunks waiting for the
+                              writer before recording blocks.
+    """
+
+    super(EpisodeRecorder, self).__init__()
+
+    self.record_dir = record_dir
+    self.chunk_size = chunk_size
+    self.snapshot_interval = snapshot_interval
+    if not os.path.isdir(record_dir):
+      os.makedirs(record_dir)
+
+    self.episode = None
+    self.n_episodes = max(ListEpisodes(record_dir) + [-1]) + 1
+    self.n_steps = 0
+    self.n_chunks = 0
+    self.steps = None
+
+    self.pending = queue.Queue(max_pending_chunks)
+    self.error = None
+    self.writer = threading.Thread(target=self._WriterLoop, name='EpisodeRecorder')
+    self.writer.daemon = True
+    self.writer.start()
+
+
+  def begin_episode(self, info=None):
+    """
+    Begin recording an episode, ending the episode being recorded if any.
+
+    @param info A dictionary of additional information stored in the meta
+                data of the episode. (optional)
+    @return The index of the episode.
+    """
+
+    if self.episode is not None:
+      self.end_episode()
+
+    self.episode = self.n_episodes
+    self.n_episodes += 1
+    self.n_steps = 0
+    self.n_chunks = 0
+    self.info = dict(info) if info is not None else dict()
+    self.steps = ([], [], [], [], [], []) # frames, actions, rewards, lives, symbolic states, snapshots
+    self.snapshot_steps = []
+
+    os.makedirs(os.path.join(self.record_dir, episode_dir_format % (self.episode)))
+
+    return self.episode
+
+
+  def snapshot_due(self):
+    """
+    Check if an emulator state snapshot is due at the next recorded step, 
+    which is every `snapshot_interval` steps from the beginning of an episode.
+
+    @return A boolean indicating if a snapshot shall be passed to the next 
+            `record` call.
+    """
+
+    return self.episode is None or self.n_steps % self.snapshot_interval == 0
+
+
+  def record(self, frame, action, reward, lives, symbolic_state=None, snapshot=None):
+    """
+    Record a step of the episode being recorded.
+
+    @param frame The raw frame the action is taken at, which shall not be
+                 mutated afterwards.
+    @param action The action taken.
+    @param reward The reward received for the action.
+    @param lives The number of lives after the action.
+    @param symbolic_state The symbolic state decoded from the frame as a set of
+                          predicate tuples. (optional)
+    @param snapshot The serialized emulator state before the action, as an 
+                    array of `uint8`, see `ReplayEngine.CloneState`. 
+                    (optional)
+    """
+
+    if self.error is not None:
+      raise self.error
+
+    if self.episode is None:
+      self.begin_episode()
+
+    frames, actions, rewards, lives_, symbolic_states, snapshots = self.steps
+    frames.append(frame)
+    actions.append(action)
+    rewards.append(reward)
+    lives_.append(lives)
+    symbolic_states.append(symbolic_state)
+    snapshots.append(snapshot)
+    if snapshot is not None:
+      self.snapshot_steps.append(self.n_steps)
+    self.n_steps += 1
+
+    if len(frames) >= self.chunk_size:
+      self._SubmitChunk()
+
+
+  def end_episode(self):
+    """
+    End recording the episode being recorded, writing its remaining steps and
+    meta data.
+    """
+
+    if self.episode is None:
+      return
+
+    if len(self.steps[0]) > 0:
+      self._SubmitChunk()
+
+    meta = {
+      'episode': self.episode,
+      'num_steps': self.n_steps,
+      'num_chunks': self.n_chunks,
+      'chunk_size': self.chunk_size,
+      'snapshot_steps': self.snapshot_steps,
+      'info': self.info
+    }
+    self.pending.put(('meta', self.episode, meta))
+
+    self.episode = None
+    self.steps = None
+
+
+  def _SubmitChunk(self):
+    """
+    (internal)
+    Hand the buffered steps over to the writer as a chunk.
+    """
+
+    self.pending.put(('chunk', self.episode, (self.n_chunks, self.steps)))
+    self.n_chunks += 1
+    self.steps = ([], [], [], [], [], [])
+
+
+  def _WriterLoop(self):
+    """
+    (internal)
+    Loop of the background writer thread.
+    """
+
+    while True:
+      item = self.pending.get()
+      if item is None:
+        break
+
+      kind, episode, data = item
+      try:
+        episode_dir = os.path.join(self.record_dir, episode_dir_format % (episode))
+        if kind == 'chunk':
+          k, (frames, actions, rewards, lives, symbolic_states, snapshots) = data
+          EpisodeRecorder._WriteChunk(
+            os.path.join(episode_dir, chunk_file_format % (k)),
+            frames, actions, rewards, lives, symbolic_states, snapshots)
+        else:
+          fname = os.path.join(episode_dir, meta_file)
+          with open(fname + '.tmp', 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+          os.replace(fname + '.tmp', fname)
+      except Exception as e:
+        # note: the error is raised in the playing thread at the next record.
+        self.error = e
+
+
+  def _WriteChunk(fname, frames, actions, rewards, lives, symbolic_states, snapshots):
+    """
+    (internal, static)
+    Encode and write a chunk.
+    """
+
+    # concatenate the snapshots, which may differ in size, with their offsets
+    snapshot_indices = [i for i, snapshot in enumerate(snapshots) if snapshot is not None]
+    snapshot_data = [np.asarray(snapshots[i], dtype=np.uint8).ravel() for i in snapshot_indices]
+    snapshot_offsets = np.cumsum([0] + [len(data) for data in snapshot_data])
+
+    fname_tmp = fname + '.tmp.npz'
+    np.savez_compressed(fname_tmp,
+      frames=DeltaEncodeFrames(np.stack(frames)),
+      actions=np.array(actions, dtype=np.int16),
+      rewards=np.array(rewards, dtype=np.float32),
+      lives=np.array(lives, dtype=np.int16),
+      symbolic_states=np.array([EncodeSymbolicState(ss) for ss in symbolic_states], dtype=np.str_),
+      snapshot_indices=np.array(snapshot_indices, dtype=np.int32),
+      snapshot_offsets=snapshot_offsets.astype(np.int64),
+      snapshot_data=np.concatenate(snapshot_data) if len(snapshot_data) > 0 else np.zeros(0, dtype=np.uint8))
+    os.replace(fname_tmp, fname)
+
+
+  def close(self):
+    """
+    End the episode being recorded, and wait for the writer to write all the
+    pending chunks.
+    """
+
+    if self.writer is None:
+      return
+
+    self.end_episode()
+    self.pending.put(None)
+    self.writer.join()
+    self.writer = None
+
+    if self.error is not None:
+      raise self.error
+
+
+def ListEpisodes(record_dir):
+  """
+  List the episodes in a recording directory.
+
+  @param record_dir The recording directory.
+  @return The sorted list of the episode indices.
+  """
+
+  if not os.path.isdir(record_dir):
+    return []
+
+  episodes = []
+  for name in os.listdir(record_dir):
+    m = re.match(r'^episode_(\d+)$', name)
+    if m is not None:
+      episodes.append(int(m.group(1)))
+
+  return sorted(episodes)
+
+
+class EpisodeReader(object):
+  """
+  Random access to the steps of recorded episodes. The recently decoded
+  chunks are cached, so that sequential reads decompress each chunk once.
+  """
+
+  def __init__(self, record_dir, cache_size=8):
+    """
+    Initialize an episode reader.
+
+    @param record_dir The recording directory.
+    @param cache_size The number of decoded chunks to cache. (default: 8)
+    """
+
+    super(EpisodeReader, self).__init__()
+
+    self.record_dir = record_dir
+    self.chunks = LRUCache(cache_size)
+    self.metas = dict() # episode -> meta data
+
+
+  def episodes(self):
+    """
+    List the completely recorded episodes.
+
+    @return The sorted list of the episode indices.
+    """
+
+    return [episode for episode in ListEpisodes(self.record_dir)
+            if os.path.exists(os.path.join(self.record_dir, episode_dir_format % (episode), meta_file))]
+
+
+  def meta(self, episode):
+    """
+    Load the meta data of an episode.
+
+    @param episode The index of the episode.
+    @return The meta data, including `num_steps`, `chunk_size` and `info`.
+    """
+
+    if episode not in self.metas:
+      fname = os.path.join(self.record_dir, episode_dir_format % (episode), meta_file)
+      with open(fname, 'r') as f:
+        self.metas[episode] = json.load(f)
+
+    return self.metas[episode]
+
+
+  def num_steps(self, episode):
+    """
+    Count the steps of an episode.
+
+    @param episode The index of the episode.
+    @return The number of steps.
+    """
+
+    return self.meta(episode)['num_steps']
+
+
+  def chunk(self, episode, k):
+    """
+    Load and decode a chunk of an episode.
+
+    @param episode The index of the episode.
+    @param k The index of the chunk.
+    @return A dictionary of the arrays of the chunk, with the frames restored.
+    """
+
+    chunk = self.chunks.get((episode, k))
+    if chunk is None:
+      fname = os.path.join(self.record_dir, episode_dir_format % (episode), chunk_file_format % (k))
+      with np.load(fname) as data:
+        chunk = dict((key, data[key]) for key in data.files)
+      chunk['frames'] = DeltaDecodeFrames(chunk['frames'])
+      self.chunks.put((episode, k), chunk)
+
+    return chunk
+
+
+  def column(self, episode, name):
+    """
+    Read an array of all the steps of an episode, such as the `actions`, 
+    without decompressing the frames.
+
+    @param episode The index of the episode.
+    @param name The name of the array, which can be `actions`, `rewards`, 
+                `lives` or `symbolic_states`.
+    @return The array.
+    """
+
+    arrays = []
+    for k in range(self.meta(episode)['num_chunks']):
+      fname = os.path.join(self.record_dir, episode_dir_format % (episode), chunk_file_format % (k))
+      with np.load(fname) as data:
+        arrays.append(data[name])
+
+    return np.concatenate(arrays)
+
+
+  def snapshot(self, episode, t):
+    """
+    Read the latest emulator state snapshot at or before a step.
+
+    @param episode The index of the episode.
+    @param t The index of the step.
+    @return A tuple `(t_snapshot, snapshot)` of the step of the snapshot and 
+            the snapshot, or `None` if no snapshot precedes the step.
+    """
+
+    snapshot_steps = self.meta(episode).get('snapshot_steps', [])
+    j = bisect.bisect_right(snapshot_steps, t) - 1
+    if j < 0:
+      return None
+
+    t_snapshot = snapshot_steps[j]
+    chunk_size = self.meta(episode)['chunk_size']
+    fname = os.path.join(self.record_dir, episode_dir_format % (episode), 
+                         chunk_file_format % (t_snapshot // chunk_size))
+    with np.load(fname) as data:
+      i = int(np.nonzero(data['snapshot_indices'] == t_snapshot % chunk_size)[0][0])
+      offsets = data['snapshot_offsets']
+      snapshot = data['snapshot_data'][offsets[i]:offsets[i+1]]
+
+    return (t_snapshot, snapshot)
+
+
+  def step(self, episode, t):
+    """
+    Read a step of an episode.
+
+    @param episode The index of the episode.
+    @param t The index of the step.
+    @return A tuple `(frame, action, reward, lives, symbolic_state)`, where the
+            symbolic state is a set of predicate tuples, empty if not decoded.
+    """
+
+    n = self.num_steps(episode)
+    if t < 0:
+      t += n
+    if t < 0 or t >= n:
+      raise IndexError('step %d out of range of episode %d with %d steps' % (t, episode, n))
+
+    chunk_size = self.meta(episode)['chunk_size']
+    chunk = self.chunk(episode, t // chunk_size)
+    i = t % chunk_size
+
+    return (chunk['frames'][i], int(chunk['actions'][i]), float(chunk['rewards'][i]),
+            int(chunk['lives'][i]), DecodeSymbolicState(str(chunk['symbolic_states'][i])))
+
+
+  def __getitem__(self, index):
+    episode, t = index
+    return self.step(episode, t)
+
+
+  def iterate(self, episode):
+    """
+    Iterate over the steps of an episode in order.
+
+    @param episode The index of the episode.
+    @return A generator of the steps as returned by `step`.
+    """
+
+    for t in range(self.num_steps(episode)):
+      yield self.step(episode, t)
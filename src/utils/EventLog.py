@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+"""
+EventLog.py
+Structured event logger writing through a buffered background writer thread,
+with verbosity levels, per-event sampling and pluggable sinks.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import sys
+import json
+import atexit
+import time
+import threading
+from collections import deque
+
+
+# verbosity levels
+levels = {
+  'debug': 10,
+  'info': 20,
+  'warn': 30,
+  'error': 40
+}
+
+level_names = dict((v, k) for k, v in levels.items())
+
+
+class StdoutSink(object):
+  """
+  Sink printing the events as human readable lines, in the `[ INFO ] ...`
+  format of the launchers.
+  """
+
+  def __init__(self, stream=None):
+    """
+    Initialize a stdout sink.
+
+    @param stream The stream to print to. (default: `sys.stdout` at the time
+                  of writing)
+    """
+
+    super(StdoutSink, self).__init__()
+
+    self.stream = stream
+
+
+  def _Format(record):
+    """
+    (internal, static)
+    Format an event record as a human readable line.
+
+    @param record The event record as a tuple `(t, level, event, msg,
+                  fields)`.
+    @return The formatted line.
+    """
+
+    t, level, event, msg, fields = record
+    if msg is not None:
+      text = msg % fields if len(fields) > 0 else msg
+    else:
+      text = ' '.join([event] + ['%s=%s' % (k, fields[k]) for k in sorted(fields)])
+
+    return '[ %s ] %s\n' % (level_names[level].upper(), text)
+
+
+  def write(self, records):
+    """
+    Write a batch of event records.
+
+    @param records The list of event records.
+    """
+
+    stream = self.stream if self.stream is not None else sys.stdout
+    stream.write(''.join([StdoutSink._Format(record) for record in records]))
+
+
+  def flush(self):
+    stream = self.stream if self.stream is not None else sys.stdout
+    stream.flush()
+
+
+  def close(self):
+    self.flush()
+
+
+class JSONLinesSink(object):
+  """
+  Sink appending the events as JSON lines to a file.
+  """
+
+  def __init__(self, fname, buffer_size=1 << 16):
+    """
+    Initialize a JSON lines sink.
+
+    @param fname The file to append to.
+    @param buffer_size The size of the file buffer in bytes.
+    """
+
+    super(JSONLinesSink, self).__init__()
+
+    self.fname = fname
+    self.f = open(fname, 'a', buffering=buffer_size)
+
+
+  def write(self, records):
+    """
+    Write a batch of event records.
+
+    @param records The list of event records.
+    """
+
+    lines = []
+    for t, level, event, msg, fields in records:
+      record = {'t': t, 'level': level_names[level], 'event': event}
+      record.update(fields)
+      # note: non-serializable fields, such as operators, are stringified.
+      lines.append(json.dumps(record, default=str))
+    self.f.write('\n'.join(lines) + '\n')
+
+
+  def flush(self):
+    self.f.flush()
+
+
+  def close(self):
+    self.f.close()
+
+
+class EventLogger(object):
+  """
+  Structured event logger. Logging an event only checks its level and
+  sampling, and appends a record to a buffer. A background writer thread
+  formats the records and writes them to the sinks in batches.
+  """
+
+  def __init__(self, sinks, level='info', sample=None,
+               max_buffer=1 << 16, batch_size=256, flush_interval=0.5):
+    """
+    Initialize an event logger.
+
+    @param sinks The list of sinks, such as `StdoutSink` and `JSONLinesSink`.
+    @param level The minimum level of the events to log, which can be
+                 `debug`, `info`, `warn` or `error`. (default: `info`)
+    @param sample A dictionary mapping event names to `N`, keeping only every
+                  `N`-th event of that name. (default: keep all the events)
+    @param max_buffer The maximum number of buffered records. Events logged
+                      while the buffer is full are dropped and counted.
+    @param batch_size The number of buffered records waking up the writer
+                      before the flush interval elapses.
+    @param flush_interval The maximum interval between writes in seconds.
+    """
+
+    super(EventLogger, self).__init__()
+
+    self.sinks = list(sinks)
+    self.level = levels[level]
+    self.sample = dict(sample) if sample is not None else dict()
+    self.sample_counts = dict() # event -> count
+    self.max_buffer = max_buffer
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.dropped = 0
+
+    self.buffer = deque()
+    self.write_lock = threading.Lock()
+    self.wakeup = threading.Event()
+    self.closed = False
+
+    self.writer = None
+    if len(self.sinks) > 0:
+      self.writer = threading.Thread(target=self._WriterLoop, name='EventLogger')
+      self.writer.daemon = True
+      self.writer.start()
+
+      # note: the remaining records are written at exit if not closed.
+      atexit.register(self.close)
+
+
+  def enabled_for(self, level, event=None):
+    """
+    Check if events of a level are logged, and if the next event of a name is 
+    kept by the sampling, e.g. before computing expensive fields. An event 
+    found sampled out is counted as logged, so an event found kept shall be 
+    logged next.
+
+    @param level The name of the level.
+    @param event The name of the event. (optional)
+    @return A boolean indicating if the event is logged.
+    """
+
+    if levels[level] < self.level or self.writer is None:
+      return False
+
+    if event is not None and event in self.sample:
+      k = self.sample_counts.get(event, 0)
+      if k % self.sample[event] != 0:
+        self.sample_counts[event] = k + 1
+        return False
+
+    return True
+
+
+  def log(self, level, event, msg=None, **fields):
+    """
+    Log an event.
+
+    The message is formatted with the fields by the writer thread, so the
+    fields shall not be mutated after being logged.
+
+    @param level The verbosity level of the event.
+    @param event The name of the event.
+    @param msg The message template, formatted as `msg % fields` by the human
+               readable sinks. (optional)
+    @param fields The fields of the event.
+    """
+
+    level = levels[level]
+    if level >= self.level:
+      self._Append(level, event, msg, fields)
+
+
+  def debug(self, event, msg=None, **fields):
+    if self.level <= 10:
+      self._Append(10, event, msg, fields)
+
+
+  def info(self, event, msg=None, **fields):
+    if self.level <= 20:
+      self._Append(20, event, msg, fields)
+
+
+  def warn(self, event, msg=None, **fields):
+    if self.level <= 30:
+      self._Append(30, event, msg, fields)
+
+
+  def error(self, event, msg=None, **fields):
+    if self.level <= 40:
+      self._Append(40, event, msg, fields)
+
+
+  def _Append(self, level, event, msg, fields):
+    """
+    (internal)
+    Append an event record to the buffer, unless it is sampled out or the
+    buffer is full.
+    """
+
+    if self.writer is None:
+      return
+
+    # keep every N-th event of the sampled events
+    if event in self.sample:
+      k = self.sample_counts.get(event, 0)
+      self.sample_counts[event] = k + 1
+      if k % self.sample[event] != 0:
+        return
+
+    buffer = self.buffer
+    if len(buffer) >= self.max_buffer:
+      self.dropped += 1
+      return
+
+    buffer.append((time.time(), level, event, msg, fields))
+    if len(buffer) >= self.batch_size:
+      self.wakeup.set()
+
+
+  def _Drain(self):
+    """
+    (internal)
+    Write the buffered records to the sinks.
+    """
+
+    with self.write_lock:
+      records = []
+      while len(self.buffer) > 0:
+        records.append(self.buffer.popleft())
+      if len(records) == 0:
+        return
+
+      for sink in self.sinks:
+        sink.write(records)
+
+
+  def _WriterLoop(self):
+    """
+    (internal)
+    Loop of the background writer thread.
+    """
+
+    while not self.closed:
+      self.wakeup.wait(self.flush_interval)
+      self.wakeup.clear()
+      self._Drain()
+
+
+  def flush(self):
+    """
+    Write the buffered records and flush the sinks, e.g. before prompting the
+    user on stdout.
+    """
+
+    self._Drain()
+    for sink in self.sinks:
+      sink.flush()
+
+
+  def close(self):
+    """
+    Stop the writer thread, write the remaining records and close the sinks.
+    """
+
+    if self.closed:
+      return
+
+    self.closed = True
+    if self.writer is not None:
+      self.wakeup.set()
+      self.writer.join()
+
+    self._Drain()
+    if self.dropped > 0:
+      for sink in self.sinks:
+        sink.write([(time.time(), levels['warn'], 'log_dropped',
+                     '%(dropped)d events dropped due to a full buffer',
+                     {'dropped': self.dropped})])
+    for sink in self.sinks:
+      sink.close()
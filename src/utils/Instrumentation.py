@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+
+"""
+Instrumentation.py
+Low-overhead instrumentation with monotonic-clock spans, histograms and
+counters, dumped as JSON lines or Prometheus text. A null instrumentation
+with the same interface costs next to nothing when instrumentation is off.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import re
+import json
+import time
+import bisect
+import threading
+
+
+# histogram bucket upper bounds of spans in seconds, from 1 us to 10 s
+span_buckets = [float('%se%d' % (m, e)) for e in range(-6, 1) for m in ('1', '2.5', '5')] + [10.0]
+
+# histogram bucket upper bounds of counts and sizes
+value_buckets = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+class Histogram(object):
+  """
+  Histogram aggregating observations into cumulative buckets.
+  """
+
+  def __init__(self, buckets):
+    """
+    Initialize a histogram.
+
+    @param buckets The ascending upper bounds of the buckets. Observations
+                   above the last bound fall into an implicit `+Inf` bucket.
+    """
+
+    super(Histogram, self).__init__()
+
+    self.buckets = list(buckets)
+    self.bucket_counts = [0] * (len(self.buckets) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self.min = float('inf')
+    self.max = float('-inf')
+
+
+  def observe(self, value):
+    """
+    Record an observation.
+
+    @param value The observed value.
+    """
+
+    self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.count += 1
+    self.sum += value
+    if value < self.min:
+      self.min = value
+    if value > self.max:
+      self.max = value
+
+
+  def quantile(self, q):
+    """
+    Estimate a quantile as the upper bound of the bucket containing it.
+
+    @param q The quantile in `[0, 1]`.
+    @return The estimated quantile, or `None` if nothing is observed.
+    """
+
+    if self.count == 0:
+      return None
+
+    rank = q * self.count
+    cumulative = 0
+    for k, n in enumerate(self.bucket_counts):
+      cumulative += n
+      if cumulative >= rank and n > 0:
+        return self.buckets[k] if k < len(self.buckets) else self.max
+
+    return self.max
+
+
+  def summary(self):
+    """
+    Summarize the histogram.
+
+    @return A dictionary of the count, sum, mean, min, max, the estimated
+            median and 99th percentile, and the bucket counts.
+    """
+
+    return {
+      'count': self.count,
+      'sum': self.sum,
+      'mean': self.sum / self.count if self.count > 0 else None,
+      'min': self.min if self.count > 0 else None,
+      'max': self.max if self.count > 0 else None,
+      'p50': self.quantile(0.5),
+      'p99': self.quantile(0.99),
+      'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.bucket_counts))
+    }
+
+
+class _Span(object):
+  """
+  (internal)
+  Context manager timing a span with the monotonic performance counter.
+  """
+
+  __slots__ = ('instrumentation', 'name', 't_start')
+
+  def __init__(self, instrumentation, name):
+    self.instrumentation = instrumentation
+    self.name = name
+
+
+  def __enter__(self):
+    self.t_start = time.perf_counter()
+    return self
+
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.instrumentation.observe_span(self.name, time.perf_counter() - self.t_start)
+    return False
+
+
+class _NullSpan(object):
+  """
+  (internal)
+  Context manager doing nothing.
+  """
+
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, exc_type, exc_value, tb):
+    return False
+
+
+_null_span = _NullSpan()
+
+
+class Instrumentation(object):
+  """
+  Instrumentation collecting spans, histograms and counters, and dumping them
+  periodically to a local file.
+  """
+
+  enabled = True
+
+  def __init__(self, fname=None, fmt='jsonl', interval=10.0, labels=None):
+    """
+    Initialize an instrumentation.
+
+    @param fname The file to dump to, or `None` to only collect in memory.
+    @param fmt The dump format, which can be `jsonl` (a JSON line appended per
+               dump) or `prometheus` (the file rewritten in the Prometheus
+               text format per dump). (default: `jsonl`)
+    @param interval The minimum interval between periodic dumps in seconds.
+                    (default: 10)
+    @param labels A dictionary of labels attached to every dump.
+    """
+
+    super(Instrumentation, self).__init__()
+
+    if fmt not in ('jsonl', 'prometheus'):
+      raise ValueError('unknown instrumentation format: %s' % (fmt))
+
+    self.fname = fname
+    self.fmt = fmt
+    self.interval = interval
+    self.labels = dict(labels) if labels is not None else dict()
+
+    self.spans = dict() # name -> Histogram
+    self.histograms = dict() # name -> Histogram
+    self.counters = dict() # name -> count
+
+    self.lock = threading.Lock()
+    self.t_start = time.time()
+    self.t_last_dump = time.monotonic()
+
+
+  def span(self, name):
+    """
+    Time a span of code.
+
+    ```
+    with instrumentation.span('decode'):
+      ...
+    ```
+
+    @param name The name of the span.
+    @return A context manager recording the duration of its body.
+    """
+
+    return _Span(self, name)
+
+
+  def observe_span(self, name, seconds):
+    """
+    Record the duration of a span.
+
+    @param name The name of the span.
+    @param seconds The duration in seconds.
+    """
+
+    with self.lock:
+      h = self.spans.get(name)
+      if h is None:
+        h = self.spans[name] = Histogram(span_buckets)
+      h.observe(seconds)
+
+
+  def observe(self, name, value):
+    """
+    Record a value, such as a plan length, in a histogram.
+
+    @param name The name of the histogram.
+    @param value The observed value.
+    """
+
+    with self.lock:
+      h = self.histograms.get(name)
+      if h is None:
+        h = self.histograms[name] = Histogram(value_buckets)
+      h.observe(value)
+
+
+  def count(self, name, n=1):
+    """
+    Increment a counter.
+
+    @param name The name of the counter.
+    @param n The increment. (default: 1)
+    """
+
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + n
+
+
+  def snapshot(self):
+    """
+    Take a snapshot of the collected metrics.
+
+    @return A dictionary of the labels, the uptime, the counters and the
+            summaries of the spans and histograms.
+    """
+
+    with self.lock:
+      return {
+        'time': time.time(),
+        'uptime': time.time() - self.t_start,
+        'labels': dict(self.labels),
+        'counters': dict(self.counters),
+        'spans': dict((name, h.summary()) for name, h in self.spans.items()),
+        'histograms': dict((name, h.summary()) for name, h in self.histograms.items())
+      }
+
+
+  def dump(self, fname=None):
+    """
+    Dump the collected metrics to a file.
+
+    @param fname The file to dump to. (default: the file of the
+                 instrumentation)
+    """
+
+    if fname is None:
+      fname = self.fname
+    if fname is None:
+      return
+
+    snapshot = self.snapshot()
+    if self.fmt == 'jsonl':
+      with open(fname, 'a') as f:
+        f.write(json.dumps(snapshot, sort_keys=True) + '\n')
+    else:
+      # write to a temporary file and rename, so that scrapers never see a
+      # partially written file
+      fname_tmp = fname + '.tmp'
+      with open(fname_tmp, 'w') as f:
+        f.write(Instrumentation._PrometheusText(snapshot))
+      os.replace(fname_tmp, fname)
+
+    self.t_last_dump = time.monotonic()
+
+
+  def maybe_dump(self):
+    """
+    Dump the collected metrics if the dump interval has elapsed since the last
+    dump.
+    """
+
+    if time.monotonic() - self.t_last_dump >= self.interval:
+      self.dump()
+
+
+  def _PrometheusText(snapshot, prefix='logicrl'):
+    """
+    (internal, static)
+    Format a snapshot in the Prometheus text exposition format.
+
+    @param snapshot The snapshot.
+    @param prefix The prefix of the metric names.
+    @return The formatted text.
+    """
+
+    def metric_name(*parts):
+      return re.sub(r'[^a-zA-Z0-9_]', '_', '_'.join((prefix,) + parts))
+
+    labels = ','.join('%s="%s"' % (k, v) for k, v in sorted(snapshot['labels'].items()))
+
+    def with_labels(extra=''):
+      merged = ','.join(s for s in [labels, extra] if len(s) > 0)
+      return '{%s}' % (merged) if len(merged) > 0 else ''
+
+    lines = []
+    for name, n in sorted(snapshot['counters'].items()):
+      m = metric_name(name, 'total')
+      lines.append('# TYPE %s counter' % (m))
+      lines.append('%s%s %s' % (m, with_labels(), n))
+
+    for kind, suffix in [('spans', 'seconds'), ('histograms', '')]:
+      for name, s in sorted(snapshot[kind].items()):
+        m = metric_name(name, suffix) if len(suffix) > 0 else metric_name(name)
+        lines.append('# TYPE %s histogram' % (m))
+        cumulative = 0
+        for bound, n in s['buckets'].items():
+          cumulative += n
+          lines.append('%s_bucket%s %d' % (m, with_labels('le="%s"' % (bound)), cumulative))
+        lines.append('%s_sum%s %r' % (m, with_labels(), s['sum']))
+        lines.append('%s_count%s %d' % (m, with_labels(), s['count']))
+
+    return '\n'.join(lines) + '\n'
+
+
+  def close(self):
+    """
+    Dump the collected metrics for the last time.
+    """
+
+    self.dump()
+
+
+class NullInstrumentation(object):
+  """
+  Instrumentation with the interface of `Instrumentation` doing nothing, used
+  when instrumentation is disabled.
+  """
+
+  enabled = False
+
+  def span(self, name):
+    return _null_span
+
+
+  def observe_span(self, name, seconds):
+    pass
+
+
+  def observe(self, name, value):
+    pass
+
+
+  def count(self, name, n=1):
+    pass
+
+
+  def snapshot(self):
+    return None
+
+
+  def dump(self, fname=None):
+    pass
+
+
+  def maybe_dump(self):
+    pass
+
+
+  def close(self):
+    pass
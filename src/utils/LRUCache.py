@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+LRUCache.py
+A bounded least-recently-used (LRU) cache with hit, miss and eviction 
+counters.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+  """
+  Bounded least-recently-used (LRU) cache.
+  """
+
+  def __init__(self, capacity):
+    """
+    Initialize an LRU cache.
+
+    @param capacity The maximum number of entries to keep.
+    """
+
+    super(LRUCache, self).__init__()
+
+    assert(capacity > 0)
+
+    self.capacity = capacity
+    self.entries = OrderedDict()
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+
+  def __len__(self):
+    return len(self.entries)
+
+
+  def __contains__(self, key):
+    return key in self.entries
+
+
+  def get(self, key, default=None):
+    """
+    Look up an entry and mark it as the most recently used.
+
+    @param key The key of the entry.
+    @param default The value to return on a miss. (default: None)
+    @return The cached value, or `default` if the key is not cached.
+    """
+
+    try:
+      value = self.entries[key]
+    except KeyError:
+      self.misses += 1
+      return default
+
+    self.entries.move_to_end(key)
+    self.hits += 1
+
+    return value
+
+
+  def put(self, key, value):
+    """
+    Insert or update an entry, evicting the least recently used entry if the 
+    cache is full.
+
+    @param key The key of the entry.
+    @param value The value of the entry.
+    """
+
+    if key in self.entries:
+      self.entries.move_to_end(key)
+    elif len(self.entries) >= self.capacity:
+      self.entries.popitem(last=False)
+      self.evictions += 1
+
+    self.entries[key] = value
+
+
+  def clear(self):
+    """
+    Remove all entries. The counters are kept.
+    """
+
+    self.entries.clear()
+
+
+  def stats(self):
+    """
+    Summarize the cache counters.
+
+    @return A dictionary of the size, capacity, hits, misses and evictions.
+    """
+
+    return {
+      'size': len(self.entries),
+      'capacity': self.capacity,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions
+    }
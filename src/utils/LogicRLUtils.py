@@ -25,6 +25,65 @@ rl_frame_width = 84
 rl_frame_height = 84
 rl_state_joint = 4
 
+# note: the decoder and the RL agent share the preprocessed frames, so their 
+#       frame dimensions shall be identical.
+assert((decoder_frame_width, decoder_frame_height) == (rl_frame_width, rl_frame_height))
+
+frame_interpolations = {
+  'cubic': cv2.INTER_CUBIC,
+  'linear': cv2.INTER_LINEAR,
+  'area': cv2.INTER_AREA,
+  'nearest': cv2.INTER_NEAREST
+}
+frame_interpolation = frame_interpolations['cubic']
+
+
+def PreprocessFrame(frame, interpolation=None):
+  """
+  Convert a raw frame to the preprocessed grayscale image shared by the 
+  decoder and the RL agent, so that each frame is preprocessed only once.
+
+  @param frame The raw frame received from environment.
+  @param interpolation The OpenCV interpolation used for resizing, such as 
+                       `cv2.INTER_CUBIC`, `cv2.INTER_LINEAR` or 
+                       `cv2.INTER_AREA`. (default: `frame_interpolation`)
+  @return The grayscale image resized to `decoder_frame_height x 
+          decoder_frame_width` as a `uint8` array.
+  """
+
+  if interpolation is None:
+    interpolation = frame_interpolation
+
+  image = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+  return cv2.resize(image, (decoder_frame_width, decoder_frame_height), interpolation = interpolation)
+
+
+def ImageToDecoderState(image):
+  """
+  Convert a preprocessed image to a decoder state.
+
+  @param image The preprocessed image.
+  @return The decoder state as a `1x1xHxW` tensor sharing memory with a 
+          `float32` copy of the image.
+  """
+
+  return torch.from_numpy(image.astype(np.float32)[np.newaxis,np.newaxis,:,:])
+
+
+def ImagesToDecoderStates(images):
+  """
+  Convert a list of preprocessed images to a batch of decoder states.
+
+  @param images The preprocessed images as a list.
+  @return The decoder states as a single `Nx1xHxW` tensor, whose `i`-th row 
+          is the decoder state of the `i`-th image.
+  """
+
+  batch = np.empty((len(images), 1, decoder_frame_height, decoder_frame_width), dtype=np.float32)
+  for i, image in enumerate(images):
+    batch[i, 0] = image
+  return torch.from_numpy(batch)
+
 
 def FrameToDecoderState(frame):
   """
@@ -34,9 +93,33 @@ def FrameToDecoderState(frame):
   @return The decoder state converted from the raw frame.
   """
 
-  image = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-  resized_image = cv2.resize(image, (decoder_frame_width, decoder_frame_height), interpolation = cv2.INTER_CUBIC)[np.newaxis,np.newaxis,:,:]
-  return torch.FloatTensor(resized_image)
+  return ImageToDecoderState(PreprocessFrame(frame))
+
+
+def FramesToDecoderStates(frames):
+  """
+  Convert a list of raw frames to a batch of decoder states.
+
+  @param frames The raw frames received from environments as a list.
+  @return The decoder states converted from the raw frames as a single 
+          `Nx1xHxW` tensor, whose `i`-th row is the decoder state of the `i`-th 
+          frame.
+  """
+
+  return ImagesToDecoderStates([PreprocessFrame(frame) for frame in frames])
+
+
+def InferenceMode():
+  """
+  Create a context in which torch skips autograd bookkeeping.
+
+  @return A `torch.inference_mode` context, or a `torch.no_grad` context for 
+          torch versions without inference mode.
+  """
+
+  if hasattr(torch, 'inference_mode'):
+    return torch.inference_mode()
+  return torch.no_grad()
 
 
 def FramesToRLState(frames):
@@ -51,9 +134,95 @@ def FramesToRLState(frames):
 
   results = []
   for frame in frames:
-    image = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    resized_image = cv2.resize(image, (rl_frame_width, rl_frame_height), interpolation = cv2.INTER_CUBIC)[np.newaxis,:,:,np.newaxis]
+    resized_image = PreprocessFrame(frame)[np.newaxis,:,:,np.newaxis]
     results.append(resized_image)
   results = np.concatenate(results, -1)
   return results
 
+
+class RLFrameStack(object):
+  """
+  Preallocated ring buffer of the latest preprocessed RL frames, equivalent to 
+  `FramesToRLState` over the latest `rl_state_joint` raw frames.
+
+  Each frame is preprocessed exactly once on arrival and written into the 
+  buffer in place. The buffer holds every frame twice, `joint` slots apart, so 
+  that the latest `joint` frames are always a contiguous window of slots and 
+  the stacked state is a slice of the buffer rather than a concatenation.
+  """
+
+  def __init__(self, joint=rl_state_joint):
+    """
+    Initialize an RL frame stack.
+
+    @param joint The number of frames stacked into an RL state. (default: 
+                 `rl_state_joint`)
+    """
+
+    super(RLFrameStack, self).__init__()
+
+    self.joint = joint
+    self.buffer = np.zeros((1, rl_frame_height, rl_frame_width, 2 * joint), dtype=np.uint8)
+    self.pos = 0 # slot of the latest frame
+
+
+  def reset(self, frame):
+    """
+    Fill the stack with a single raw frame, as at the beginning of an episode.
+
+    @param frame The raw frame received from environment.
+    """
+
+    self.resetImage(PreprocessFrame(frame))
+
+
+  def resetImage(self, image):
+    """
+    Fill the stack with a single preprocessed image, as at the beginning of an 
+    episode.
+
+    @param image The preprocessed image.
+    """
+
+    self.buffer[0] = image[:,:,np.newaxis]
+    self.pos = self.joint - 1
+
+
+  def append(self, frame):
+    """
+    Push a raw frame into the stack, replacing the oldest frame.
+
+    @param frame The raw frame received from environment.
+    """
+
+    self.appendImage(PreprocessFrame(frame))
+
+
+  def appendImage(self, image):
+    """
+    Push a preprocessed image into the stack, replacing the oldest frame.
+
+    @param image The preprocessed image.
+    """
+
+    self.pos = (self.pos + 1) % self.joint
+    self.buffer[0,:,:,self.pos] = image
+    self.buffer[0,:,:,self.pos + self.joint] = image
+
+
+  def state(self, copy=True):
+    """
+    Get the stacked RL agent state.
+
+    @param copy The switch to return a copy of the state. A view into the 
+                buffer is returned otherwise, which is overwritten by later 
+                frames, so it shall not be kept across `append` calls, e.g. 
+                in replay memories. (default: True)
+    @return The RL agent state as a `1 x rl_frame_height x rl_frame_width x 
+            joint` array, with frames ordered from the oldest to the latest.
+    """
+
+    view = self.buffer[:,:,:,self.pos + 1:self.pos + 1 + self.joint]
+    if copy:
+      return view.copy()
+    return view
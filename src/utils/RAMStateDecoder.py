@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+
+"""
+RAMStateDecoder.py
+Symbolic state decoder reading the Atari RAM of Montezuma's Revenge instead of
+the rendered frames.
+
+The decoder has no built-in spots and flags, which are calibrated against RAM
+states annotated by hand with their symbolic states:
+
+  1. record episodes with `launch_manual.py --record_dir DIR`;
+  2. annotate the symbolic states of some of the recorded steps in a text
+     file, one step per line as `episode step predicate ...`, with the
+     predicates as comma-separated strings, e.g. `actorInRoom,room_1`;
+  3. run `launch_ram_calibration.py --record_dir DIR --annotations FILE
+     --samples SAMPLES --output CALIBRATION`, which replays the episodes from
+     their emulator state snapshots to recover the RAM of the annotated steps,
+     fits the spots (`CalibrateSpots`) and the flags (`CalibrateFlags`),
+     reports their agreement (`DecoderAgreement`) with the annotations, and
+     writes them with `SaveCalibration`;
+  4. construct the decoder from the calibration loaded by `LoadCalibration`.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import json
+import numpy as np
+
+
+# RAM addresses (indices into the 128-byte RAM)
+ram_room_index = 3
+ram_actor_x_index = 42
+ram_actor_y_index = 43
+ram_inventory_index = 65
+ram_room_objects_index = 66
+
+# room numbers in RAM -> room objects
+default_rooms = {
+  1: 'room_1'
+}
+
+# predicates decoded from the RAM flags
+default_flag_predicates = [
+  'actorWithKey',
+  'actorWithSword',
+  'keyExists,room_1,key_1',
+  'monsterExists,room_1,skull_1',
+  'doorExists,room_1,door_1',
+  'doorExists,room_1,door_2'
+]
+
+# RAM indices the flags are fitted in
+default_flag_indices = [ram_inventory_index, ram_room_objects_index]
+
+
+class RAMStateDecoder(object):
+  """
+  Symbolic state decoder mapping Atari RAM to predicate strings.
+
+  It shares the `decode_state`/`decode_states` interface of the CNN decoder,
+  but takes RAM instead of decoder states. The actor position is mapped to a
+  spot through a dense per-room lookup table, and the object and inventory
+  flags are tested with vectorized bit masks, so decoding a batch is a
+  handful of NumPy operations.
+  """
+
+  # let the callers know to feed the RAM instead of the frames
+  decodes_ram = True
+
+  def __init__(self, spots, flags, rooms=None):
+    """
+    Initialize a RAM state decoder from a calibration, see `LoadCalibration`.
+
+    @param spots A dictionary mapping room objects to lists of `(spot, x_min,
+                 x_max, y_min, y_max)` tuples, as fitted by `CalibrateSpots`.
+    @param flags A list of `(predicate string, room object or None, RAM index,
+                 bit mask, expected)` tuples, as fitted by `CalibrateFlags`.
+    @param rooms A dictionary mapping room numbers in RAM to room objects.
+                 (default: `default_rooms`)
+    """
+
+    super(RAMStateDecoder, self).__init__()
+
+    if spots is None or flags is None:
+      raise ValueError('the RAM state decoder requires calibrated spots and flags, '
+                       'see launch_ram_calibration.py')
+
+    if rooms is None:
+      rooms = default_rooms
+
+    # construct room lookup table
+    self.room_names = sorted(set(rooms.values()))
+    self.room_table = np.full(256, -1, dtype=np.int16)
+    for room_number, room in rooms.items():
+      self.room_table[room_number] = self.room_names.index(room)
+    self.room_predicates = ['actorInRoom,%s' % (room) for room in self.room_names]
+
+    # construct spot lookup table, indexed by (room, x, y)
+    self.spot_predicates = []
+    self.spot_table = np.full((len(self.room_names), 256, 256), -1, dtype=np.int16)
+    for i_room, room in enumerate(self.room_names):
+      for spot, x_min, x_max, y_min, y_max in spots.get(room, []):
+        self.spot_table[i_room, x_min:x_max+1, y_min:y_max+1] = len(self.spot_predicates)
+        self.spot_predicates.append('actorOnSpot,%s,%s' % (room, spot))
+
+    # construct flag tables
+    self.flag_predicates = [flag[0] for flag in flags]
+    self.flag_rooms = np.array(
+      [-1 if flag[1] is None else self.room_names.index(flag[1]) for flag in flags], dtype=np.int16)
+    self.flag_indices = np.array([flag[2] for flag in flags], dtype=np.intp)
+    self.flag_masks = np.array([flag[3] for flag in flags], dtype=np.uint8)
+    self.flag_expected = np.array([flag[4] for flag in flags], dtype=bool)
+
+    # bitsets of the predicates, see `bind_predicate_bits`
+    self.room_bits = None
+    self.spot_bits = None
+    self.flag_bits = None
+
+
+  def bind_predicate_bits(self, predicate_bits):
+    """
+    Precompute the bitsets of all the predicates the decoder can produce, so 
+    that states can be decoded directly into bitsets with `encode_states`.
+
+    @param predicate_bits The function mapping a predicate string to its 
+                          bitset, such as `AutoAgent.predicateBits`.
+    """
+
+    self.room_bits = [predicate_bits(predstr) for predstr in self.room_predicates] + [0]
+    self.spot_bits = [predicate_bits(predstr) for predstr in self.spot_predicates] + [0]
+    self.flag_bits = [predicate_bits(predstr) for predstr in self.flag_predicates]
+
+
+  def _Lookup(self, rams):
+    """
+    (internal)
+    Look up the rooms, spots and flags of a batch of RAM states.
+
+    @param rams The RAM states as an `Nx128` array of `uint8`.
+    @return A tuple `(rooms, spots, present)` of the room and spot indices, 
+            which are `-1` if unknown, and an `NxF` boolean array of the 
+            present flags.
+    """
+
+    rams = np.asarray(rams, dtype=np.uint8).reshape(-1, 128)
+
+    # look up rooms and spots
+    rooms = self.room_table[rams[:, ram_room_index]]
+    known = rooms >= 0
+    spots = np.full(len(rams), -1, dtype=np.int16)
+    spots[known] = self.spot_table[
+      rooms[known], rams[known, ram_actor_x_index], rams[known, ram_actor_y_index]]
+
+    # test flags
+    present = ((rams[:, self.flag_indices] & self.flag_masks) != 0) == self.flag_expected
+    present &= (self.flag_rooms < 0) | (self.flag_rooms == rooms[:, np.newaxis])
+
+    return (rooms, spots, present)
+
+
+  def decode_states(self, rams):
+    """
+    Decode a batch of RAM states.
+
+    @param rams The RAM states as an `Nx128` array of `uint8`.
+    @return A list of the `N` decoded states, each of which is a list of
+            comma-separated predicate strings.
+    """
+
+    rooms, spots, present = self._Lookup(rams)
+
+    decoded = []
+    for i in range(len(rooms)):
+      predicate_strs = [self.flag_predicates[j] for j in np.flatnonzero(present[i])]
+      if rooms[i] >= 0:
+        predicate_strs.append(self.room_predicates[rooms[i]])
+      if spots[i] >= 0:
+        predicate_strs.append(self.spot_predicates[spots[i]])
+      decoded.append(predicate_strs)
+
+    return decoded
+
+
+  def decode_state(self, ram):
+    """
+    Decode a RAM state.
+
+    @param ram The RAM state as an array of 128 `uint8`.
+    @return The decoded state as a list of comma-separated predicate strings.
+    """
+
+    return self.decode_states(ram)[0]
+
+
+  def encode_states(self, rams):
+    """
+    Decode a batch of RAM states directly into bitsets. The predicate bitsets 
+    shall have been bound with `bind_predicate_bits`.
+
+    @param rams The RAM states as an `Nx128` array of `uint8`.
+    @return A list of the `N` decoded states encoded as bitsets.
+    """
+
+    rooms, spots, present = self._Lookup(rams)
+
+    encoded = []
+    for i in range(len(rooms)):
+      # note: index `-1` picks the trailing zero bitset of unknown rooms and 
+      #       spots.
+      bits = self.room_bits[rooms[i]] | self.spot_bits[spots[i]]
+      for j in np.flatnonzero(present[i]):
+        bits |= self.flag_bits[j]
+      encoded.append(bits)
+
+    return encoded
+
+
+  def encode_state(self, ram):
+    """
+    Decode a RAM state directly into a bitset. The predicate bitsets shall 
+    have been bound with `bind_predicate_bits`.
+
+    @param ram The RAM state as an array of 128 `uint8`.
+    @return The decoded state encoded as a bitset.
+    """
+
+    return self.encode_states(ram)[0]
+
+
+def CalibrateSpots(rams, labels, rooms=None, quantile=0.0):
+  """
+  Fit the spot bounds of the actor from RAM states labeled with symbolic 
+  states, as the bounding boxes of the actor positions labeled on each spot.
+
+  @param rams The RAM states as an `Nx128` array of `uint8`.
+  @param labels The `N` labeled symbolic states as sets of comma-separated 
+                predicate strings.
+  @param rooms A dictionary mapping room numbers in RAM to room objects. 
+               (default: `default_rooms`)
+  @param quantile The fraction of the positions to trim on each side of the 
+                  bounds against label noise. (default: 0)
+  @return A dictionary mapping room objects to lists of `(spot, x_min, x_max, 
+          y_min, y_max)` tuples, as taken by `RAMStateDecoder`.
+  """
+
+  if rooms is None:
+    rooms = default_rooms
+
+  rams = np.asarray(rams, dtype=np.uint8).reshape(-1, 128)
+
+  # collect the actor positions labeled on each spot of the known rooms
+  positions = dict() # (room, spot) -> [ (x, y), ... ]
+  for ram, label in zip(rams, labels):
+    room = rooms.get(int(ram[ram_room_index]))
+    if room is None:
+      continue
+    for predstr in label:
+      p = predstr.split(',')
+      if p[0] == 'actorOnSpot' and p[1] == room:
+        positions.setdefault((room, p[2]), []).append(
+          (ram[ram_actor_x_index], ram[ram_actor_y_index]))
+
+  spots = dict()
+  for (room, spot), xys in sorted(positions.items()):
+    xys = np.array(xys, dtype=np.int64)
+    x_min, y_min = np.floor(np.quantile(xys, quantile, axis=0)).astype(int)
+    x_max, y_max = np.ceil(np.quantile(xys, 1.0 - quantile, axis=0)).astype(int)
+    spots.setdefault(room, []).append((spot, int(x_min), int(x_max), int(y_min), int(y_max)))
+
+  return spots
+
+
+def CalibrateFlags(rams, labels, predicates=None, rooms=None, indices=None):
+  """
+  Fit the RAM bit of each flag predicate from RAM states labeled with 
+  symbolic states, as the single bit of the candidate RAM indices agreeing 
+  the most with the labels, either set or cleared.
+
+  A room scoped predicate, whose second argument is a room object, is only 
+  fitted on the states in its room. A predicate whose label never changes in 
+  its states agrees with any constant bit, so it is not fitted. The 
+  candidate RAM indices are restricted to the ones known to hold flags, since 
+  some of the other 1024 bits of the RAM, e.g. timers and positions, are 
+  bound to agree with the labels of a few hundred states by chance.
+
+  @param rams The RAM states as an `Nx128` array of `uint8`.
+  @param labels The `N` labeled symbolic states as sets of comma-separated 
+                predicate strings.
+  @param predicates The predicate strings to fit. 
+                    (default: `default_flag_predicates`)
+  @param rooms A dictionary mapping room numbers in RAM to room objects. 
+               (default: `default_rooms`)
+  @param indices The candidate RAM indices. (default: `default_flag_indices`)
+  @return A tuple `(flags, agreements)`, where `flags` is a list of 
+          `(predicate string, room object or None, RAM index, bit mask, 
+          expected)` tuples, as taken by `RAMStateDecoder`, and `agreements` 
+          maps each 
+          fitted predicate string to the fraction of its states the bit 
+          agrees with.
+  """
+
+  if predicates is None:
+    predicates = default_flag_predicates
+
+  if rooms is None:
+    rooms = default_rooms
+
+  if indices is None:
+    indices = default_flag_indices
+
+  rams = np.asarray(rams, dtype=np.uint8).reshape(-1, 128)
+  sample_rooms = np.array([rooms.get(int(room)) for room in rams[:, ram_room_index]], dtype=object)
+
+  # note: the bits are unpacked with the most significant bit first.
+  bits = np.unpackbits(rams[:, indices, np.newaxis], axis=2).astype(bool)
+
+  flags = []
+  agreements = dict()
+  for predstr in predicates:
+    p = predstr.split(',')
+    room = p[1] if len(p) > 1 and p[1] in rooms.values() else None
+
+    selected = np.ones(len(rams), dtype=bool) if room is None else sample_rooms == room
+    y = np.array([predstr in label for label, s in zip(labels, selected) if s], dtype=bool)
+    if len(y) == 0 or y.all() or not y.any():
+      continue
+
+    # agreement of every bit with the labels, as set and as cleared
+    agree = (bits[selected] == y[:, np.newaxis, np.newaxis]).mean(axis=0)
+    k, bit = np.unravel_index(np.argmax(np.maximum(agree, 1.0 - agree)), agree.shape)
+    expected = bool(agree[k, bit] >= 0.5)
+
+    flags.append((predstr, room, int(indices[k]), 0x80 >> int(bit), expected))
+    agreements[predstr] = float(max(agree[k, bit], 1.0 - agree[k, bit]))
+
+  return (flags, agreements)
+
+
+def DecoderAgreement(decoder, rams, labels):
+  """
+  Measure the agreement of a RAM state decoder with labeled symbolic states, 
+  over the predicates the decoder can produce. The other labeled predicates 
+  are ignored.
+
+  @param decoder The RAM state decoder.
+  @param rams The RAM states as an `Nx128` array of `uint8`.
+  @param labels The `N` labeled symbolic states as sets of comma-separated 
+                predicate strings.
+  @return A dictionary of the number of `samples`, the fraction of the 
+          states decoded exactly (`agreement`), and the fraction of the states 
+          each predicate is decoded correctly in (`predicates`).
+  """
+
+  vocabulary = set(decoder.room_predicates + decoder.spot_predicates + decoder.flag_predicates)
+
+  decoded = decoder.decode_states(rams)
+  exact = 0
+  correct = dict((predstr, 0) for predstr in vocabulary)
+  for predicate_strs, label in zip(decoded, labels):
+    predicate_strs = set(predicate_strs)
+    label = vocabulary.intersection(label)
+    exact += int(predicate_strs == label)
+    for predstr in vocabulary:
+      correct[predstr] += int((predstr in predicate_strs) == (predstr in label))
+
+  n = max(len(decoded), 1)
+
+  return {
+    'samples': len(decoded),
+    'agreement': exact / float(n),
+    'predicates': dict((predstr, correct[predstr] / float(n)) for predstr in sorted(vocabulary))
+  }
+
+
+def SaveCalibration(fname, spots, flags, rooms=None):
+  """
+  Save a calibration of the RAM state decoder as JSON.
+
+  @param fname The calibration file.
+  @param spots The spots, as fitted by `CalibrateSpots`.
+  @param flags The flags, as fitted by `CalibrateFlags`.
+  @param rooms A dictionary mapping room numbers in RAM to room objects. 
+               (default: `default_rooms`)
+  """
+
+  if rooms is None:
+    rooms = default_rooms
+
+  calibration = {
+    'rooms': dict((str(room_number), room) for room_number, room in rooms.items()),
+    'spots': dict((room, [list(spot) for spot in room_spots]) for room, room_spots in spots.items()),
+    'flags': [list(flag) for flag in flags]
+  }
+
+  with open(fname, 'w') as f:
+    json.dump(calibration, f, indent=2, sort_keys=True)
+
+
+def LoadCalibration(fname):
+  """
+  Load a calibration of the RAM state decoder saved by `SaveCalibration`.
+
+  @param fname The calibration file.
+  @return A tuple `(spots, flags, rooms)` of the arguments to construct the 
+          decoder with, i.e. `RAMStateDecoder(*LoadCalibration(fname))`.
+  """
+
+  with open(fname, 'r') as f:
+    calibration = json.load(f)
+
+  rooms = dict((int(room_number), room) for room_number, room in calibration['rooms'].items())
+  spots = dict((room, [tuple(spot) for spot in room_spots]) 
+               for room, room_spots in calibration['spots'].items())
+  flags = [tuple(flag) for flag in calibration['flags']]
+
+  return (spots, flags, rooms)
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+"""
+ReplayDataset.py
+Memory-mapped dataset of recorded episodes for training the decoder and the
+RL agents. The compressed chunks of the recorded episodes are materialized
+once into uncompressed `.npy` arrays of preprocessed images, which are then
+memory-mapped, so that only the pages touched by the minibatches are read.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import json
+import queue
+import threading
+import numpy as np
+import torch
+import torch.utils.data
+
+from utils import LogicRLUtils as Util
+from utils.EpisodeRecorder import EpisodeReader, episode_dir_format
+
+
+# materialized arrays of an episode, and the meta data written last to mark
+# the materialization complete
+array_names = ['images', 'actions', 'rewards', 'lives', 'symbolic_states']
+materialized_file = 'materialized.json'
+
+
+def MaterializeEpisode(record_dir, episode, interpolation=None, overwrite=False):
+  """
+  Materialize a recorded episode into uncompressed arrays of preprocessed
+  images, actions, rewards, lives and symbolic states in its directory. The
+  images are written chunk by chunk into a memory-mapped file, so that the
+  episode never has to fit in memory.
+
+  @param record_dir The recording directory.
+  @param episode The index of the episode.
+  @param interpolation The OpenCV interpolation flag used to downscale the
+                       frames. (default: `frame_interpolation`)
+  @param overwrite The switch to materialize the episode again even if it is
+                   already materialized with the same interpolation.
+  @return The directory of the episode.
+  """
+
+  if interpolation is None:
+    interpolation = Util.frame_interpolation
+
+  episode_dir = os.path.join(record_dir, episode_dir_format % (episode))
+  fname_meta = os.path.join(episode_dir, materialized_file)
+  if not overwrite and os.path.exists(fname_meta):
+    with open(fname_meta, 'r') as f:
+      if json.load(f)['interpolation'] == interpolation:
+        return episode_dir
+
+  reader = EpisodeReader(record_dir, cache_size=1)
+  meta = reader.meta(episode)
+  n = meta['num_steps']
+
+  fname_images = os.path.join(episode_dir, 'images.npy')
+  images = np.lib.format.open_memmap(
+    fname_images + '.tmp', mode='w+', dtype=np.uint8,
+    shape=(n, Util.rl_frame_height, Util.rl_frame_width))
+
+  columns = dict((name, []) for name in array_names[1:])
+  t = 0
+  for k in range(meta['num_chunks']):
+    chunk = reader.chunk(episode, k)
+    for frame in chunk['frames']:
+      images[t] = Util.PreprocessFrame(frame, interpolation)
+      t += 1
+    for name in columns:
+      columns[name].append(chunk[name])
+  assert(t == n)
+
+  images.flush()
+  del images
+  os.replace(fname_images + '.tmp', fname_images)
+
+  for name, arrays in columns.items():
+    fname = os.path.join(episode_dir, name + '.npy')
+    with open(fname + '.tmp', 'wb') as f:
+      np.save(f, np.concatenate(arrays))
+    os.replace(fname + '.tmp', fname)
+
+  with open(fname_meta, 'w') as f:
+    json.dump({'interpolation': interpolation, 'num_steps': n}, f)
+
+  return episode_dir
+
+
+def MaterializeEpisodes(record_dir, episodes=None, interpolation=None, overwrite=False):
+  """
+  Materialize the recorded episodes, see `MaterializeEpisode`.
+
+  @param record_dir The recording directory.
+  @param episodes The indices of the episodes. (default: all the completely
+                  recorded episodes)
+  @param interpolation The OpenCV interpolation flag used to downscale the
+                       frames. (default: `frame_interpolation`)
+  @param overwrite The switch to materialize the episodes again.
+  @return The list of the indices of the materialized episodes.
+  """
+
+  if episodes is None:
+    episodes = EpisodeReader(record_dir).episodes()
+
+  for episode in episodes:
+    MaterializeEpisode(record_dir, episode, interpolation, overwrite)
+
+  return list(episodes)
+
+
+class ReplayDataset(torch.utils.data.Dataset):
+  """
+  Dataset of the steps of materialized episodes, memory-mapped on first
+  access. An item is a dictionary of
+
+  - `rl_state`: the `HxWxJ` stacked RL state of the step, as a row of
+    `FramesToRLState` over the latest `J` frames, repeating the first frame
+    of the episode at its beginning like `RLFrameStack`,
+  - `decoder_state`: the `1xHxW` decoder input of the step, as a row of
+    `ImagesToDecoderStates`,
+  - `action`, `reward`, `lives` and `done` of the step,
+  - `symbolic_state`: the recorded symbolic state as sorted comma separated
+    predicates separated by semicolons, empty if not decoded.
+
+  Indexing with a list of indices returns a minibatch of the same keys with
+  the items stacked, gathered with one fancy index per episode. This is used
+  with `ReplayDataLoader`, so that each worker assembles whole minibatches.
+  """
+
+  def __init__(self, record_dir, episodes=None, rl_state_joint=Util.rl_state_joint,
+               interpolation=None, materialize=True):
+    """
+    Initialize a replay dataset.
+
+    @param record_dir The recording directory.
+    @param episodes The indices of the episodes. (default: all the completely
+                    recorded episodes)
+    @param rl_state_joint The number of frames stacked into a RL state.
+    @param interpolation The OpenCV interpolation flag used to downscale the
+                         frames. (default: `frame_interpolation`)
+    @param materialize The switch to materialize the episodes not yet
+                       materialized.
+    """
+
+    super(ReplayDataset, self).__init__()
+
+    self.record_dir = record_dir
+    self.rl_state_joint = rl_state_joint
+
+    if episodes is None:
+      episodes = EpisodeReader(record_dir).episodes()
+    self.episodes = list(episodes)
+    if materialize:
+      MaterializeEpisodes(record_dir, self.episodes, interpolation)
+
+    lengths = []
+    for episode in self.episodes:
+      fname = os.path.join(record_dir, episode_dir_format % (episode), materialized_file)
+      with open(fname, 'r') as f:
+        lengths.append(json.load(f)['num_steps'])
+    self.lengths = np.array(lengths, dtype=np.int64)
+    self.offsets = np.concatenate([[0], np.cumsum(self.lengths)])
+
+    self.arrays = dict() # episode position -> dictionary of memory maps
+
+
+  def __getstate__(self):
+    # note: the memory maps are opened again in each worker process instead
+    #       of being pickled.
+    state = self.__dict__.copy()
+    state['arrays'] = dict()
+    return state
+
+
+  def __len__(self):
+    return int(self.offsets[-1])
+
+
+  def episode_arrays(self, k):
+    """
+    Memory-map the arrays of an episode.
+
+    @param k The position of the episode in the dataset.
+    @return A dictionary of the read-only memory-mapped arrays.
+    """
+
+    arrays = self.arrays.get(k)
+    if arrays is None:
+      episode_dir = os.path.join(self.record_dir, episode_dir_format % (self.episodes[k]))
+      arrays = dict((name, np.load(os.path.join(episode_dir, name + '.npy'), mmap_mode='r'))
+                    for name in array_names)
+      self.arrays[k] = arrays
+
+    return arrays
+
+
+  def locate(self, indices):
+    """
+    Locate dataset indices in the episodes.
+
+    @param indices The dataset indices as an array.
+    @return A tuple `(ks, ts)` of the positions of the episodes and the steps
+            in the episodes.
+    """
+
+    indices = np.asarray(indices, dtype=np.int64)
+    ks = np.searchsorted(self.offsets, indices, side='right') - 1
+
+    return (ks, indices - self.offsets[ks])
+
+
+  def image(self, k, t):
+    """
+    Access a preprocessed image without copying.
+
+    @param k The position of the episode in the dataset.
+    @param t The step in the episode.
+    @return The `HxW` image as a read-only view of the memory map.
+    """
+
+    return self.episode_arrays(k)['images'][t]
+
+
+  def __getitem__(self, index):
+    if isinstance(index, (int, np.integer)):
+      if index < 0:
+        index += len(self)
+      if index < 0 or index >= len(self):
+        raise IndexError('index %d out of range of %d steps' % (index, len(self)))
+      batch = self.batch([index])
+      return dict((key, value[0]) for key, value in batch.items())
+
+    return self.batch(index)
+
+
+  def batch(self, indices):
+    """
+    Assemble a minibatch.
+
+    @param indices The dataset indices of the steps.
+    @return A dictionary of the stacked `rl_state`, `decoder_state`,
+            `action`, `reward`, `lives` and `done` arrays, and the list of
+            `symbolic_state` strings, in the order of the indices.
+    """
+
+    ks, ts = self.locate(indices)
+    n = len(ts)
+    J = self.rl_state_joint
+    H, W = Util.rl_frame_height, Util.rl_frame_width
+
+    rl_states = np.empty((n, H, W, J), dtype=np.uint8)
+    decoder_states = np.empty((n, 1, H, W), dtype=np.float32)
+    actions = np.empty(n, dtype=np.int64)
+    rewards = np.empty(n, dtype=np.float32)
+    lives = np.empty(n, dtype=np.int64)
+    dones = np.empty(n, dtype=np.bool_)
+    symbolic_states = [None] * n
+
+    for k in np.unique(ks):
+      rows = np.nonzero(ks == k)[0]
+      steps = ts[rows]
+      arrays = self.episode_arrays(k)
+
+      # gather the stacked frames, repeating the first frame at the beginning
+      window = np.maximum(steps[:,np.newaxis] + np.arange(1 - J, 1)[np.newaxis,:], 0)
+      frames = arrays['images'][window.ravel()].reshape(len(rows), J, H, W)
+      rl_states[rows] = frames.transpose(0, 2, 3, 1)
+      decoder_states[rows, 0] = frames[:, -1]
+
+      actions[rows] = arrays['actions'][steps]
+      rewards[rows] = arrays['rewards'][steps]
+      lives[rows] = arrays['lives'][steps]
+      dones[rows] = steps == self.lengths[k] - 1
+      for row, s in zip(rows, arrays['symbolic_states'][steps]):
+        symbolic_states[row] = str(s)
+
+    return {
+      'rl_state': rl_states,
+      'decoder_state': decoder_states,
+      'action': actions,
+      'reward': rewards,
+      'lives': lives,
+      'done': dones,
+      'symbolic_state': symbolic_states
+    }
+
+
+class ReplayBatchIterator(object):
+  """
+  Iterator over shuffled minibatches of a replay dataset, assembled ahead by a
+  background thread. Gathering from the memory maps mostly waits on page
+  faults and copies, which overlap with the training step consuming the
+  previous minibatch.
+  """
+
+  def __init__(self, dataset, batch_size=32, shuffle=True, drop_last=False,
+               prefetch=2, seed=None):
+    """
+    Initialize a minibatch iterator.
+
+    @param dataset The replay dataset.
+    @param batch_size The number of steps per minibatch. (default: 32)
+    @param shuffle The switch to shuffle the steps at every epoch.
+    @param drop_last The switch to drop the last incomplete minibatch.
+    @param prefetch The number of minibatches to assemble ahead. (default: 2)
+    @param seed The random seed of the shuffling.
+    """
+
+    super(ReplayBatchIterator, self).__init__()
+
+    self.dataset = dataset
+    self.batch_size = batch_size
+    self.shuffle = shuffle
+    self.drop_last = drop_last
+    self.prefetch = prefetch
+    self.rng = np.random.RandomState(seed)
+
+
+  def __len__(self):
+    n = len(self.dataset)
+    if self.drop_last:
+      return n // self.batch_size
+    return (n + self.batch_size - 1) // self.batch_size
+
+
+  def __iter__(self):
+    """
+    Iterate over an epoch.
+
+    @return A generator of the minibatches as returned by `ReplayDataset.batch`.
+    """
+
+    n = len(self.dataset)
+    order = self.rng.permutation(n) if self.shuffle else np.arange(n)
+    batches = [order[i:i+self.batch_size] for i in range(0, n, self.batch_size)]
+    if self.drop_last and len(batches) > 0 and len(batches[-1]) < self.batch_size:
+      batches.pop()
+
+    ready = queue.Queue(self.prefetch)
+    stop = threading.Event()
+
+    def produce():
+      try:
+        for indices in batches:
+          # note: the indices are sorted for locality in the memory maps.
+          item = self.dataset.batch(np.sort(indices))
+          while not stop.is_set():
+            try:
+              ready.put(item, timeout=0.1)
+              break
+            except queue.Full:
+              pass
+          if stop.is_set():
+            return
+        ready.put(None)
+      except Exception as e:
+        ready.put(e)
+
+    producer = threading.Thread(target=produce, name='ReplayBatchIterator')
+    producer.daemon = True
+    producer.start()
+
+    try:
+      while True:
+        item = ready.get()
+        if item is None:
+          break
+        if isinstance(item, Exception):
+          raise item
+        yield item
+    finally:
+      stop.set()
+      producer.join()
+
+
+def ReplayDataLoader(dataset, batch_size=32, shuffle=True, drop_last=False,
+                     num_workers=0, **kwargs):
+  """
+  Construct a `torch.utils.data.DataLoader` over a replay dataset, in which
+  each worker assembles whole minibatches with `ReplayDataset.batch` rather
+  than collating single steps.
+
+  @param dataset The replay dataset.
+  @param batch_size The number of steps per minibatch. (default: 32)
+  @param shuffle The switch to shuffle the steps at every epoch.
+  @param drop_last The switch to drop the last incomplete minibatch.
+  @param num_workers The number of worker processes. (default: 0)
+  @param kwargs Additional arguments of the `DataLoader`, such as
+                `pin_memory` or `prefetch_factor`.
+  @return The data loader, yielding the minibatches with the arrays
+          converted to tensors.
+  """
+
+  if shuffle:
+    sampler = torch.utils.data.RandomSampler(dataset)
+  else:
+    sampler = torch.utils.data.SequentialSampler(dataset)
+  batch_sampler = torch.utils.data.BatchSampler(sampler, batch_size, drop_last)
+
+  # note: the batch sampler is passed as the sampler with automatic batching
+  #       disabled, so that the dataset is indexed with lists of indices.
+  return torch.utils.data.DataLoader(
+    dataset, sampler=batch_sampler, batch_size=None, num_workers=num_workers,
+    **kwargs)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""
+ReplayEngine.py
+Deterministic replay of recorded episodes by restoring the emulator from the
+nearest recorded ALE state snapshot and stepping the recorded actions.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import json
+import struct
+import numpy as np
+
+from utils.EpisodeRecorder import EpisodeReader
+
+
+# header of the snapshots including the random number generator of the
+# environment, followed by the length of the emulator state
+snapshot_magic = b'SNP1'
+
+
+def CloneRandomState(np_random):
+  """
+  Serialize the state of a random number generator.
+
+  @param np_random The random number generator, either a legacy
+                   `np.random.RandomState` or a `np.random.Generator`.
+  @return The state as a JSON string.
+  """
+
+  if isinstance(np_random, np.random.RandomState):
+    state = np_random.get_state(legacy=False)
+  else:
+    state = np_random.bit_generator.state
+
+  # note: the keys of the Mersenne Twister are arrays.
+  return json.dumps(state, default=lambda x: x.tolist())
+
+
+def RestoreRandomState(np_random, s):
+  """
+  Restore the state of a random number generator in place.
+
+  @param np_random The random number generator.
+  @param s The state serialized by `CloneRandomState`.
+  """
+
+  state = json.loads(s)
+  if 'key' in state['state']:
+    state['state']['key'] = np.array(state['state']['key'], dtype=np.uint32)
+
+  if isinstance(np_random, np.random.RandomState):
+    np_random.set_state(state)
+  else:
+    np_random.bit_generator.state = state
+
+
+def CloneState(env):
+  """
+  Clone the full state of an Atari environment, which consists of the
+  emulator state, including the random number generator of the emulator
+  driving the sticky actions, and the state of the random number generator of
+  the environment, which draws the number of frames skipped per step of the
+  `-v0` and `-v4` environments.
+
+  @param env The Atari environment.
+  @return The serialized state as an array of `uint8`.
+  """
+
+  ale_state = np.asarray(env.unwrapped.clone_full_state(), dtype=np.uint8).tobytes()
+
+  rng_state = b''
+  if getattr(env.unwrapped, 'np_random', None) is not None:
+    rng_state = CloneRandomState(env.unwrapped.np_random).encode('utf-8')
+
+  data = snapshot_magic + struct.pack('<Q', len(ale_state)) + ale_state + rng_state
+
+  return np.frombuffer(data, dtype=np.uint8).copy()
+
+
+def RestoreState(env, snapshot):
+  """
+  Restore the full state of an Atari environment cloned by `CloneState`.
+
+  @param env The Atari environment.
+  @param snapshot The serialized state.
+  """
+
+  data = np.asarray(snapshot, dtype=np.uint8).tobytes()
+
+  # note: the snapshots recorded before the random number generator of the
+  #       environment was cloned only hold the emulator state.
+  if not data.startswith(snapshot_magic):
+    env.unwrapped.restore_full_state(np.asarray(snapshot, dtype=np.uint8))
+    return
+
+  k = len(snapshot_magic)
+  n = struct.unpack('<Q', data[k:k+8])[0]
+  ale_state = np.frombuffer(data[k+8:k+8+n], dtype=np.uint8).copy()
+  env.unwrapped.restore_full_state(ale_state)
+
+  rng_state = data[k+8+n:]
+  if len(rng_state) > 0:
+    RestoreRandomState(env.unwrapped.np_random, rng_state.decode('utf-8'))
+
+
+def ScreenFrame(env):
+  """
+  Read the current screen of an Atari environment as a raw frame.
+
+  @param env The Atari environment.
+  @return The frame as a `HxWx3` array of `uint8`.
+  """
+
+  return env.unwrapped.ale.getScreenRGB()
+
+
+class ReplayEngine(object):
+  """
+  Engine restoring an environment to any step of a recorded episode in a time
+  bounded by the snapshot interval, and replaying the recorded actions from
+  there.
+
+  The replay is deterministic, since the snapshots include the random number
+  generators of both the emulator and the environment. Snapshots recorded
+  without the random number generator of the environment only replay
+  deterministically in environments skipping a fixed number of frames, like
+  the `Deterministic` and `NoFrameskip` Atari environments. A divergence is
+  detected by comparing the replayed frames against the recorded frames.
+  """
+
+  def __init__(self, env, record_dir):
+    """
+    Initialize a replay engine.
+
+    @param env The Atari environment of the same game as the recording.
+    @param record_dir The recording directory.
+    """
+
+    super(ReplayEngine, self).__init__()
+
+    self.env = env
+    self.reader = EpisodeReader(record_dir)
+    self.actions = dict() # episode -> recorded actions
+
+
+  def recorded_actions(self, episode):
+    """
+    Read the recorded actions of an episode.
+
+    @param episode The index of the episode.
+    @return The actions as an array.
+    """
+
+    if episode not in self.actions:
+      self.actions[episode] = self.reader.column(episode, 'actions')
+
+    return self.actions[episode]
+
+
+  def segments(self, episode):
+    """
+    Split an episode into segments starting at its snapshots, which can be
+    replayed independently, e.g. in parallel.
+
+    @param episode The index of the episode.
+    @return A list of `(start, stop)` step ranges.
+    """
+
+    n = self.reader.num_steps(episode)
+    starts = [t for t in self.reader.meta(episode).get('snapshot_steps', []) if t < n]
+
+    return list(zip(starts, starts[1:] + [n]))
+
+
+  def seek(self, episode, t):
+    """
+    Restore the environment to a step of an episode, at which the recorded
+    action of the step is about to be taken.
+
+    @param episode The index of the episode.
+    @param t The index of the step.
+    @return The frame of the step.
+    """
+
+    snapshot = self.reader.snapshot(episode, t)
+    if snapshot is None:
+      raise ValueError('no snapshot at or before step %d of episode %d' % (t, episode))
+
+    t_snapshot, state = snapshot
+    RestoreState(self.env, state)
+
+    # note: restoring the emulator state does not redraw the screen, which
+    #       still shows the frame before the restore, so the frame of the
+    #       snapshot step is read from the recording.
+    if t == t_snapshot:
+      return self.reader.step(episode, t)[0]
+
+    actions = self.recorded_actions(episode)
+    for k in range(t_snapshot, t):
+      self.env.step(int(actions[k]))
+
+    return ScreenFrame(self.env)
+
+
+  def replay(self, episode, start=0, stop=None, verify=False):
+    """
+    Replay an episode from a step, restoring the environment with `seek` and
+    then taking the recorded actions.
+
+    @param episode The index of the episode.
+    @param start The step to start from. (default: 0)
+    @param stop The step to stop before. (default: the end of the episode)
+    @param verify The switch to compare the replayed frames against the
+                  recorded frames.
+    @return A generator of tuples `(t, frame, matches)` at each step before
+            its recorded action is taken, where `matches` indicates if the
+            frame equals the recorded frame, or is `None` if not verified.
+            The frame of a snapshot step is the recorded frame, see `seek`.
+            The environment, e.g. its RAM, can be inspected at each step.
+    """
+
+    if stop is None:
+      stop = self.reader.num_steps(episode)
+
+    actions = self.recorded_actions(episode)
+    frame = self.seek(episode, start)
+    for t in range(start, stop):
+      matches = None
+      if verify:
+        matches = bool(np.array_equal(frame, self.reader.step(episode, t)[0]))
+
+      yield (t, frame, matches)
+
+      frame, r, done, info = self.env.step(int(actions[t]))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+"""
+VecEnv.py
+Vectorized environments stepping multiple environment instances in lockstep, 
+either serially or in worker processes with shared-memory frame transport.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+
+def RepeatAction(env, action, frame_skip=1):
+  """
+  Step an environment repeating an action for a number of frames, as is 
+  standard for Atari. The observation is the pixel-wise maximum of the last 
+  two frames, which removes the flickering of sprites drawn every other frame.
+
+  @param env The environment.
+  @param action The action to repeat.
+  @param frame_skip The number of frames to repeat the action for. 
+                    (default: 1)
+  @return A tuple `(frame, r, done, info)` of the max-pooled frame, the sum of 
+          the rewards, whether the episode is done and the info of the last 
+          frame. The repetition stops early if the episode is done.
+  """
+
+  frame_prev = None
+  r = 0
+  for k in range(frame_skip):
+    frame, r_k, done, info = env.step(action)
+    r += r_k
+    if done:
+      break
+    if k == frame_skip - 2:
+      frame_prev = frame
+
+  if frame_prev is not None:
+    frame = np.maximum(frame_prev, frame)
+
+  return (frame, r, done, info)
+
+
+class SerialVecEnv(object):
+  """
+  Vectorized environment stepping a list of environments serially in the 
+  calling process.
+  """
+
+  def __init__(self, envs):
+    """
+    Initialize a serial vectorized environment.
+
+    @param envs The list of environments, all of which shall share the same 
+                action space.
+    """
+
+    super(SerialVecEnv, self).__init__()
+
+    assert(len(envs) > 0)
+
+    self.envs = envs
+    self.num_envs = len(envs)
+    self.action_space = envs[0].action_space
+
+
+  def reset(self, i):
+    """
+    Reset an environment.
+
+    @param i The index of the environment.
+    @return The initial frame of the environment.
+    """
+
+    return self.envs[i].reset()
+
+
+  def get_ram(self, i):
+    """
+    Read the Atari RAM of an environment.
+
+    @param i The index of the environment.
+    @return The RAM of the environment as an array of `uint8`.
+    """
+
+    return self.envs[i].unwrapped.ale.getRAM()
+
+
+  def step(self, actions, frame_skip=1):
+    """
+    Step the environments in lockstep.
+
+    @param actions The list of actions, one per environment. Environments 
+                   whose action is `None` are not stepped.
+    @param frame_skip The number of frames to repeat each action for, see 
+                      `RepeatAction`. (default: 1)
+    @return A tuple `(frames, rewards, dones, infos)` of lists, one entry per 
+            environment, whose entries are `None` for the environments not 
+            stepped.
+    """
+
+    frames = [None] * self.num_envs
+    rewards = [None] * self.num_envs
+    dones = [None] * self.num_envs
+    infos = [None] * self.num_envs
+
+    for i in range(self.num_envs):
+      if actions[i] is None:
+        continue
+      frames[i], rewards[i], dones[i], infos[i] = RepeatAction(self.envs[i], actions[i], frame_skip)
+
+    return (frames, rewards, dones, infos)
+
+
+  def close(self):
+    """
+    Close all the environments.
+    """
+
+    for env in self.envs:
+      env.close()
+
+
+def _EnvWorker(remote, parent_remote, env_fn, shm_name, shape, i_env):
+  """
+  (internal)
+  Worker process owning an environment. Observation frames are written into 
+  the shared memory ring buffer of the environment, and only the ring slot 
+  and the step metadata are sent back over the pipe.
+
+  @param remote The worker end of the pipe.
+  @param parent_remote The main process end of the pipe, closed in the worker.
+  @param env_fn The function constructing the environment.
+  @param shm_name The name of the shared memory block of the ring buffers.
+  @param shape The shape of the ring buffers as `(num_envs, ring_size, 
+               height, width, channels)`.
+  @param i_env The index of the environment.
+  """
+
+  parent_remote.close()
+
+  # note: the worker shares the resource tracker of the main process, which 
+  #       owns and eventually unlinks the shared memory block.
+  shm = shared_memory.SharedMemory(name=shm_name)
+  ring = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)[i_env]
+  env = env_fn()
+
+  slot = 0
+  try:
+    while True:
+      cmd, data = remote.recv()
+      if cmd == 'step':
+        frame, r, done, info = RepeatAction(env, *data)
+        slot = (slot + 1) % len(ring)
+        ring[slot] = frame
+        remote.send((slot, r, done, info))
+      elif cmd == 'reset':
+        frame = env.reset()
+        slot = (slot + 1) % len(ring)
+        ring[slot] = frame
+        remote.send(slot)
+      elif cmd == 'ram':
+        remote.send(env.unwrapped.ale.getRAM())
+      elif cmd == 'action_space':
+        remote.send(env.action_space)
+      elif cmd == 'close':
+        break
+      else:
+        raise ValueError('unknown command: %s' % (cmd))
+  except KeyboardInterrupt:
+    pass
+  finally:
+    env.close()
+    del ring
+    shm.close()
+    remote.close()
+
+
+class SharedMemoryVecEnv(object):
+  """
+  Vectorized environment stepping each environment in its own worker process. 
+  Observation frames are transported through pre-allocated shared memory ring 
+  buffers and returned as zero-copy NumPy views, so that only the step 
+  metadata is pickled.
+
+  A returned frame view stays valid until its environment has been stepped or 
+  reset `ring_size` more times, after which its ring slot is overwritten.
+  """
+
+  def __init__(self, env_fns, frame_shape=(210, 160, 3), ring_size=8):
+    """
+    Initialize a shared memory vectorized environment.
+
+    @param env_fns The list of functions constructing the environments, one 
+                   per worker process.
+    @param frame_shape The shape of the observation frames. (default: 
+                       `(210, 160, 3)`)
+    @param ring_size The number of frame slots in the ring buffer of each 
+                     environment. (default: 8)
+    """
+
+    super(SharedMemoryVecEnv, self).__init__()
+
+    assert(len(env_fns) > 0)
+    assert(ring_size > 1)
+
+    self.num_envs = len(env_fns)
+    self.ring_size = ring_size
+
+    shape = (self.num_envs, ring_size) + tuple(frame_shape)
+    self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    self.frames = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    self.remotes = []
+    self.processes = []
+    for i, env_fn in enumerate(env_fns):
+      remote, worker_remote = mp.Pipe()
+      process = mp.Process(
+        target=_EnvWorker, 
+        args=(worker_remote, remote, env_fn, self.shm.name, shape, i))
+      process.daemon = True
+      process.start()
+      worker_remote.close()
+      self.remotes.append(remote)
+      self.processes.append(process)
+
+    self.remotes[0].send(('action_space', None))
+    self.action_space = self.remotes[0].recv()
+    self.closed = False
+
+
+  def reset(self, i):
+    """
+    Reset an environment.
+
+    @param i The index of the environment.
+    @return The initial frame of the environment as a view into shared memory.
+    """
+
+    self.remotes[i].send(('reset', None))
+    slot = self.remotes[i].recv()
+
+    return self.frames[i, slot]
+
+
+  def get_ram(self, i):
+    """
+    Read the Atari RAM of an environment.
+
+    @param i The index of the environment.
+    @return The RAM of the environment as an array of `uint8`.
+    """
+
+    self.remotes[i].send(('ram', None))
+
+    return self.remotes[i].recv()
+
+
+  def step(self, actions, frame_skip=1):
+    """
+    Step the environments in lockstep, with the worker processes stepping in 
+    parallel. Actions are repeated within the workers, so only the final 
+    frame of each environment crosses the process boundary.
+
+    @param actions The list of actions, one per environment. Environments 
+                   whose action is `None` are not stepped.
+    @param frame_skip The number of frames to repeat each action for, see 
+                      `RepeatAction`. (default: 1)
+    @return A tuple `(frames, rewards, dones, infos)` of lists, one entry per 
+            environment, whose entries are `None` for the environments not 
+            stepped. The frames are views into shared memory.
+    """
+
+    for i in range(self.num_envs):
+      if actions[i] is not None:
+        self.remotes[i].send(('step', (actions[i], frame_skip)))
+
+    frames = [None] * self.num_envs
+    rewards = [None] * self.num_envs
+    dones = [None] * self.num_envs
+    infos = [None] * self.num_envs
+
+    for i in range(self.num_envs):
+      if actions[i] is None:
+        continue
+      slot, rewards[i], dones[i], infos[i] = self.remotes[i].recv()
+      frames[i] = self.frames[i, slot]
+
+    return (frames, rewards, dones, infos)
+
+
+  def close(self):
+    """
+    Close all the environments, stop the worker processes and release the 
+    shared memory.
+    """
+
+    if self.closed:
+      return
+    self.closed = True
+
+    for remote in self.remotes:
+      remote.send(('close', None))
+    for process in self.processes:
+      process.join()
+    for remote in self.remotes:
+      remote.close()
+
+    del self.frames
+    self.shm.close()
+    self.shm.unlink()
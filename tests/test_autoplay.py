@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+test_autoplay.py
+Tests of the plan advancing and the instrumentation counters of the autoplay
+loop.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('gym')
+pytest.importorskip('matplotlib')
+
+from launch_autoplay import AutoAgent
+from utils.Instrumentation import Instrumentation
+from utils.EventLog import EventLogger
+
+
+pddl_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDDL')
+fname_domain = os.path.join(pddl_dir, 'domain.pddl')
+fname_problem = os.path.join(pddl_dir, 'problem_room1.pddl')
+
+
+class ScriptedEnv(object):
+  """
+  Environment ending after a number of steps, with the step count in the RAM.
+  """
+
+  def __init__(self, n_steps):
+    self.n_steps = n_steps
+    self.t = 0
+    self.ale = self
+
+  @property
+  def unwrapped(self):
+    return self
+
+  def getRAM(self):
+    ram = np.zeros(128, dtype=np.uint8)
+    ram[0] = self.t
+    return ram
+
+  def reset(self):
+    self.t = 0
+    return np.zeros((210, 160, 3), dtype=np.uint8)
+
+  def step(self, action):
+    self.t += 1
+    return (np.zeros((210, 160, 3), dtype=np.uint8), 0, self.t >= self.n_steps, {})
+
+
+class ScriptedDecoder(object):
+  """
+  RAM decoder replaying a list of symbolic states, one per step.
+  """
+
+  decodes_ram = True
+
+  def __init__(self):
+    self.states = []
+
+  def decode_state(self, ram):
+    return [','.join(p) for p in self.states[min(ram[0], len(self.states) - 1)]]
+
+
+class IdleAgents(object):
+  """
+  Subtask agents taking no action and recording their feedback.
+  """
+
+  def __init__(self):
+    self.feedbacks = []
+
+  def execute(self, agent_name, s_rl):
+    return 0
+
+  def feedback(self, agent_name, transition):
+    self.feedbacks.append((agent_name, transition[-2], transition[-1]))
+
+
+def make_agent(decoder, agents, instrumentation):
+  return AutoAgent(ScriptedEnv(3), decoder, fname_domain, fname_problem,
+                   decode_cache_size=0, agents=agents,
+                   instrumentation=instrumentation, logger=EventLogger([]))
+
+
+def test_autoplay_repairs_off_plan_transition():
+  decoder = ScriptedDecoder()
+  agents = IdleAgents()
+  instrumentation = Instrumentation()
+  agent = make_agent(decoder, agents, instrumentation)
+  planner = agent.planner
+
+  # find a state off the initial plan that the plan is repaired to
+  plan = agent.findSymbolicPlan(planner.encode_state(planner.predefined_initial_state))
+  planner.build_goal_distance_table()
+  on_plan = set(step[1] for step in plan)
+  s_off = None
+  for s, (cost, k) in sorted(planner.goal_distance_tables[agent.goal_bits].items()):
+    if cost is None or s in on_plan:
+      continue
+    planner.advance(plan, s, replan=False)
+    if planner.last_advance == 'repair':
+      s_off = s
+      break
+  assert s_off is not None
+
+  # decode the initial state, then the off-plan state until the episode ends
+  decoder.states = [planner.decode_state(plan[0][1]), planner.decode_state(s_off)]
+  instrumentation.counters.clear()
+  agent.autoplay(max_episodes=1, ss_errtol=0)
+
+  counters = instrumentation.counters
+  assert counters.get('plan_repairs', 0) >= 1
+  assert counters.get('plan_advances', 0) >= 1
+  assert counters.get('subtask_failures', 0) == 0
+  assert counters.get('decoder_errors', 0) == 0
+  assert all(not done for agent_name, r_rl, done in agents.feedbacks[:-1])
+
+
+def test_autoplay_fails_when_repair_fails():
+  decoder = ScriptedDecoder()
+  agents = IdleAgents()
+  instrumentation = Instrumentation()
+  agent = make_agent(decoder, agents, instrumentation)
+  planner = agent.planner
+
+  # decode a state without the actor, which no operator can repair
+  plan = agent.findSymbolicPlan(planner.encode_state(planner.predefined_initial_state))
+  s_lost = plan[0][1] & ~planner.encode_state(
+    [p for p in planner.decode_state(plan[0][1]) if p[0] == 'actorInRoom'])
+  assert s_lost != plan[0][1]
+
+  decoder.states = [planner.decode_state(plan[0][1]), planner.decode_state(s_lost)]
+  instrumentation.counters.clear()
+  agent.autoplay(max_episodes=1, ss_errtol=0)
+
+  counters = instrumentation.counters
+  assert counters.get('plan_repair_failures', 0) == 1
+  assert counters.get('subtask_failures', 0) == 1
+  assert agents.feedbacks[-1][2]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+test_goal_distance_table.py
+Tests of the goal distance table of the PDDL planner.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+
+from PDDL import PDDLPlanner
+
+
+pddl_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDDL')
+fname_domain = os.path.join(pddl_dir, 'domain.pddl')
+fname_problem = os.path.join(pddl_dir, 'problem_room1.pddl')
+
+
+def unexplored_state(planner, table):
+  """
+  Find a state outside of a goal distance table, by dropping a predicate of 
+  the initial state.
+  """
+
+  for p in sorted(planner.predefined_initial_state):
+    s = planner.encode_state(set(planner.predefined_initial_state) - set([p]))
+    if s not in table:
+      return s
+
+  return None
+
+
+def assert_costs_match_bfs(planner, table, g):
+  for s, (cost, k) in table.items():
+    plan = planner.find_plan(initial_state=s, goals=g, strategy='bfs', encoded=True)
+    if plan is None:
+      assert cost is None
+    else:
+      assert cost == len(plan) - 1
+      assert planner.find_plan(initial_state=s, goals=g, strategy='table', encoded=True) is not None
+
+
+def test_table_costs_match_bfs():
+  planner = PDDLPlanner(fname_domain, fname_problem, plan_cache_size=0)
+  planner.build_goal_distance_table()
+  g = planner.encode_state(planner.predefined_goals)
+
+  assert_costs_match_bfs(planner, planner.goal_distance_tables[g], g)
+
+
+def test_table_extends_from_unexplored_state():
+  planner = PDDLPlanner(fname_domain, fname_problem, plan_cache_size=0)
+  planner.build_goal_distance_table()
+  g = planner.encode_state(planner.predefined_goals)
+  table = planner.goal_distance_tables[g]
+  explored = dict(table)
+
+  s = unexplored_state(planner, table)
+  assert s is not None
+
+  # the table strategy extends the table from the unexplored state only
+  planner.find_plan(initial_state=s, strategy='table', encoded=True)
+  assert s in table
+  assert len(table) > len(explored)
+  for s_explored, entry in explored.items():
+    assert table[s_explored] == entry
+
+  assert_costs_match_bfs(planner, table, g)
+
+  # the extended table covers the same states as a table built at once
+  planner_once = PDDLPlanner(fname_domain, fname_problem, plan_cache_size=0)
+  planner_once.build_goal_distance_table(initial_states=[
+    planner.predefined_initial_state, planner.decode_state(s)])
+  table_once = planner_once.goal_distance_tables[g]
+  assert sorted(table_once) == sorted(table)
+  assert all(table_once[s_once][0] == table[s_once][0] for s_once in table_once)
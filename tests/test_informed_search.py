@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+test_informed_search.py
+Tests of the informed search strategies of the PDDL planner.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import pytest
+
+from PDDL import PDDLPlanner
+
+
+pddl_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDDL')
+fname_domain = os.path.join(pddl_dir, 'domain.pddl')
+fname_problem = os.path.join(pddl_dir, 'problem_room1.pddl')
+
+
+@pytest.fixture(scope='module')
+def reachable_states():
+  planner = PDDLPlanner(fname_domain, fname_problem)
+  planner.build_goal_distance_table()
+  g = planner.encode_state(planner.predefined_goals)
+
+  return sorted(planner.goal_distance_tables[g].keys())
+
+
+@pytest.mark.parametrize('heuristic_cache_size', [0, 65536])
+def test_astar_h_max_finds_shortest_plans(reachable_states, heuristic_cache_size):
+  planner = PDDLPlanner(fname_domain, fname_problem, plan_cache_size=0, 
+                        heuristic_cache_size=heuristic_cache_size)
+
+  # note: every state is planned twice, the second time with a warm 
+  #       heuristic cache if enabled.
+  for s in reachable_states + reachable_states:
+    plan_bfs = planner.find_plan(initial_state=s, strategy='bfs', encoded=True)
+    plan_astar = planner.find_plan(initial_state=s, strategy='astar', 
+                                   heuristic='h_max', encoded=True)
+    if plan_bfs is None:
+      assert plan_astar is None
+    else:
+      assert len(plan_astar) == len(plan_bfs)
+
+
+def test_heuristic_cache_keeps_values(reachable_states):
+  planner = PDDLPlanner(fname_domain, fname_problem, plan_cache_size=0)
+  g = planner.encode_state(planner.predefined_goals)
+  h = planner._MemoizedHeuristic('h_ff', PDDLPlanner._HeuristicFF)
+
+  for s in reachable_states:
+    expected = PDDLPlanner._HeuristicFF(planner.relaxed_operators, s, g)
+    assert h(planner.relaxed_operators, s, g) == expected
+    assert h(planner.relaxed_operators, s, g) == expected
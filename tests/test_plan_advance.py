@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+test_plan_advance.py
+Tests of the incremental plan advancing of the PDDL planner.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import pytest
+
+from PDDL import PDDLPlanner
+
+
+pddl_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDDL')
+fname_domain = os.path.join(pddl_dir, 'domain.pddl')
+fname_problem = os.path.join(pddl_dir, 'problem_room1.pddl')
+
+
+@pytest.fixture(scope='module')
+def planner():
+  return PDDLPlanner(fname_domain, fname_problem)
+
+
+def off_plan_states(planner, plan):
+  """
+  List the reachable states that are not on a plan and can reach the goals.
+  """
+
+  planner.build_goal_distance_table()
+  g = planner.encode_state(planner.predefined_goals)
+  on_plan = set(step[1] for step in plan)
+
+  return sorted(s for s, (cost, k) in planner.goal_distance_tables[g].items() 
+                if cost is not None and s not in on_plan)
+
+
+def assert_valid_plan(planner, plan, s):
+  assert plan[0] == (None, s)
+  for (op_prev, s_prev), (op, s_next) in zip(plan[:-1], plan[1:]):
+    assert s_prev & op.pre_pos == op.pre_pos
+    assert s_prev & op.pre_neg == 0
+    assert s_next == (s_prev & ~op.eff_neg) | op.eff_pos
+
+  g = planner.encode_state(planner.predefined_goals)
+  assert plan[-1][1] & g == g
+
+
+def test_advance_reuses_plan_suffix(planner):
+  plan = planner.find_plan(encoded=True)
+
+  advanced = planner.advance(plan, plan[1][1])
+  assert planner.last_advance == 'reuse'
+  assert advanced == [(None, plan[1][1])] + plan[2:]
+
+
+def test_advance_repairs_off_plan_state(planner):
+  plan = planner.find_plan(encoded=True)
+
+  outcomes = set()
+  for s in off_plan_states(planner, plan):
+    advanced = planner.advance(plan, s)
+    outcomes.add(planner.last_advance)
+    assert_valid_plan(planner, advanced, s)
+
+  assert 'repair' in outcomes
+
+
+def test_advance_replans_when_repair_fails(planner):
+  plan = planner.find_plan(encoded=True)
+  s = off_plan_states(planner, plan)[0]
+
+  advanced = planner.advance(plan, s, max_repair_expansions=0)
+  assert planner.last_advance == 'replan'
+  assert_valid_plan(planner, advanced, s)
+
+  planner.advance(None, s)
+  assert planner.last_advance == 'replan'
+
+
+def test_advance_fails_without_replanning(planner):
+  plan = planner.find_plan(encoded=True)
+  s = off_plan_states(planner, plan)[0]
+
+  assert planner.advance(plan, s, max_repair_expansions=0, replan=False) is None
+  assert planner.last_advance == 'fail'
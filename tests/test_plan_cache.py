@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+test_plan_cache.py
+Tests of the plan cache of the PDDL planner.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import numpy as np
+import pytest
+
+from PDDL import PDDLPlanner
+
+
+pddl_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PDDL')
+fname_domain = os.path.join(pddl_dir, 'domain.pddl')
+fname_problem = os.path.join(pddl_dir, 'problem_room1.pddl')
+
+
+@pytest.fixture(scope='module')
+def planner():
+  return PDDLPlanner(fname_domain, fname_problem)
+
+
+@pytest.mark.parametrize('encoded', [False, True])
+def test_mutating_returned_plan_keeps_cache_intact(planner, encoded):
+  planner.plan_cache.clear()
+
+  # the first lookup misses the cache and the second one hits it
+  plan_miss = planner.find_plan(encoded=encoded)
+  expected = list(plan_miss)
+  plan_miss.pop()
+  plan_miss.append((None, None))
+
+  plan_hit = planner.find_plan(encoded=encoded)
+  assert plan_hit == expected
+
+  plan_hit.clear()
+  assert planner.find_plan(encoded=encoded) == expected
+
+
+def test_cached_suffix_matches_plan(planner):
+  planner.plan_cache.clear()
+
+  plan = planner.find_plan(encoded=True)
+  assert len(plan) > 2
+
+  # a later state on the plan hits the cached suffix
+  suffix = planner.find_plan(initial_state=plan[1][1], encoded=True)
+  assert suffix == [(None, plan[1][1])] + plan[2:]
+
+
+@pytest.mark.parametrize('corruption', ['truncated', 'garbage', 'missing_key'])
+def test_corrupt_grounded_task_cache_is_regrounded(tmp_path, corruption):
+  cache_dir = str(tmp_path)
+  plan = PDDLPlanner(fname_domain, fname_problem, cache_dir=cache_dir).find_plan()
+  expected = [(op.key if op is not None else None, s) for op, s in plan]
+
+  fnames = [os.path.join(cache_dir, fname) for fname in os.listdir(cache_dir)]
+  assert len(fnames) == 1
+  with open(fnames[0], 'rb') as f:
+    content = f.read()
+
+  if corruption == 'truncated':
+    content = content[:len(content) // 2]
+  elif corruption == 'garbage':
+    content = b'\0' * len(content)
+  else:
+    with np.load(fnames[0]) as data:
+      arrays = dict((key, data[key]) for key in data.files if key != 'operator_masks')
+    with open(fnames[0], 'wb') as f:
+      np.savez(f, **arrays)
+    with open(fnames[0], 'rb') as f:
+      content = f.read()
+  with open(fnames[0], 'wb') as f:
+    f.write(content)
+
+  plan = PDDLPlanner(fname_domain, fname_problem, cache_dir=cache_dir).find_plan()
+  assert [(op.key if op is not None else None, s) for op, s in plan] == expected
+
+  # the grounded task is cached again
+  assert PDDLPlanner(fname_domain, fname_problem, cache_dir=cache_dir)._LoadGroundedTask(fnames[0])
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+test_ram_state_decoder.py
+Tests of the calibration of the RAM state decoder.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import os
+import numpy as np
+import pytest
+
+from utils import RAMStateDecoder as RAM
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# note: the annotated states are real RAM states of room 1 along two runs that
+#       take the key and open either door, with the symbolic states annotated
+#       by hand from the frames, not decoded from them.
+fname_samples = os.path.join(root_dir, 'tests', 'data', 'ram_states_room1.npz')
+
+# minimum fraction of the held-out annotated states decoded exactly, and of 
+# each predicate decoded correctly
+min_agreement = 0.85
+min_predicate_agreement = 0.95
+
+# ground truth of the synthetic samples
+true_spots = {
+  'room_1': [
+    ('chain_1',    100, 110, 170, 200),
+    ('entrance_1',   2,  10, 230, 250),
+    ('ladder_1',    72,  80, 230, 250)
+  ]
+}
+
+true_flags = [
+  ('actorWithKey',             None,     RAM.ram_inventory_index,    0x10, True),
+  ('keyExists,room_1,key_1',   'room_1', RAM.ram_room_objects_index, 0x04, False)
+]
+
+
+def synthetic_samples(n, seed):
+  """
+  Generate random RAM states and label them with the ground truth decoder.
+  """
+
+  rng = np.random.RandomState(seed)
+  rams = rng.randint(0, 256, size=(n, 128)).astype(np.uint8)
+  rams[:, RAM.ram_room_index] = 1
+
+  # place the actor uniformly within the spots
+  boxes = true_spots['room_1']
+  for i, k in enumerate(rng.randint(0, len(boxes), size=n)):
+    spot, x_min, x_max, y_min, y_max = boxes[k]
+    rams[i, RAM.ram_actor_x_index] = rng.randint(x_min, x_max + 1)
+    rams[i, RAM.ram_actor_y_index] = rng.randint(y_min, y_max + 1)
+
+  decoder = RAM.RAMStateDecoder(spots=true_spots, flags=true_flags)
+  labels = [set(predicate_strs) for predicate_strs in decoder.decode_states(rams)]
+
+  return (rams, labels)
+
+
+def test_calibration_recovers_synthetic_decoder():
+  rams, labels = synthetic_samples(4000, 0)
+
+  spots = RAM.CalibrateSpots(rams, labels)
+  flags, agreements = RAM.CalibrateFlags(rams, labels, [flag[0] for flag in true_flags])
+  assert spots == true_spots
+  assert flags == true_flags
+  assert all(agreement == 1.0 for agreement in agreements.values())
+
+  rams_test, labels_test = synthetic_samples(1000, 1)
+  decoder = RAM.RAMStateDecoder(spots=spots, flags=flags)
+  assert RAM.DecoderAgreement(decoder, rams_test, labels_test)['agreement'] == 1.0
+
+
+def test_agreement_counts_decoder_predicates_only():
+  rams, labels = synthetic_samples(100, 2)
+  decoder = RAM.RAMStateDecoder(spots=true_spots, flags=true_flags)
+
+  # predicates the decoder cannot produce are ignored
+  labels = [label | set(['monsterExists,room_2,skull_2']) for label in labels]
+  assert RAM.DecoderAgreement(decoder, rams, labels)['agreement'] == 1.0
+
+  # a flipped flag is a disagreement
+  labels[0] ^= set(['actorWithKey'])
+  agreement = RAM.DecoderAgreement(decoder, rams, labels)
+  assert agreement['agreement'] == 0.99
+  assert agreement['predicates']['actorWithKey'] == 0.99
+
+
+def test_decoder_requires_calibration():
+  with pytest.raises(ValueError):
+    RAM.RAMStateDecoder(spots=None, flags=true_flags)
+  with pytest.raises(ValueError):
+    RAM.RAMStateDecoder(spots=true_spots, flags=None)
+
+
+def test_calibration_round_trip(tmp_path):
+  fname = str(tmp_path / 'ram_calibration.json')
+  RAM.SaveCalibration(fname, true_spots, true_flags)
+  spots, flags, rooms = RAM.LoadCalibration(fname)
+  assert spots == true_spots
+  assert flags == true_flags
+  assert rooms == RAM.default_rooms
+
+
+def test_calibrated_decoder_agrees_with_annotated_states():
+  import launch_ram_calibration
+
+  rams, labels = launch_ram_calibration.load_samples(fname_samples)
+  assert rams.shape == (312, 128)
+
+  # fit on half of the annotated states and evaluate on the other half
+  spots, flags = launch_ram_calibration.calibrate(rams[0::2], labels[0::2])
+  assert flags == [
+    ('actorWithKey',              None,     RAM.ram_inventory_index,    0x02, True),
+    ('keyExists,room_1,key_1',    'room_1', RAM.ram_room_objects_index, 0x01, True),
+    ('doorExists,room_1,door_1',  'room_1', RAM.ram_room_objects_index, 0x08, True),
+    ('doorExists,room_1,door_2',  'room_1', RAM.ram_room_objects_index, 0x04, True)
+  ]
+
+  agreement = RAM.DecoderAgreement(RAM.RAMStateDecoder(spots, flags), rams[1::2], labels[1::2])
+  assert agreement['agreement'] >= min_agreement
+  assert all(accuracy >= min_predicate_agreement for accuracy in agreement['predicates'].values())
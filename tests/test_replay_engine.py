@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+"""
+test_replay_engine.py
+Tests of the deterministic replay of recorded episodes.
+"""
+
+__version__     = "0.0.1"
+__author__      = "David Qiu"
+__email__       = "dq@cs.cmu.edu"
+__website__     = "http://www.davidqiu.com/"
+__copyright__   = "Copyright (C) 2018, David Qiu. All rights reserved."
+
+
+import pickle
+import numpy as np
+import pytest
+
+from utils.EpisodeRecorder import EpisodeRecorder, EpisodeReader
+from utils.ReplayEngine import ReplayEngine, CloneState, RestoreState
+
+
+class FakeALE(object):
+  """
+  Emulator of `FakeAtariEnv`, whose state includes the random number 
+  generator of the sticky actions, as in the Arcade Learning Environment.
+  """
+
+  def __init__(self):
+    super(FakeALE, self).__init__()
+
+    self.state = np.array([80, 100, 0, 12345, 0], dtype=np.int64) # x, y, frame, seed, action
+
+  def act(self, a):
+    x, y, t, seed, a_prev = self.state
+
+    # repeat the previous action with a quarter probability
+    seed = (seed * 1103515245 + 12345) % (1 << 31)
+    if seed % 4 == 0:
+      a = a_prev
+
+    self.state[:] = [(x + a % 3 - 1) % 160, (y + a % 5 - 2) % 210, t + 1, seed, a]
+
+  def getScreenRGB(self):
+    x, y, t = self.state[:3]
+    frame = np.zeros((210, 160, 3), dtype=np.uint8)
+    frame[0, :, 0] = t % 256
+    frame[y, x] = (200, 72, 72)
+    return frame
+
+  def getRAM(self):
+    return self.state.astype(np.uint8)
+
+
+class FakeAtariEnv(object):
+  """
+  Atari environment skipping 2 to 4 frames per step at random, drawn from 
+  the random number generator of the environment as in the `-v0` and `-v4` 
+  environments.
+  """
+
+  def __init__(self, np_random):
+    super(FakeAtariEnv, self).__init__()
+
+    self.unwrapped = self
+    self.np_random = np_random
+    self.ale = FakeALE()
+
+  def step(self, a):
+    if isinstance(self.np_random, np.random.RandomState):
+      n = self.np_random.randint(2, 5)
+    else:
+      n = self.np_random.integers(2, 5)
+    for k in range(n):
+      self.ale.act(a)
+    return (self.ale.getScreenRGB(), 0.0, False, {'ale.lives': 5})
+
+  def clone_full_state(self):
+    return np.frombuffer(self.ale.state.tobytes(), dtype=np.uint8).copy()
+
+  def restore_full_state(self, state):
+    self.ale.state[:] = np.frombuffer(np.asarray(state, dtype=np.uint8).tobytes(), dtype=np.int64)
+
+
+class ALEAtariEnv(object):
+  """
+  Atari environment of the Arcade Learning Environment with sticky actions, 
+  skipping a fixed number of frames per step, whose emulator state is cloned 
+  the way the gym Atari environments do.
+  """
+
+  def __init__(self, seed, game='montezuma_revenge', frame_skip=4):
+    super(ALEAtariEnv, self).__init__()
+
+    from ale_py import ALEInterface, LoggerMode, roms
+
+    ALEInterface.setLoggerMode(LoggerMode.Error)
+    self.unwrapped = self
+    self.np_random = None
+    self.frame_skip = frame_skip
+    self.ale = ALEInterface()
+    self.ale.setInt('random_seed', seed)
+    self.ale.setFloat('repeat_action_probability', 0.25)
+    self.ale.loadROM(roms.get_rom_path(game))
+    self.action_set = self.ale.getMinimalActionSet()
+
+  def step(self, a):
+    r = sum(self.ale.act(self.action_set[a]) for k in range(self.frame_skip))
+    return (self.ale.getScreenRGB(), float(r), self.ale.game_over(), {'ale.lives': self.ale.lives()})
+
+  def clone_full_state(self):
+    return np.frombuffer(pickle.dumps(self.ale.cloneState(include_rng=True)), dtype=np.uint8).copy()
+
+  def restore_full_state(self, state):
+    self.ale.restoreState(pickle.loads(np.asarray(state, dtype=np.uint8).tobytes()))
+
+
+def make_rng(rng_type, seed):
+  if rng_type == 'RandomState':
+    return np.random.RandomState(seed)
+  return np.random.default_rng(seed)
+
+
+def record_episodes(record_dir, rng_type, clone=CloneState, n_episodes=2, n_steps=150, 
+                    make_env=None):
+  """
+  Record random play the way the manual launchers do, snapshotting the 
+  environment before the action of the step.
+  """
+
+  if make_env is None:
+    make_env = lambda episode: FakeAtariEnv(make_rng(rng_type, episode))
+
+  actions = np.random.RandomState(0)
+  recorder = EpisodeRecorder(record_dir, chunk_size=64, snapshot_interval=20)
+  for episode in range(n_episodes):
+    env = make_env(episode)
+    recorder.begin_episode({'env_id': 'FakeAtari'})
+    s = env.ale.getScreenRGB()
+    for t in range(n_steps):
+      snapshot = clone(env) if recorder.snapshot_due() else None
+      a = actions.randint(18)
+      s_next, r, done, info = env.step(a)
+      recorder.record(s, a, r, info['ale.lives'], snapshot=snapshot)
+      s = s_next
+  recorder.close()
+
+
+@pytest.mark.parametrize('rng_type', ['RandomState', 'Generator'])
+def test_replay_from_snapshots_is_bit_identical(tmp_path, rng_type):
+  record_dir = str(tmp_path)
+  record_episodes(record_dir, rng_type)
+
+  # note: the replaying environment starts from an unrelated random state.
+  reader = EpisodeReader(record_dir)
+  engine = ReplayEngine(FakeAtariEnv(make_rng(rng_type, 99)), record_dir)
+  for episode in reader.episodes():
+    segments = engine.segments(episode)
+    assert len(segments) > 1
+
+    # replay the segments out of order, each from its own snapshot
+    for start, stop in reversed(segments):
+      for t, frame, matches in engine.replay(episode, start, stop):
+        assert np.array_equal(frame, reader.step(episode, t)[0])
+
+    # seek to steps between the snapshots
+    for t in [1, 19, 21, 77, reader.num_steps(episode) - 1]:
+      assert np.array_equal(engine.seek(episode, t), reader.step(episode, t)[0])
+
+
+def test_snapshot_restores_random_state_in_place():
+  np_random = np.random.RandomState(3)
+  env = FakeAtariEnv(np_random)
+  snapshot = CloneState(env)
+  frames = [env.step(1)[0] for k in range(10)]
+
+  RestoreState(env, snapshot)
+  assert env.np_random is np_random
+  assert all(np.array_equal(env.step(1)[0], frame) for frame in frames)
+
+
+def test_emulator_only_snapshots_diverge(tmp_path):
+  record_dir = str(tmp_path)
+  record_episodes(record_dir, 'RandomState', 
+                  clone=lambda env: env.unwrapped.clone_full_state(), n_episodes=1)
+
+  # the frame skips are drawn from a different random state than recorded
+  reader = EpisodeReader(record_dir)
+  engine = ReplayEngine(FakeAtariEnv(make_rng('RandomState', 99)), record_dir)
+  start, stop = engine.segments(0)[0]
+  assert not all(matches for t, frame, matches in engine.replay(0, start, stop, verify=True))
+
+
+def test_seek_to_snapshot_returns_real_emulator_frame(tmp_path):
+  pytest.importorskip('ale_py')
+
+  record_dir = str(tmp_path)
+  record_episodes(record_dir, None, n_episodes=1, n_steps=100, 
+                  make_env=lambda episode: ALEAtariEnv(episode))
+
+  # note: restoring the emulator state does not redraw the screen of the 
+  #       Arcade Learning Environment, so seeking to a snapshot step right 
+  #       after playing elsewhere would show the frame of the previous step.
+  reader = EpisodeReader(record_dir)
+  engine = ReplayEngine(ALEAtariEnv(99), record_dir)
+  frames = [reader.step(0, t)[0] for t in [0, 40, 80]]
+  assert not np.array_equal(frames[0], frames[1])
+  assert not np.array_equal(frames[1], frames[2])
+  for t in [80, 0, 40, 99, 80]:
+    assert np.array_equal(engine.seek(0, t), reader.step(0, t)[0])
+
+  for start, stop in reversed(engine.segments(0)):
+    assert all(matches for t, frame, matches in engine.replay(0, start, stop, verify=True))